@@ -1,223 +1,126 @@
 from config import Config
 import logging
 from datetime import datetime, timedelta
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
-from twilio.rest import Client
 from db_handler import DatabaseHandler
+from alert_rules import RuleEngine, load_rules
+from notifications import NotificationOutbox
 
 class AlertManager:
-    def __init__(self):
+    def __init__(self, dispatcher=None):
         self.logger = logging.getLogger('IoTsync.alerts')
-        self.last_alert_time = None
+        # Per device, so one stale device does not silence the others
+        self.last_stale_alert = {}
         self.alert_interval = timedelta(minutes=Config.ALERT_INTERVAL)
-        self.min_pool_temp_f = Config.ALERT_MIN_POOL_TEMP_F
-        self.alert_active = False
-        self.stale_data_alert_active = False
-        self.max_data_age = timedelta(hours=8)
+        self.max_data_age = timedelta(seconds=Config.STALE_DATA_MAX_AGE)
         
-        # Email configuration
-        self.sendgrid_api_key = Config.SENDGRID_API_KEY
-        self.from_email = Config.SENDGRID_FROM_EMAIL
+        # Recipients
         self.alert_recipient = Config.ALERT_EMAIL
-        
-        # SMS configuration
-        self.twilio_account_sid = Config.TWILIO_ACCOUNT_SID
-        self.twilio_auth_token = Config.TWILIO_AUTH_TOKEN
-        self.twilio_from_number = Config.TWILIO_FROM_NUMBER
         self.alert_phone_number = Config.ALERT_PHONE_NUMBER
         
         # Database handler
         self.db_handler = DatabaseHandler()
         
-        if not all([self.sendgrid_api_key, self.from_email]):
-            self.logger.warning("SendGrid credentials not configured. Email alerts will be logged only.")
-        if not all([self.twilio_account_sid, self.twilio_auth_token, self.twilio_from_number]):
-            self.logger.warning("Twilio credentials not configured. SMS alerts will be logged only.")
+        # Notifications are queued here and delivered by the dispatcher thread
+        self.dispatcher = dispatcher
+        self.outbox = dispatcher.outbox if dispatcher else NotificationOutbox()
+        
+        # Threshold/rate rules over every channel, compiled once
+        self.rules = load_rules()
+        self.rule_engine = RuleEngine(self.rules)
     
-    def should_send_alert(self):
-        """Check if enough time has passed since the last alert."""
-        if not self.last_alert_time:
+    def should_send_alert(self, device_id):
+        """Check if enough time has passed since the last stale-data alert for device_id."""
+        last_alert_time = self.last_stale_alert.get(device_id)
+        if not last_alert_time:
             return True
-        return datetime.now() - self.last_alert_time >= self.alert_interval
+        return datetime.now() - last_alert_time >= self.alert_interval
     
-    def send_email(self, subject, body):
-        """Send an email alert using SendGrid."""
-        email_sent = False
-        if not all([self.sendgrid_api_key, self.from_email]):
-            self.logger.info(f"Would send email: {subject}\n{body}")
-            return email_sent
-            
+    def queue_notifications(self, subject, body, dedupe_key=None, alert_id=None):
+        """Queue the email and SMS for an alert; True once both are in the outbox."""
         try:
-            message = Mail(
-                from_email=Email(self.from_email),
-                to_emails=To(self.alert_recipient),
-                subject=subject,
-                plain_text_content=Content("text/plain", body)
-            )
-            
-            sg = SendGridAPIClient(self.sendgrid_api_key)
-            response = sg.send(message)
-            
-            if response.status_code in (200, 201, 202):
-                self.logger.info(f"Alert email sent: {subject}")
-                self.last_alert_time = datetime.now()
-                email_sent = True
-            else:
-                self.logger.error(f"SendGrid API returned status code: {response.status_code}")
-            
+            self.outbox.enqueue('email', self.alert_recipient, subject, body, dedupe_key, alert_id)
+            self.outbox.enqueue('sms', self.alert_phone_number, None, body, dedupe_key, alert_id)
         except Exception as e:
-            self.logger.error(f"Failed to send alert email: {e}", exc_info=True)
-        
-        return email_sent
+            self.logger.error(f"Failed to queue alert notifications: {e}", exc_info=True)
+            return False
+        if self.dispatcher:
+            self.dispatcher.wake()
+        return True
     
-    def send_sms(self, body):
-        """Send an SMS alert using Twilio."""
-        sms_sent = False
-        if not all([self.twilio_account_sid, self.twilio_auth_token, self.twilio_from_number]):
-            self.logger.info(f"Would send SMS: {body}")
-            return sms_sent
-            
+    def raise_alert(self, alert_type, subject, body, temperature_f=None, threshold_f=None, dedupe_key=None):
+        """Log an alert and queue its notifications.
+        
+        The email_sent/sms_sent flags start out false and are set by the
+        dispatcher once a provider has actually delivered the message.
+        """
+        alert_id = None
         try:
-            client = Client(self.twilio_account_sid, self.twilio_auth_token)
-            message = client.messages.create(
-                body=body,
-                from_=self.twilio_from_number,
-                to=self.alert_phone_number
+            alert_id = self.db_handler.log_alert(
+                alert_type=alert_type,
+                temperature_f=temperature_f,
+                threshold_f=threshold_f,
+                email_sent=False,
+                sms_sent=False,
+                email_recipient=self.alert_recipient,
+                phone_recipient=self.alert_phone_number,
+                message=body
             )
-            
-            if message.sid:
-                self.logger.info("Alert SMS sent")
-                sms_sent = True
-            
         except Exception as e:
-            self.logger.error(f"Failed to send alert SMS: {e}", exc_info=True)
-        
-        return sms_sent
+            self.logger.error(f"Failed to log {alert_type} alert: {e}", exc_info=True)
+        return self.queue_notifications(subject, body, dedupe_key, alert_id)
     
-    def check_data_staleness(self):
-        """Check if data hasn't been updated in the last 8 hours."""
-        try:
-            latest_reading = self.db_handler.get_latest_reading()
-            if not latest_reading:
-                return
-            
-            last_update_time = latest_reading.get('timestamp')
-            if not last_update_time:
-                return
-                
-            time_since_update = datetime.now() - last_update_time
-            
-            if time_since_update >= self.max_data_age:
-                if not self.stale_data_alert_active and self.should_send_alert():
-                    subject = "IoT Sync Data Alert"
-                    body = (f"No data updates received in the last 8 hours!\n"
-                           f"Last update time: {last_update_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                           f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                    
-                    email_sent = self.send_email(subject, body)
-                    sms_sent = self.send_sms(body)
-                    
-                    if email_sent or sms_sent:
-                        self.last_alert_time = datetime.now()
-                        self.stale_data_alert_active = True
-                    
-                    # Log alert to database
-                    self.db_handler.log_alert(
-                        alert_type='stale_data',
-                        temperature_f=None,
-                        threshold_f=None,
-                        email_sent=email_sent,
-                        sms_sent=sms_sent,
-                        email_recipient=self.alert_recipient,
-                        phone_recipient=self.alert_phone_number,
-                        message=body
-                    )
-            elif self.stale_data_alert_active:
-                # Data updates have resumed
-                subject = "IoT Sync Data Restored"
-                body = (f"Data updates have resumed.\n"
-                       f"Latest update time: {last_update_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                       f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                email_sent = self.send_email(subject, body)
-                sms_sent = self.send_sms(body)
-                
-                if email_sent or sms_sent:
-                    self.stale_data_alert_active = False
-                    
-                    # Log resolution to database
-                    self.db_handler.log_alert(
-                        alert_type='stale_data_resolved',
-                        temperature_f=None,
-                        threshold_f=None,
-                        email_sent=email_sent,
-                        sms_sent=sms_sent,
-                        email_recipient=self.alert_recipient,
-                        phone_recipient=self.alert_phone_number,
-                        message=body
-                    )
-        except Exception as e:
-            self.logger.error(f"Failed to check data staleness: {e}", exc_info=True)
-
-    def check_temperature(self, pool_temp_f):
-        """Check pool temperature and send alerts if needed."""
-        # First check for stale data
-        self.check_data_staleness()
+    def data_stale(self, device_id, last_seen):
+        """Watchdog callback: no reading stored for device_id within max_data_age."""
+        if not self.should_send_alert(device_id):
+            return False
+        last_update = (datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')
+                       if last_seen is not None else 'never')
+        hours = self.max_data_age.total_seconds() / 3600
+        subject = "IoT Sync Data Alert"
+        body = (f"No data updates received in the last {hours:g} hours!\n"
+               f"Device: {device_id}\n"
+               f"Last update time: {last_update}\n"
+               f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        if pool_temp_f is None:
-            self.logger.warning("Pool temperature reading is None")
-            return
-            
-        if pool_temp_f < self.min_pool_temp_f:
-            if not self.alert_active and self.should_send_alert():
-                subject = "Pool Temperature Alert"
-                body = (f"Pool temperature is below minimum threshold!\n"
-                       f"Current temperature: {pool_temp_f}°F\n"
-                       f"Minimum threshold: {self.min_pool_temp_f}°F\n"
-                       f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                email_sent = self.send_email(subject, body)
-                sms_sent = self.send_sms(body)
-                
-                if email_sent or sms_sent:
-                    self.last_alert_time = datetime.now()
-                    self.alert_active = True
-                
-                # Log alert to database
-                self.db_handler.log_alert(
-                    alert_type='triggered',
-                    temperature_f=pool_temp_f,
-                    threshold_f=self.min_pool_temp_f,
-                    email_sent=email_sent,
-                    sms_sent=sms_sent,
-                    email_recipient=self.alert_recipient,
-                    phone_recipient=self.alert_phone_number,
-                    message=body
-                )
-                
-        elif self.alert_active:
-            # Temperature has returned to normal
-            subject = "Pool Temperature Restored"
-            body = (f"Pool temperature has returned to normal.\n"
-                   f"Current temperature: {pool_temp_f}°F\n"
-                   f"Minimum threshold: {self.min_pool_temp_f}°F\n"
-                   f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            email_sent = self.send_email(subject, body)
-            sms_sent = self.send_sms(body)
-            
-            if email_sent or sms_sent:
-                self.alert_active = False
-                
-                # Log resolution to database
-                self.db_handler.log_alert(
-                    alert_type='resolved',
-                    temperature_f=pool_temp_f,
-                    threshold_f=self.min_pool_temp_f,
-                    email_sent=email_sent,
-                    sms_sent=sms_sent,
-                    email_recipient=self.alert_recipient,
-                    phone_recipient=self.alert_phone_number,
-                    message=body
-                ) 
\ No newline at end of file
+        if self.raise_alert('stale_data', subject, body, dedupe_key=f"stale_data:{device_id}:triggered"):
+            self.last_stale_alert[device_id] = datetime.now()
+            return True
+        return False
+
+    def data_restored(self, device_id, last_seen):
+        """Watchdog callback: readings for a stale device have resumed."""
+        subject = "IoT Sync Data Restored"
+        body = (f"Data updates have resumed.\n"
+               f"Device: {device_id}\n"
+               f"Latest update time: {datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')}\n"
+               f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        return self.raise_alert('stale_data_resolved', subject, body, dedupe_key=f"stale_data:{device_id}:resolved")
+
+    def format_event(self, event):
+        """Subject and body for a rule that triggered or resolved."""
+        rule = event.rule
+        suffix = '/min' if rule.kind == 'rate' else ''
+        what = f"{rule.label} rate of change" if rule.kind == 'rate' else rule.label
+        if event.kind == 'triggered':
+            subject = f"{rule.label} Alert"
+            first_line = f"{what} is {'below' if rule.op == '<' else 'above'} threshold!"
+        else:
+            subject = f"{rule.label} Restored"
+            first_line = f"{what} has returned to normal."
+        body = (f"{first_line}\n"
+               f"Device: {event.device_id}\n"
+               f"Current value: {event.value:.1f}{rule.units}{suffix}\n"
+               f"Threshold: {rule.threshold}{rule.units}{suffix}\n"
+               f"Time: {datetime.fromtimestamp(event.ts).strftime('%Y-%m-%d %H:%M:%S')}")
+        return subject, body
+
+    def evaluate_batch(self, readings):
+        """Check alert rules for (device_id, ts_seconds, values) readings and notify."""
+        for event in self.rule_engine.evaluate_batch(readings):
+            subject, body = self.format_event(event)
+            self.logger.info(f"Rule {event.rule.name} {event.kind} for {event.device_id} at {event.value}")
+            self.raise_alert(
+                event.kind, subject, body, event.value, event.rule.threshold,
+                # Per kind, so a pending "triggered" is never replaced by its "resolved"
+                dedupe_key=f"{event.rule.name}:{event.device_id}:{event.kind}"
+            )
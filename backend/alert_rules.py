@@ -0,0 +1,206 @@
+import json
+import logging
+import threading
+import numpy as np
+from config import Config
+
+# Numeric sensor_readings columns a rule can watch
+READING_CHANNELS = [
+    'indoor_temp_c', 'indoor_temp_f',
+    'pool_temp_c', 'pool_temp_f',
+    'indoor_humidity',
+    'outdoor_ch1_temp_c', 'outdoor_ch1_temp_f', 'outdoor_ch1_humidity',
+    'outdoor_ch2_temp_c', 'outdoor_ch2_temp_f', 'outdoor_ch2_humidity',
+    'outdoor_ch3_temp_c', 'outdoor_ch3_temp_f', 'outdoor_ch3_humidity',
+    'atmospheric_pressure',
+]
+
+RULE_KINDS = ('threshold', 'rate')
+RULE_OPS = ('<', '>')
+
+class AlertRule:
+    """One declarative alert condition.
+
+    A 'threshold' rule compares the channel value, a 'rate' rule its change
+    per minute since the device's previous reading. The rule triggers once
+    the comparison has held for `for_seconds`, resolves once the value is
+    back past the threshold by `hysteresis`, and does not trigger again
+    within `min_interval` seconds of the last trigger.
+    """
+
+    def __init__(self, name, channel, op, threshold, kind='threshold', hysteresis=0.0,
+                 for_seconds=0, min_interval=None, devices=None, label=None, units=''):
+        if channel not in READING_CHANNELS:
+            raise ValueError(f"Rule {name}: unknown channel {channel!r}")
+        if op not in RULE_OPS:
+            raise ValueError(f"Rule {name}: op must be one of {RULE_OPS}")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Rule {name}: kind must be one of {RULE_KINDS}")
+        self.name = name
+        self.channel = channel
+        self.op = op
+        self.threshold = float(threshold)
+        self.kind = kind
+        self.hysteresis = float(hysteresis)
+        self.for_seconds = float(for_seconds)
+        self.min_interval = float(Config.ALERT_INTERVAL * 60 if min_interval is None else min_interval)
+        self.devices = set(devices) if devices else None
+        self.label = label or name
+        self.units = units
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(**entry)
+
+    def __repr__(self):
+        return f"AlertRule({self.name!r}, {self.channel} {self.op} {self.threshold})"
+
+class AlertEvent:
+    """A rule changing state for one device."""
+
+    def __init__(self, rule, device_id, kind, value, ts):
+        self.rule = rule
+        self.device_id = device_id
+        self.kind = kind  # 'triggered' or 'resolved'
+        self.value = value
+        self.ts = ts
+
+    def __repr__(self):
+        return f"AlertEvent({self.rule.name!r}, {self.device_id!r}, {self.kind}, {self.value})"
+
+def default_rules():
+    """The original pool temperature alert, for setups without a rules file."""
+    return [AlertRule(
+        'pool_temp_low', 'pool_temp_f', '<', Config.ALERT_MIN_POOL_TEMP_F,
+        devices=[Config.DEFAULT_DEVICE_ID], label='Pool Temperature', units='°F'
+    )]
+
+def load_rules(path=None):
+    """Load rules from the JSON list at Config.ALERT_RULES_FILE, if it exists.
+
+        [{"name": "pool_cold", "channel": "pool_temp_f", "op": "<",
+          "threshold": 101, "hysteresis": 0.5, "for_seconds": 600}]
+    """
+    path = path or Config.ALERT_RULES_FILE
+    if not path.exists():
+        return default_rules()
+    with open(path) as f:
+        rules = [AlertRule.from_dict(entry) for entry in json.load(f)]
+    logging.getLogger('IoTsync.alerts').info(f"Loaded {len(rules)} alert rules from {path}")
+    return rules
+
+class RuleEngine:
+    """Evaluate every rule against a batch of readings in one numpy pass.
+
+    Rules are compiled once into parallel arrays (channel index, direction,
+    threshold, ...). A batch becomes a devices x channels value matrix, and
+    per-(device, rule) state (active, breach start, last trigger) lives in
+    devices x rules arrays, so the cost per batch is a handful of array
+    operations regardless of how many devices or rules there are.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.channel_index = np.array([READING_CHANNELS.index(r.channel) for r in self.rules], dtype=np.intp)
+        self.direction = np.array([1.0 if r.op == '>' else -1.0 for r in self.rules])
+        self.threshold = np.array([r.threshold for r in self.rules])
+        self.hysteresis = np.array([r.hysteresis for r in self.rules])
+        self.for_seconds = np.array([r.for_seconds for r in self.rules])
+        self.min_interval = np.array([r.min_interval for r in self.rules])
+        self.is_rate = np.array([r.kind == 'rate' for r in self.rules], dtype=bool)
+
+        n_rules, n_channels = len(self.rules), len(READING_CHANNELS)
+        self.device_rows = {}
+        self.applies = np.zeros((0, n_rules), dtype=bool)
+        self.active = np.zeros((0, n_rules), dtype=bool)
+        self.breach_since = np.zeros((0, n_rules))
+        self.last_fired = np.zeros((0, n_rules))
+        self.prev_values = np.zeros((0, n_channels))
+        self.prev_ts = np.zeros((0, n_channels))
+        self._lock = threading.Lock()
+
+    def _row(self, device_id):
+        row = self.device_rows.get(device_id)
+        if row is None:
+            row = self.device_rows[device_id] = len(self.device_rows)
+            n_rules, n_channels = len(self.rules), len(READING_CHANNELS)
+            applies = [r.devices is None or device_id in r.devices for r in self.rules]
+            self.applies = np.vstack([self.applies, np.array(applies, dtype=bool).reshape(1, n_rules)])
+            self.active = np.vstack([self.active, np.zeros((1, n_rules), dtype=bool)])
+            self.breach_since = np.vstack([self.breach_since, np.full((1, n_rules), np.nan)])
+            self.last_fired = np.vstack([self.last_fired, np.full((1, n_rules), -np.inf)])
+            self.prev_values = np.vstack([self.prev_values, np.full((1, n_channels), np.nan)])
+            self.prev_ts = np.vstack([self.prev_ts, np.full((1, n_channels), np.nan)])
+        return row
+
+    def evaluate(self, device_id, ts, values):
+        """Evaluate a single reading; see evaluate_batch."""
+        return self.evaluate_batch([(device_id, ts, values)])
+
+    def evaluate_batch(self, readings):
+        """Evaluate (device_id, ts_seconds, {channel: value}) readings.
+
+        Returns the AlertEvents produced, in reading order. A device that
+        appears more than once is evaluated in order, one pass per reading.
+        """
+        if not self.rules:
+            return []
+        events = []
+        with self._lock:
+            remaining = list(readings)
+            while remaining:
+                seen, this_pass, later = set(), [], []
+                for reading in remaining:
+                    (later if reading[0] in seen else this_pass).append(reading)
+                    seen.add(reading[0])
+                events.extend(self._evaluate_pass(this_pass))
+                remaining = later
+        return events
+
+    def _evaluate_pass(self, readings):
+        rows = np.array([self._row(device_id) for device_id, _, _ in readings], dtype=np.intp)
+        ts = np.array([reading_ts for _, reading_ts, _ in readings], dtype=np.float64)
+        current = np.array([
+            [np.nan if values.get(channel) is None else values[channel] for channel in READING_CHANNELS]
+            for _, _, values in readings
+        ], dtype=np.float64)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Change per minute since the previous value of each channel
+            elapsed_min = (ts[:, None] - self.prev_ts[rows]) / 60.0
+            rates = np.where(elapsed_min > 0, (current - self.prev_values[rows]) / elapsed_min, np.nan)
+
+            value = np.where(self.is_rate, rates[:, self.channel_index], current[:, self.channel_index])
+            # Positive when the rule's condition holds, whatever its direction
+            margin = self.direction * (value - self.threshold)
+            valid = ~np.isnan(value) & self.applies[rows]
+            breach = valid & (margin > 0)
+            clear = valid & (margin <= -self.hysteresis)
+
+        now = ts[:, None]
+        breach_since = self.breach_since[rows]
+        breach_since = np.where(
+            breach,
+            np.where(np.isnan(breach_since), now, breach_since),
+            np.where(valid, np.nan, breach_since)
+        )
+        active = self.active[rows]
+        last_fired = self.last_fired[rows]
+        fire = (breach & ~active
+                & (now - breach_since >= self.for_seconds)
+                & (now - last_fired >= self.min_interval))
+        resolve = active & clear
+
+        self.breach_since[rows] = breach_since
+        self.active[rows] = (active | fire) & ~resolve
+        self.last_fired[rows] = np.where(fire, now, last_fired)
+        seen = ~np.isnan(current)
+        self.prev_values[rows] = np.where(seen, current, self.prev_values[rows])
+        self.prev_ts[rows] = np.where(seen, now, self.prev_ts[rows])
+
+        events = []
+        for kind, mask in (('triggered', fire), ('resolved', resolve)):
+            for i, r in zip(*np.nonzero(mask)):
+                events.append(AlertEvent(self.rules[r], readings[i][0], kind, float(value[i, r]), float(ts[i])))
+        events.sort(key=lambda event: event.ts)
+        return events
@@ -1,17 +1,67 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import sqlite3
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from datetime import datetime, timedelta
 from config import Config
+from async_db import AsyncDatabase
+from db_handler import ROLLUP_TABLES, to_epoch_ms
+from downsample import METHODS as DOWNSAMPLE_METHODS, downsample_buckets
+from history_format import FORMATS as HISTORY_FORMATS, columnar, dumps
+from reading_snapshot import ReadingSnapshot
+from device_registry import resolve_default_device
+from reading_stream import ReadingBroadcaster
+from http_cache import ConditionalGetMiddleware
+from reading_export import EXPORT_FORMATS, ExportBusy, ReadingExport
+from logging_setup import setup_logging
+from metrics import REGISTRY, RequestMetricsMiddleware, read_published, render
+from profiling import ServerTimingMiddleware, install_profiler_toggle, phase
 import logging
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+setup_logging('api')
+logger = logging.getLogger('IoTsync.api')
 
 app = FastAPI()
 
+# The dashboard follows the same device the collector treats as the default
+resolve_default_device()
+
+# All endpoint queries go through this so they never block the event loop
+db = AsyncDatabase()
+
+# Latest reading and 24h min/max, served from memory until the collector writes
+snapshot = ReadingSnapshot(manager=db.manager)
+
+# Pushes each new reading to every open dashboard
+broadcaster = ReadingBroadcaster(snapshot)
+
+# Middleware added first runs innermost: validators are checked before any
+# endpoint runs, bodies are compressed on the way out, request timing and
+# Server-Timing cover all of that, and CORS headers wrap everything
+# including 304s.
+app.add_middleware(
+    ConditionalGetMiddleware,
+    snapshot=snapshot,
+    paths=[
+        "/api/temperature/current",
+        "/api/temperature/history",
+        "/api/temperature/stats",
+        "/api/alerts/recent",
+    ],
+    windowed=[
+        "/api/temperature/history",
+        "/api/temperature/stats",
+    ],
+)
+app.add_middleware(GZipMiddleware, minimum_size=Config.GZIP_MIN_SIZE)
+app.add_middleware(RequestMetricsMiddleware, exclude=["/api/temperature/stream"])
+if Config.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# `kill -USR2 <pid>` starts/stops a sampling profiler writing to LOG_DIR
+profiler = install_profiler_toggle('api')
+
 # Configure CORS
 origins = [
     "http://localhost:3000",
@@ -35,121 +85,223 @@ app.add_middleware(
 async def root():
     return {"message": "API is running"}
 
-def get_db():
-    return sqlite3.connect(Config.DB_FILE)
+@app.on_event("startup")
+async def load_snapshot():
+    try:
+        await snapshot.ensure_loaded()
+    except Exception as e:
+        # Retried by the first request that needs it
+        logger.warning(f"Could not load reading snapshot at startup: {e}")
+
+@app.on_event("shutdown")
+async def close_db():
+    await broadcaster.close()
+    await snapshot.stop()
+    snapshot.close()
+    db.close()
+    db.manager.close()
 
 @app.get("/api/temperature/current")
 async def get_current_temperature(request: Request):
-    logger.debug(f"Received request for current temperature from {request.client.host}")
-    logger.debug(f"Request headers: {request.headers}")
+    logger.debug("Received request for current temperature from %s", request.client.host)
     
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT pool_temp_c, pool_temp_f, timestamp
-            FROM sensor_readings
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """)
-        result = cursor.fetchone()
-        
-        if not result:
-            logger.warning("No temperature data found in database")
-            raise HTTPException(status_code=404, detail="No temperature data found")
-        
-        response = {
-            "temperature_c": result[0],
-            "temperature_f": result[1],
-            "timestamp": result[2]
+    await snapshot.ensure_loaded()
+    latest = snapshot.latest()
+    
+    if not latest:
+        logger.warning("No temperature data found in database")
+        raise HTTPException(status_code=404, detail="No temperature data found")
+    
+    response = {
+        "temperature_c": latest['pool_temp_c'],
+        "temperature_f": latest['pool_temp_f'],
+        "timestamp": latest['timestamp'].isoformat()
+    }
+    logger.debug("Returning current temperature data: %s", response)
+    return response
+
+@app.get("/api/temperature/stream")
+async def stream_temperature(request: Request):
+    """Server-Sent Events stream with one `reading` event per stored reading."""
+    return StreamingResponse(
+        broadcaster.sse_events(request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
         }
-        logger.debug(f"Returning current temperature data: {response}")
-        return response
+    )
 
 @app.get("/api/temperature/history")
-async def get_temperature_history(request: Request, timerange: str = "day"):
-    logger.debug(f"Received request for temperature history from {request.client.host}")
-    logger.debug(f"Timerange: {timerange}")
+async def get_temperature_history(
+    request: Request,
+    timerange: str = "day",
+    points: int = Query(None, ge=3, le=Config.HISTORY_MAX_POINTS),
+    method: str = Query("lttb", pattern=f"^({'|'.join(DOWNSAMPLE_METHODS)})$"),
+    format: str = Query("rows", pattern=f"^({'|'.join(HISTORY_FORMATS)})$"),
+):
+    logger.debug("Received request for temperature history from %s", request.client.host)
+    logger.debug("Timerange: %s, points: %s, method: %s, format: %s", timerange, points, method, format)
     
-    with get_db() as conn:
-        cursor = conn.cursor()
+    # Read the coarsest rollup that still resolves the requested range
+    if timerange == "day":
+        rollup_table = "rollup_minute"
+        time_ago = timedelta(days=1)
+    elif timerange == "week":
+        rollup_table = "rollup_hour"
+        time_ago = timedelta(days=7)
+    elif timerange == "month":
+        rollup_table = "rollup_hour"
+        time_ago = timedelta(days=30)
+    else:  # year
+        rollup_table = "rollup_day"
+        time_ago = timedelta(days=365)
+    
+    if points:
+        # With a target point count, use the coarsest rollup that still has at
+        # least that many buckets in range and let downsampling pick from it
+        range_ms = time_ago.total_seconds() * 1000
+        candidates = [t for t, width in ROLLUP_TABLES.items() if range_ms / width >= points]
+        rollup_table = candidates[-1] if candidates else "rollup_minute"
         
-        if timerange == "day":
-            interval = "1 minute"
-            time_ago = "1 day"
-        elif timerange == "week":
-            interval = "1 hour"
-            time_ago = "7 days"
-        elif timerange == "month":
-            interval = "1 hour"
-            time_ago = "30 days"
-        else:  # year
-            interval = "1 day"
-            time_ago = "365 days"
-            
-        logger.debug(f"Using interval: {interval}, time_ago: {time_ago}")
-            
-        cursor.execute(f"""
+    logger.debug("Using rollup: %s, time_ago: %s", rollup_table, time_ago)
+    
+    def query(conn):
+        cursor = conn.execute(f"""
             SELECT 
-                datetime(timestamp) as time,
-                pool_temp_c as temperature,
-                pool_temp_f as temperature_f
-            FROM sensor_readings
-            WHERE timestamp > datetime('now', '-{time_ago}')
-            GROUP BY strftime('%Y-%m-%d %H:%M', timestamp)
-            ORDER BY timestamp ASC
-        """)
+                datetime(bucket_ms / 1000, 'unixepoch') as time,
+                ROUND(value_sum / sample_count, 2) as temperature,
+                ROUND(value_sum / sample_count * 9 / 5 + 32, 2) as temperature_f,
+                bucket_ms,
+                value_min,
+                value_max
+            FROM {rollup_table}
+            WHERE device_id = ? AND channel = 'pool_temp_c' AND bucket_ms > ?
+            ORDER BY bucket_ms ASC
+        """, (Config.DEFAULT_DEVICE_ID, to_epoch_ms(datetime.now() - time_ago)))
+        rows = cursor.fetchall()
         
-        results = cursor.fetchall()
-        response = [{
-            "time": row[0],
-            "temperature": row[1],
-            "temperature_f": row[2]
-        } for row in results]
-        
-        logger.debug(f"Returning {len(response)} history records")
-        return response
+        with phase("rows"):
+            if points and len(rows) > points:
+                # minmax draws on each bucket's own extremes, not its average
+                keep, values = downsample_buckets(
+                    [row[3] for row in rows],
+                    [row[1] for row in rows],
+                    [row[4] for row in rows],
+                    [row[5] for row in rows],
+                    points,
+                    method
+                )
+                rows = [
+                    (rows[i][0], round(value, 2), round(value * 9 / 5 + 32, 2), rows[i][3])
+                    for i, value in zip(keep.tolist(), values.tolist())
+                ]
+            
+            if format == "columnar":
+                return columnar([row[3] for row in rows], [row[1] for row in rows])
+            return [{
+                "time": row[0],
+                "temperature": row[1],
+                "temperature_f": row[2]
+            } for row in rows]
+    
+    response = await db.run(query)
+    # Rendered here rather than by FastAPI so serialization shows up as its own phase
+    with phase("serialize"):
+        if format == "columnar":
+            logger.debug("Returning %d history records (columnar)", response['n'])
+            return Response(dumps(response), media_type="application/json")
+        logger.debug("Returning %d history records", len(response))
+        return JSONResponse(response)
+
+@app.get("/api/readings/export")
+async def export_readings(
+    format: str = Query("ndjson", pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    device_id: str = None,
+    channels: str = None,
+    start: datetime = None,
+    end: datetime = None,
+):
+    """Stream raw readings as NDJSON or CSV, optionally filtered by device, channels and time."""
+    def local_ms(dt):
+        # Stored timestamps are naive local time
+        if dt.tzinfo is not None:
+            dt = dt.astimezone().replace(tzinfo=None)
+        return to_epoch_ms(dt)
+    
+    device_id = device_id or Config.DEFAULT_DEVICE_ID
+    try:
+        export = ReadingExport(
+            device_id=None if device_id == 'all' else device_id,
+            channels=[c.strip() for c in channels.split(',') if c.strip()] if channels else None,
+            start_ms=local_ms(start) if start else None,
+            end_ms=local_ms(end) if end else None,
+            manager=db.manager,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportBusy as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return StreamingResponse(
+        export.stream(format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="readings.{format}"'}
+    )
 
 @app.get("/api/alerts/recent")
 async def get_recent_alerts():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                timestamp,
-                alert_type,
-                temperature_f,
-                threshold_f,
-                message
-            FROM temperature_alerts
-            ORDER BY timestamp DESC
-            LIMIT 10
-        """)
-        
-        results = cursor.fetchall()
-        return [{
-            "id": i,
-            "timestamp": row[0],
-            "type": row[1],
-            "temperature": row[2],
-            "threshold": row[3],
-            "message": row[4]
-        } for i, row in enumerate(results)]
+    results = await db.fetchall("""
+        SELECT 
+            timestamp,
+            alert_type,
+            temperature_f,
+            threshold_f,
+            message
+        FROM temperature_alerts
+        ORDER BY id DESC
+        LIMIT 10
+    """)
+    
+    return [{
+        "id": i,
+        "timestamp": row[0],
+        "type": row[1],
+        "temperature": row[2],
+        "threshold": row[3],
+        "message": row[4]
+    } for i, row in enumerate(results)]
 
 @app.get("/api/temperature/stats")
 async def get_temperature_stats():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                MIN(pool_temp_f) as min_temp,
-                MAX(pool_temp_f) as max_temp
-            FROM sensor_readings
-            WHERE timestamp > datetime('now', '-1 day')
-        """)
-        
-        min_temp, max_temp = cursor.fetchone()
-        return {
-            "min_temperature": min_temp,
-            "max_temperature": max_temp,
-            "alert_threshold": Config.ALERT_MIN_POOL_TEMP_F
-        } 
\ No newline at end of file
+    await snapshot.ensure_loaded()
+    min_temp, max_temp = snapshot.min_max_24h()
+    
+    return {
+        "min_temperature": min_temp,
+        "max_temperature": max_temp,
+        "alert_threshold": Config.ALERT_MIN_POOL_TEMP_F
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format: this process's metrics plus the collector's last published ones."""
+    collector, age = read_published()
+    text = render({'collector': collector, 'api': REGISTRY.snapshot()})
+    if age is not None:
+        text += (
+            "# HELP iotsync_collector_metrics_age_seconds Age of the collector metrics snapshot\n"
+            "# TYPE iotsync_collector_metrics_age_seconds gauge\n"
+            f"iotsync_collector_metrics_age_seconds {age:.3f}\n"
+        )
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return {
+        "snapshot": snapshot.counters(),
+        "stream": {
+            "subscribers": broadcaster.subscriber_count,
+            "dropped_events": broadcaster.dropped,
+        },
+    }
@@ -0,0 +1,263 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from config import Config
+from db_connection import get_connection_manager
+from db_handler import READING_COLUMNS
+
+# Numeric columns archived next to ts_ms; missing values become NaN
+ARCHIVE_COLUMNS = [column for column in READING_COLUMNS if column != 'pressure_units']
+
+def _device_dir(device_id):
+    return device_id.replace(os.sep, '_')
+
+def _write_atomic(path, write):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_columns(path, columns):
+    """Write a set of column arrays into a fresh directory, made visible by one rename."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    for column, data in columns.items():
+        _write_atomic(tmp_path / f'{column}.npy', lambda f, data=data: np.save(f, data))
+    _write_atomic(tmp_path / 'meta.json',
+                  lambda f: f.write(json.dumps({'rows': len(columns['id'])}).encode()))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def _merge(pieces, columns):
+    """Concatenate column sets, order by (ts_ms, id) and keep one row per reading id."""
+    merged = {column: np.concatenate([piece[column] for piece in pieces]) for column in columns}
+    order = np.lexsort((merged['id'], merged['ts_ms']))
+    # First occurrence of each id, in (ts_ms, id) order
+    _, first = np.unique(merged['id'][order], return_index=True)
+    keep = order[np.sort(first)]
+    return {column: data[keep] for column, data in merged.items()}
+
+class ArchiveExporter:
+    """Export sensor_readings into per-column .npy files.
+
+    Layout: ARCHIVE_DIR/<device_id>/<YYYY-MM>/ holds a compacted base (a
+    `base_<n>` directory named by meta.json) plus `chunks/<first id>/`
+    directories, each with {id,ts_ms,<column>}.npy sorted by (ts_ms, id).
+    Every export adds one chunk per partition it touches, written to a
+    temporary directory and renamed into place, so an append never rewrites
+    the month. Once a month has ARCHIVE_COMPACT_CHUNKS chunks they are
+    merged into a new base generation, and meta.json is switched to it last.
+    Readers merge the base and chunks and drop duplicate ids, so rows
+    re-exported after a crash, and late readings older than the month's
+    newest, are neither lost nor doubled. export_state.json remembers the
+    last exported sensor_readings id, so each run only reads new rows;
+    export stops short of any row whose ts_ms has not been backfilled yet.
+    """
+
+    def __init__(self, root=None, manager=None):
+        self.root = root or Config.ARCHIVE_DIR
+        self.db = manager or get_connection_manager()
+        self.chunk_rows = Config.ARCHIVE_CHUNK_ROWS
+        self.compact_chunks = Config.ARCHIVE_COMPACT_CHUNKS
+        self.state_path = self.root / 'export_state.json'
+        self.logger = logging.getLogger('IoTsync.archive')
+
+    def last_id(self):
+        """The newest sensor_readings id already in the archive."""
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)['last_id']
+        except FileNotFoundError:
+            return 0
+
+    def _save_last_id(self, last_id):
+        _write_atomic(self.state_path, lambda f: f.write(json.dumps({'last_id': last_id}).encode()))
+
+    def export(self):
+        """Archive every reading added since the last export; returns rows written."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        last_id = self.last_id()
+        exported = 0
+        touched = set()
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        while True:
+            with self.db.reader() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, device_id, ts_ms, {columns}
+                    FROM sensor_readings
+                    WHERE id > ? AND device_id IS NOT NULL
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, self.chunk_rows)).fetchall()
+            # Stop at the first row still waiting for the ts_ms backfill, the
+            # next export picks up from there once it has been filled in
+            waiting = next((i for i, row in enumerate(rows) if row[2] is None), None)
+            if waiting is not None:
+                rows = rows[:waiting]
+            if rows:
+                exported += self._append(rows, touched)
+                last_id = rows[-1][0]
+                self._save_last_id(last_id)
+            if waiting is not None or len(rows) < self.chunk_rows:
+                break
+        for path in sorted(touched):
+            if len(_chunk_dirs(path)) >= self.compact_chunks:
+                self.compact(path)
+        if exported:
+            self.logger.info(f"Archived {exported} readings up to id {last_id}")
+        return exported
+
+    def _append(self, rows, touched):
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        device_ids = np.array([row[1] for row in rows], dtype=object)
+        ts_ms = np.array([row[2] for row in rows], dtype=np.int64)
+        values = np.array(
+            [[np.nan if v is None else v for v in row[3:]] for row in rows], dtype=np.float64
+        ).reshape(len(rows), len(ARCHIVE_COLUMNS))
+        # ts_ms holds local wall time, so the month of its UTC reading is the local month
+        months = ts_ms.astype('datetime64[ms]').astype('datetime64[M]').astype(str)
+
+        for device_id, month in sorted(set(zip(device_ids, months))):
+            mask = (device_ids == device_id) & (months == month)
+            path = self.root / _device_dir(device_id) / month
+            self._append_chunk(path, ids[mask], ts_ms[mask], values[mask])
+            touched.add(path)
+        return len(rows)
+
+    def _append_chunk(self, path, ids, ts_ms, values):
+        order = np.lexsort((ids, ts_ms))
+        columns = {'id': ids[order], 'ts_ms': ts_ms[order]}
+        columns.update({column: values[order, i] for i, column in enumerate(ARCHIVE_COLUMNS)})
+        # Named by its first id: an export repeated after a crash replaces the same chunk
+        _write_columns(path / 'chunks' / f'{int(ids.min()):012d}', columns)
+
+    def compact(self, path):
+        """Merge a partition's base and chunks into a new base generation."""
+        columns = ['id', 'ts_ms'] + ARCHIVE_COLUMNS
+        chunks = _chunk_dirs(path)
+        pieces = _partition_pieces(path, columns)
+        if not pieces:
+            return
+        meta = _read_meta(path) or {}
+        generation = meta.get('generation', 0) + 1
+        base = f'base_{generation}'
+        merged = _merge(pieces, columns)
+        _write_columns(path / base, merged)
+        # Commit point; chunks still present after a crash here are deduplicated on read
+        _write_atomic(path / 'meta.json', lambda f: f.write(json.dumps({
+            'generation': generation, 'base': base, 'rows': len(merged['id'])
+        }).encode()))
+        for chunk in chunks:
+            shutil.rmtree(chunk, ignore_errors=True)
+        # Earlier generations, including any left behind by a crash
+        for old in path.glob('base_*'):
+            if old.name != base:
+                shutil.rmtree(old, ignore_errors=True)
+        if 'base' not in meta:
+            # Pre-chunk layout kept its columns in the month directory itself
+            for column in ['ts_ms'] + ARCHIVE_COLUMNS:
+                (path / f'{column}.npy').unlink(missing_ok=True)
+        self.logger.info(f"Compacted {len(chunks)} chunks into {path / base} ({len(merged['id'])} rows)")
+
+def _read_meta(path):
+    try:
+        with open(path / 'meta.json') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _chunk_dirs(path):
+    chunks = path / 'chunks'
+    if not chunks.exists():
+        return []
+    return sorted(p for p in chunks.iterdir() if p.is_dir() and not p.name.endswith('.tmp'))
+
+def _open_columns(path, columns, rows):
+    data = {}
+    for column in columns:
+        if column == 'id' and not (path / 'id.npy').exists():
+            # Partitions from before ids were archived: unique ids that never match a reading
+            data['id'] = -np.arange(1, rows + 1, dtype=np.int64)
+        else:
+            data[column] = np.load(path / f'{column}.npy', mmap_mode='r')[:rows]
+    return data
+
+def _partition_pieces(path, columns):
+    """Memory-mapped column sets of a partition's base and chunks, each sorted by (ts_ms, id)."""
+    pieces = []
+    meta = _read_meta(path)
+    if meta is not None and meta['rows']:
+        pieces.append(_open_columns(path / meta.get('base', ''), columns, meta['rows']))
+    for chunk in _chunk_dirs(path):
+        chunk_meta = _read_meta(chunk)
+        if chunk_meta is not None and chunk_meta['rows']:
+            pieces.append(_open_columns(chunk, columns, chunk_meta['rows']))
+    return pieces
+
+def _open_partition(path, columns):
+    """One partition's columns sorted by ts_ms, or None if it has no data yet.
+
+    A compacted partition is returned as zero-copy memory maps; otherwise
+    the base and chunks are merged in memory.
+    """
+    pieces = _partition_pieces(path, ['id'] + [c for c in columns if c != 'id'])
+    if not pieces:
+        return None
+    partition = pieces[0] if len(pieces) == 1 else _merge(pieces, list(pieces[0]))
+    return {column: partition[column] for column in columns}
+
+class ArchiveReader:
+    """Read archived series back as memory-mapped numpy arrays.
+
+    Nothing is read from disk until the arrays are touched, and a time range
+    within one compacted month is a zero-copy slice of the mapped files.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or Config.ARCHIVE_DIR
+
+    def devices(self):
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def months(self, device_id):
+        device_path = self.root / _device_dir(device_id)
+        if not device_path.exists():
+            return []
+        return sorted(p.name for p in device_path.iterdir()
+                      if (p / 'meta.json').exists() or _chunk_dirs(p))
+
+    def load(self, device_id, columns=None, start_ms=None, end_ms=None):
+        """Return {'ts_ms': ..., column: ...} for readings with start_ms <= ts_ms < end_ms."""
+        columns = ['ts_ms'] + [c for c in (columns or ARCHIVE_COLUMNS) if c != 'ts_ms']
+        parts = []
+        for month in self.months(device_id):
+            partition = _open_partition(self.root / _device_dir(device_id) / month, columns)
+            if partition is None or not len(partition['ts_ms']):
+                continue
+            ts = partition['ts_ms']
+            lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, 'left'))
+            hi = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, 'left'))
+            if lo < hi:
+                parts.append({column: partition[column][lo:hi] for column in columns})
+
+        if not parts:
+            return {column: np.empty(0, dtype=np.int64 if column == 'ts_ms' else np.float64)
+                    for column in columns}
+        if len(parts) == 1:
+            return parts[0]
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+def main():
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    count = ArchiveExporter().export()
+    print(f"Archived {count} readings to {Config.ARCHIVE_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from db_connection import get_connection_manager
+from metrics import REGISTRY, DB_BUCKETS
+from profiling import record
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'iotsync_api_db_query_seconds', 'API database query time, excluding executor queueing',
+    buckets=DB_BUCKETS
+)
+
+class AsyncDatabase:
+    """Async front for the pooled SQLite readers used by the API.
+
+    sqlite3 calls block, so queries run on a dedicated thread pool instead of
+    the event loop. The pool size is the concurrency limit: at most that many
+    queries run at once and the rest wait in the executor queue, while the
+    event loop stays free to serve other requests.
+    """
+
+    def __init__(self, manager=None, concurrency=None):
+        self.manager = manager or get_connection_manager()
+        self.concurrency = concurrency or Config.API_DB_CONCURRENCY
+        # Every worker needs a reader of its own or it would just wait on the pool
+        self.manager.pool_size = max(self.manager.pool_size, self.concurrency)
+        self.logger = logging.getLogger('IoTsync.db')
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency,
+                thread_name_prefix='db-reader'
+            )
+        return self._executor
+
+    def _call(self, fn, args, submitted):
+        record('db_wait', time.perf_counter() - submitted)
+        with self.manager.reader() as conn, DB_QUERY_SECONDS.time():
+            return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """Run fn(conn, *args) on a pooled reader connection and return its result."""
+        loop = asyncio.get_running_loop()
+        # Carry the request context over so the query's timings reach Server-Timing
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._get_executor(), context.run, self._call, fn, args, time.perf_counter()
+        )
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,7 @@
+"""Performance benchmarks for IoTsync.
+
+Run from the backend directory so the flat modules import as usual:
+
+    python -m bench.dataset --days 365 --devices 10 --db /tmp/bench.db
+    python -m bench.storage --db /tmp/bench.db --output results.json
+"""
@@ -0,0 +1,131 @@
+import time
+import logging
+import argparse
+import numpy as np
+from datetime import datetime, timedelta
+from pathlib import Path
+from config import Config
+from db_handler import DatabaseHandler, READING_COLUMNS, to_epoch_ms
+from device_registry import resolve_default_device
+
+# Rows handed to store_rows() per transaction while generating
+GENERATE_BATCH_ROWS = 20000
+
+def device_ids(count):
+    """The dashboard device (as the API resolves it) first, then synthetic ones."""
+    return [resolve_default_device()] + [f'bench-{i:04d}' for i in range(1, count)]
+
+def _series(rng, n, steps_per_day, base, daily, noise):
+    """A daily cycle plus a slow seasonal drift and noise, rounded like the sensors."""
+    t = np.arange(n) / steps_per_day
+    values = (base
+              + daily * np.sin(2 * np.pi * (t - 0.25))
+              + 3 * np.sin(2 * np.pi * t / 365)
+              + rng.normal(0, noise, n))
+    return np.round(values, 1)
+
+def _device_rows(device_id, start, n, interval, rng):
+    steps_per_day = 86400 / interval
+    pool_c = _series(rng, n, steps_per_day, 30, 1.5, 0.2)
+    indoor_c = _series(rng, n, steps_per_day, 22, 1, 0.3)
+    outdoor_c = _series(rng, n, steps_per_day, 15, 6, 0.8)
+    humidity = np.clip(_series(rng, n, steps_per_day, 55, 10, 3), 5, 100).round()
+    pressure = _series(rng, n, steps_per_day, 1013, 2, 1)
+
+    for i in range(n):
+        ts = start + timedelta(seconds=i * interval)
+        values = {
+            'indoor_temp_c': float(indoor_c[i]),
+            'pool_temp_c': float(pool_c[i]),
+            'indoor_humidity': int(humidity[i]),
+            'outdoor_ch1_temp_c': float(outdoor_c[i]),
+            'outdoor_ch1_humidity': int(humidity[i]),
+            'outdoor_ch2_temp_c': float(outdoor_c[i]) - 1,
+            'outdoor_ch2_humidity': int(humidity[i]),
+            'outdoor_ch3_temp_c': float(pool_c[i]),
+            'outdoor_ch3_humidity': int(humidity[i]),
+            'atmospheric_pressure': float(pressure[i]),
+            'pressure_units': 'hpa',
+        }
+        for column in ('indoor_temp', 'pool_temp', 'outdoor_ch1_temp', 'outdoor_ch2_temp', 'outdoor_ch3_temp'):
+            values[f'{column}_f'] = round(values[f'{column}_c'] * 9 / 5 + 32, 2)
+        yield (ts.isoformat(), device_id, to_epoch_ms(ts), values)
+
+def generate(db_path, days=30, devices=1, interval=None, alerts_per_day=2.0, seed=42, end=None):
+    """Fill a fresh database with synthetic readings, rollups and alerts.
+
+    Readings go through DatabaseHandler.store_rows(), so the rollup tables
+    are maintained exactly as in production. Returns a summary dict.
+    """
+    db_path = Path(db_path)
+    if db_path.exists():
+        raise FileExistsError(f"{db_path} already exists")
+    interval = interval or Config.COLLECTION_INTERVAL
+    end = end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    n = int(days * 86400 // interval)
+    rng = np.random.default_rng(seed)
+    logger = logging.getLogger('IoTsync.bench')
+
+    Config.DB_FILE = db_path
+    db_handler = DatabaseHandler()
+    started = time.monotonic()
+    readings = 0
+    for device_id in device_ids(devices):
+        batch = []
+        for row in _device_rows(device_id, start, n, interval, rng):
+            batch.append(row)
+            if len(batch) >= GENERATE_BATCH_ROWS:
+                db_handler.store_rows(batch)
+                readings += len(batch)
+                batch = []
+        if batch:
+            db_handler.store_rows(batch)
+            readings += len(batch)
+        logger.info(f"Generated {readings} readings ({device_id})")
+
+    alert_count = int(days * alerts_per_day)
+    alert_times = sorted(start + timedelta(seconds=float(s)) for s in rng.uniform(0, days * 86400, alert_count))
+    with db_handler.db.writer() as conn:
+        conn.executemany('''
+            INSERT INTO temperature_alerts
+            (timestamp, alert_type, temperature_f, threshold_f, email_sent, sms_sent, email_recipient, phone_recipient, message)
+            VALUES (?, 'low_temperature', ?, ?, 1, 1, NULL, NULL, 'Synthetic benchmark alert')
+        ''', [(ts.isoformat(), Config.ALERT_MIN_POOL_TEMP_F - 1, Config.ALERT_MIN_POOL_TEMP_F) for ts in alert_times])
+
+    summary = {
+        'db': str(db_path),
+        'days': days,
+        'devices': devices,
+        'interval_s': interval,
+        'readings': readings,
+        'alerts': alert_count,
+        'columns': len(READING_COLUMNS),
+        'seconds': round(time.monotonic() - started, 1),
+    }
+    # Closing checkpoints the WAL, so the file size is the whole dataset
+    db_handler.db.close()
+    summary['bytes'] = db_path.stat().st_size
+    return summary
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--days', type=float, default=30, help="history length (1 to 1825)")
+    parser.add_argument('--devices', type=int, default=1, help="number of devices (1 to 1000)")
+    parser.add_argument('--interval', type=int, default=Config.COLLECTION_INTERVAL,
+                        help="seconds between readings")
+    parser.add_argument('--alerts-per-day', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=42)
+
+def main():
+    import json
+    parser = argparse.ArgumentParser(description="Generate a synthetic IoTsync database")
+    parser.add_argument('--db', required=True, help="path of the database to create")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    summary = generate(args.db, args.days, args.devices, args.interval, args.alerts_per_day, args.seed)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from pathlib import Path
+from config import Config
+from bench.dataset import add_dataset_arguments, generate
+from bench.storage import DASHBOARD_POINTS, HISTORY_RANGES
+
+# Default service level objectives per endpoint, in milliseconds
+DEFAULT_SLOS = {
+    'current': {'p95': 50, 'p99': 150},
+    'stats': {'p95': 50, 'p99': 150},
+    'alerts': {'p95': 100, 'p99': 250},
+    'history': {'p95': 250, 'p99': 500},
+}
+
+ENDPOINTS = {
+    'current': '/api/temperature/current',
+    'stats': '/api/temperature/stats',
+    'alerts': '/api/alerts/recent',
+    'history': '/api/temperature/history',
+}
+
+class Recorder:
+    """Latencies and errors per endpoint for one load step."""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+
+    async def get(self, client, name, params=None):
+        started = time.perf_counter()
+        try:
+            response = await client.get(ENDPOINTS[name], params=params)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self, duration, slos, max_error_rate):
+        endpoints = {}
+        violations = []
+        for name, samples in self.latencies.items():
+            if not samples:
+                continue
+            samples = np.asarray(samples)
+            result = {
+                'requests': len(samples),
+                'throughput_rps': round(len(samples) / duration, 2),
+                'error_rate': round(self.errors[name] / len(samples), 4),
+                'p50_ms': round(float(np.percentile(samples, 50)), 2),
+                'p95_ms': round(float(np.percentile(samples, 95)), 2),
+                'p99_ms': round(float(np.percentile(samples, 99)), 2),
+                'max_ms': round(float(samples.max()), 2),
+            }
+            for quantile, limit in slos.get(name, {}).items():
+                if result[f'{quantile}_ms'] > limit:
+                    violations.append(f"{name} {quantile} {result[f'{quantile}_ms']}ms > {limit}ms")
+            if result['error_rate'] > max_error_rate:
+                violations.append(f"{name} error rate {result['error_rate']:.2%} > {max_error_rate:.2%}")
+            endpoints[name] = result
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            'requests': total,
+            'throughput_rps': round(total / duration, 2),
+            'error_rate': round(sum(self.errors.values()) / total, 4) if total else 0.0,
+            'endpoints': endpoints,
+            'slo_violations': violations,
+            'slo_met': not violations,
+        }
+
+async def dashboard(client, recorder, deadline, poll_interval, range_change_rate, rng):
+    """One browser tab running app.js with the polling fallback.
+
+    Page load fetches the day chart (history + alerts + stats) and the
+    current reading; then every poll_interval it fetches current + stats,
+    and with probability range_change_rate per tick the user picks another
+    range, which fetches history + alerts + stats.
+    """
+    async def load_chart(timerange):
+        await asyncio.gather(
+            recorder.get(client, 'history', {
+                'timerange': timerange, 'points': DASHBOARD_POINTS, 'format': 'columnar'
+            }),
+            recorder.get(client, 'alerts'),
+            recorder.get(client, 'stats'),
+        )
+
+    async def poll():
+        await asyncio.gather(recorder.get(client, 'current'), recorder.get(client, 'stats'))
+
+    await asyncio.gather(load_chart('day'), poll())
+    # Tabs are not in lockstep
+    next_tick = time.monotonic() + rng.uniform(0, poll_interval)
+    while True:
+        delay = next_tick - time.monotonic()
+        if next_tick >= deadline:
+            return
+        if delay > 0:
+            await asyncio.sleep(delay)
+        next_tick += poll_interval
+        tasks = [poll()]
+        if rng.random() < range_change_rate:
+            tasks.append(load_chart(rng.choice(HISTORY_RANGES)))
+        await asyncio.gather(*tasks)
+
+async def run_step(base_url, clients, duration, ramp, poll_interval, range_change_rate, seed):
+    import httpx
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=clients * 3, max_keepalive_connections=clients * 3)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.monotonic()
+        deadline = started + duration
+
+        async def start_client(i):
+            await asyncio.sleep(ramp * i / clients)
+            await dashboard(client, recorder, deadline, poll_interval, range_change_rate,
+                            random.Random(seed + i))
+
+        await asyncio.gather(*(start_client(i) for i in range(clients)))
+        elapsed = time.monotonic() - started
+    return recorder, elapsed
+
+def launch_api(db_path, port, workers=1):
+    """Start `uvicorn api:app` on db_path and wait until it answers."""
+    import httpx
+
+    env = dict(os.environ, DB_FILE=str(db_path), LOG_LEVEL='WARNING', CONSOLE_LOG_LEVEL='WARNING')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api:app', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=Config.BASE_DIR, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with status {process.returncode}")
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API did not start within 30 seconds")
+
+def parse_slos(overrides):
+    """DEFAULT_SLOS updated with `endpoint.quantile=ms` overrides."""
+    slos = {name: dict(limits) for name, limits in DEFAULT_SLOS.items()}
+    for override in overrides or []:
+        key, _, value = override.partition('=')
+        name, _, quantile = key.partition('.')
+        if name not in ENDPOINTS or quantile not in ('p50', 'p95', 'p99') or not value:
+            raise ValueError(f"Invalid SLO {override!r}, expected e.g. current.p95=50")
+        slos.setdefault(name, {})[quantile] = float(value)
+    return slos
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard API with simulated app.js clients")
+    parser.add_argument('--url', help="API to test (default: launch uvicorn on --db)")
+    parser.add_argument('--db', help="database for the launched API (default: generate a temporary one)")
+    add_dataset_arguments(parser)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers for the launched API")
+    parser.add_argument('--clients', default='10,50,100',
+                        help="comma separated concurrent dashboards, one step each")
+    parser.add_argument('--duration', type=float, default=30, help="seconds per step")
+    parser.add_argument('--ramp', type=float, default=5, help="seconds to start all clients")
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help="seconds between current+stats polls (app.js uses 60)")
+    parser.add_argument('--range-change-rate', type=float, default=0.1,
+                        help="chance per poll that the user switches history range")
+    parser.add_argument('--slo', action='append', metavar='ENDPOINT.QUANTILE=MS',
+                        help="override an SLO, e.g. current.p95=50 (repeatable)")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--load-seed', type=int, default=1, help="seed for client behaviour")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        parser.error("the load test needs httpx: pip install -r bench/requirements.txt")
+    try:
+        slos = parse_slos(args.slo)
+    except ValueError as e:
+        parser.error(str(e))
+    client_steps = [int(c) for c in args.clients.split(',')]
+
+    with tempfile.TemporaryDirectory(prefix='iotsync-load-') as work_dir:
+        process = None
+        base_url = args.url
+        report = {'slos': slos, 'max_error_rate': args.max_error_rate, 'steps': []}
+        try:
+            if base_url is None:
+                db_path = args.db
+                if db_path is None:
+                    db_path = Path(work_dir) / 'load.db'
+                    report['dataset'] = generate(db_path, args.days, args.devices, args.interval,
+                                                 args.alerts_per_day, args.seed)
+                process = launch_api(db_path, args.port, args.workers)
+                base_url = f'http://127.0.0.1:{args.port}'
+            report['url'] = base_url
+
+            for clients in client_steps:
+                recorder, elapsed = asyncio.run(run_step(
+                    base_url, clients, args.duration, args.ramp,
+                    args.poll_interval, args.range_change_rate, args.load_seed
+                ))
+                step = {'clients': clients, 'duration_s': round(elapsed, 2)}
+                step.update(recorder.report(elapsed, slos, args.max_error_rate))
+                report['steps'].append(step)
+                current = step['endpoints'].get('current', {})
+                print(f"{clients:5d} clients: {step['throughput_rps']:8.1f} req/s, "
+                      f"current p95 {current.get('p95_ms', 0):.1f}ms p99 {current.get('p99_ms', 0):.1f}ms, "
+                      f"errors {step['error_rate']:.2%}"
+                      + ('' if step['slo_met'] else f"  SLO: {'; '.join(step['slo_violations'])}"),
+                      file=sys.stderr)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(10)
+
+    # The largest step before the first one that missed an SLO
+    report['max_clients_within_slo'] = None
+    for step in report['steps']:
+        if not step['slo_met']:
+            break
+        report['max_clients_within_slo'] = step['clients']
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+    if not all(step['slo_met'] for step in report['steps']):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
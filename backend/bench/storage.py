@@ -0,0 +1,267 @@
+import sys
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+from config import Config
+from device_registry import DEFAULT_CHANNELS
+from bench.dataset import add_dataset_arguments, generate
+
+HISTORY_RANGES = ('day', 'week', 'month', 'year')
+
+# What app.js asks for: roughly one point per chart pixel
+DASHBOARD_POINTS = 1000
+
+def summarize(samples_ms):
+    """Latency statistics for a list of per-call timings in milliseconds."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        'calls': len(samples),
+        'min_ms': round(float(samples.min()), 4),
+        'median_ms': round(float(np.median(samples)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'p99_ms': round(float(np.percentile(samples, 99)), 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        'ops_per_s': round(1000 / float(samples.mean()), 1),
+    }
+
+def measure(fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+class AsgiClient:
+    """Minimal in-process GET client, so endpoint timings include routing and
+    middleware but no sockets."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    async def _get(self, url):
+        parts = urlsplit(url)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'root_path': '',
+            'path': parts.path, 'raw_path': parts.path.encode(),
+            'query_string': parts.query.encode(),
+            'headers': [(b'host', b'bench')],
+            'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+        }
+        response = {'status': None, 'body': bytearray()}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['body'] += message.get('body', b'')
+
+        await self.app(scope, receive, send)
+        return response
+
+    def get(self, url):
+        response = self.loop.run_until_complete(self._get(url))
+        if response['status'] != 200:
+            raise RuntimeError(f"GET {url} returned {response['status']}")
+        return response['body']
+
+    def close(self):
+        self.loop.close()
+
+def _device_status(i):
+    """A Tuya device status with every default channel populated."""
+    values = {
+        'indoor_temp': 220 + i % 7, 'indoor_humidity': 50,
+        'pool_temp': 300 + i % 11, 'outdoor_ch1_temp': 150, 'outdoor_ch1_humidity': 60,
+        'outdoor_ch2_temp': 140, 'outdoor_ch2_humidity': 61,
+        'outdoor_ch3_temp': 300 + i % 11, 'outdoor_ch3_humidity': 62,
+        'atmospheric_pressure': 1013, 'pressure_units': 'hpa',
+    }
+    return {'properties': [
+        {'code': DEFAULT_CHANNELS[name], 'value': value}
+        for name, value in values.items() if name in DEFAULT_CHANNELS
+    ]}
+
+def bench_reads(db_handler, client, repeat):
+    results = {
+        'latest_reading': measure(db_handler.get_latest_reading, repeat),
+        'api_current': measure(lambda: client.get('/api/temperature/current'), repeat),
+        'api_stats': measure(lambda: client.get('/api/temperature/stats'), repeat),
+        'api_alerts_recent': measure(lambda: client.get('/api/alerts/recent'), repeat),
+    }
+    for timerange in HISTORY_RANGES:
+        url = f'/api/temperature/history?timerange={timerange}'
+        results[f'history_{timerange}'] = measure(lambda: client.get(url), repeat)
+        results[f'history_{timerange}']['bytes'] = len(client.get(url))
+        dashboard_url = f'{url}&points={DASHBOARD_POINTS}&format=columnar'
+        results[f'history_{timerange}_dashboard'] = measure(lambda: client.get(dashboard_url), repeat)
+        results[f'history_{timerange}_dashboard']['bytes'] = len(client.get(dashboard_url))
+    return results
+
+def bench_ingest(db_handler, rows, spool_dir):
+    """store_reading() with one transaction per reading, then the group-commit path."""
+    from write_buffer import WriteBuffer
+
+    statuses = [_device_status(i) for i in range(rows)]
+    samples = []
+    for status in statuses:
+        started = time.perf_counter()
+        db_handler.store_reading(status)
+        samples.append((time.perf_counter() - started) * 1000)
+    results = {'ingest_single': summarize(samples)}
+
+    # Rows are queued like the collector does and committed by one flush
+    buffer = WriteBuffer(db_handler, max_rows=rows + 1, max_delay=3600,
+                         spool_path=Path(spool_dir) / 'bench_spool.jsonl')
+    db_handler.write_buffer = buffer
+    try:
+        started = time.perf_counter()
+        for status in statuses:
+            db_handler.store_reading(status)
+        buffer.flush()
+        elapsed = time.perf_counter() - started
+    finally:
+        db_handler.write_buffer = None
+        buffer.close()
+    results['ingest_buffered'] = {
+        'rows': rows,
+        'total_ms': round(elapsed * 1000, 3),
+        'rows_per_s': round(rows / elapsed, 1),
+    }
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=Config.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _table_counts(db_path):
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('sensor_readings', 'temperature_alerts',
+                              'rollup_minute', 'rollup_hour', 'rollup_day')}
+    finally:
+        conn.close()
+
+def copy_database(source, target):
+    """Consistent copy of source (including its WAL) via the SQLite backup API."""
+    src = sqlite3.connect(f"{Path(source).resolve().as_uri()}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def run(db_path, repeat=50, ingest_rows=500, work_dir=None, source=None):
+    """Run every benchmark against db_path; returns the results document.
+
+    The ingestion benchmark writes to db_path, so it must be a bench copy,
+    never a live database; `source` is recorded as the dataset's origin.
+    """
+    Config.DB_FILE = Path(db_path)
+    meta = {
+        'commit': _git_commit(),
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'db': str(source or db_path),
+        'db_bytes': Path(db_path).stat().st_size,
+        'tables': _table_counts(db_path),
+        'repeat': repeat,
+    }
+
+    # api builds its connections from Config.DB_FILE on import
+    import api
+    from db_handler import DatabaseHandler
+    db_handler = DatabaseHandler()
+    client = AsgiClient(api.app)
+    try:
+        results = bench_reads(db_handler, client, repeat)
+        # Writes last, so the read numbers describe the dataset as generated
+        results.update(bench_ingest(db_handler, ingest_rows, work_dir or Path(db_path).parent))
+    finally:
+        client.close()
+        api.db.close()
+    return {'meta': meta, 'results': results}
+
+def compare(baseline, current, threshold):
+    """Print median changes against a baseline; returns the regressed benchmark names."""
+    regressions = []
+    print(f"{'benchmark':34} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        key = 'median_ms' if 'median_ms' in result else 'total_ms'
+        if not before or key not in before:
+            continue
+        change = (result[key] - before[key]) / before[key] if before[key] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:34} {before[key]:>10.3f}ms {result[key]:>10.3f}ms {change:>+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time IoTsync ingestion and query paths")
+    parser.add_argument('--db', help="existing database to benchmark, copied first and never modified "
+                                     "(default: generate a temporary one)")
+    add_dataset_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=50, help="timed calls per read benchmark")
+    parser.add_argument('--ingest-rows', type=int, default=500)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', help="baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative median slowdown reported as a regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format=Config.LOG_FORMAT)
+    with tempfile.TemporaryDirectory(prefix='iotsync-bench-') as work_dir:
+        db_path = Path(work_dir) / 'bench.db'
+        dataset = None
+        if args.db is None:
+            dataset = generate(db_path, args.days, args.devices, args.interval,
+                               args.alerts_per_day, args.seed)
+        else:
+            # The ingestion phase appends readings and rollups; keep them out of the given database
+            copy_database(args.db, db_path)
+        document = run(db_path, args.repeat, args.ingest_rows, work_dir, source=args.db)
+        if dataset:
+            document['meta']['dataset'] = dataset
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(baseline, document, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import time
+import asyncio
+import logging
+from config import Config
+from metrics import REGISTRY
+
+CYCLE_SECONDS = REGISTRY.histogram(
+    'iotsync_collection_cycle_seconds', 'Time to collect from every device once',
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+COLLECTION_RETRIES = REGISTRY.counter(
+    'iotsync_collection_retries_total', 'Device collections retried after a failure'
+)
+COLLECTION_FAILURES = REGISTRY.counter(
+    'iotsync_collection_failures_total', 'Devices that failed every attempt in a cycle'
+)
+
+class DeviceState:
+    """Retry bookkeeping for one device, kept across collection cycles."""
+
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.last_success = None
+        self.last_error = None
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.last_success = time.time()
+        self.last_error = None
+
+    def record_failure(self, error):
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+
+class CollectionEngine:
+    """Poll every registered device concurrently.
+
+    TuyaClient is blocking, so each request runs on a worker thread while an
+    asyncio semaphore caps how many devices are in flight at once. All
+    devices share the client's token; a device whose request is rejected
+    forces one token refresh that the others then reuse. Retries are per
+    device, so one unreachable sensor only delays itself.
+
+    on_reading(device, device_status) runs after each stored reading and
+    on_batch([(device, values), ...]) once per cycle with the column values
+    of every reading stored in it.
+    """
+
+    def __init__(self, tuya_client, db_handler, devices, on_reading=None, on_batch=None):
+        self.tuya_client = tuya_client
+        self.db_handler = db_handler
+        self.devices = devices
+        self.on_reading = on_reading
+        self.on_batch = on_batch
+        self.concurrency = Config.COLLECTION_CONCURRENCY
+        self.max_retries = Config.MAX_RETRIES
+        self.retry_delay = Config.RETRY_DELAY
+        self.states = {device.device_id: DeviceState() for device in devices}
+        self.logger = logging.getLogger('IoTsync.engine')
+
+    async def _collect_device(self, device, semaphore):
+        state = self.states[device.device_id]
+        for attempt in range(self.max_retries):
+            token = self.tuya_client.token_info
+            try:
+                async with semaphore:
+                    device_status = await asyncio.to_thread(
+                        self.tuya_client.get_device_status, device.device_id
+                    )
+                    values = await asyncio.to_thread(
+                        self.db_handler.store_reading,
+                        device_status, device.device_id, device.channels
+                    )
+            except Exception as e:
+                state.record_failure(e)
+                self.logger.error(
+                    f"Error collecting {device.name} (Attempt {attempt + 1}/{self.max_retries}): {str(e)}",
+                    exc_info=True
+                )
+                # Refresh the shared token once, unless another device already did
+                try:
+                    await asyncio.to_thread(self.tuya_client.ensure_token, token)
+                except Exception as token_error:
+                    self.logger.error(f"Token refresh failed: {token_error}")
+
+                if attempt < self.max_retries - 1:
+                    COLLECTION_RETRIES.inc()
+                    retry_wait = self.retry_delay * (attempt + 1)
+                    self.logger.info(f"Retrying {device.name} in {retry_wait} seconds...")
+                    await asyncio.sleep(retry_wait)
+                continue
+
+            state.record_success()
+            self.logger.debug("Device status for %s: %s", device.name, device_status)
+            if self.on_reading:
+                # The reading is stored; a failing handler must not trigger a re-fetch
+                try:
+                    await asyncio.to_thread(self.on_reading, device, device_status)
+                except Exception as e:
+                    self.logger.error(f"Reading handler failed for {device.name}: {e}", exc_info=True)
+            return values
+        COLLECTION_FAILURES.inc()
+        return None
+
+    async def collect_all(self, devices=None):
+        """Collect from every device (or the given ones) once; returns {device_id: succeeded}."""
+        devices = self.devices if devices is None else devices
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            self._collect_device(device, semaphore) for device in devices
+        ))
+        CYCLE_SECONDS.observe(time.perf_counter() - started)
+        stored = [(device, values) for device, values in zip(devices, results) if values is not None]
+        if self.on_batch and stored:
+            try:
+                await asyncio.to_thread(self.on_batch, stored)
+            except Exception as e:
+                self.logger.error(f"Batch handler failed: {e}", exc_info=True)
+        return {device.device_id: values is not None for device, values in zip(devices, results)}
+
+    def run_cycle(self, devices=None):
+        """Blocking entry point for the synchronous collector loop."""
+        return asyncio.run(self.collect_all(devices))
@@ -0,0 +1,192 @@
+import zlib
+import heapq
+import time
+import logging
+import threading
+from config import Config
+from metrics import REGISTRY
+
+INTERVAL_SECONDS = REGISTRY.gauge(
+    'iotsync_collection_interval_seconds', 'Current polling interval per device', ['device']
+)
+CADENCE_SECONDS = REGISTRY.histogram(
+    'iotsync_collection_cadence_seconds', 'Time between successive collections of a device',
+    buckets=(60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 7200)
+)
+LATENESS_SECONDS = REGISTRY.histogram(
+    'iotsync_collection_lateness_seconds', 'Collection start time past its deadline',
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+MISSED_SLOTS = REGISTRY.counter(
+    'iotsync_collection_missed_total', 'Collection slots skipped because a cycle overran'
+)
+
+# Devices due within this many seconds of each other share one cycle
+BATCH_WINDOW = 1.0
+
+class AdaptiveInterval:
+    """Per-device polling interval driven by the device's alert rules.
+
+    After each reading a device is polled at COLLECTION_MIN_INTERVAL when a
+    watched value is within COLLECTION_NEAR_MARGIN (rule units) of a
+    threshold, is heading for one fast enough to cross it within the base
+    interval, or a rate rule's channel is changing at half its limit or
+    more. When every watched value is far from its threshold and not
+    approaching it within COLLECTION_MAX_INTERVAL, the interval grows 1.5x
+    per reading up to COLLECTION_MAX_INTERVAL. Otherwise it is
+    COLLECTION_INTERVAL. Devices without rules always use the base.
+    """
+
+    def __init__(self, rules=(), base=None, minimum=None, maximum=None, margin=None, adaptive=None):
+        self.rules = list(rules)
+        self.base = base or Config.COLLECTION_INTERVAL
+        self.minimum = min(minimum or Config.COLLECTION_MIN_INTERVAL, self.base)
+        self.maximum = max(maximum or Config.COLLECTION_MAX_INTERVAL, self.base)
+        self.margin = Config.COLLECTION_NEAR_MARGIN if margin is None else margin
+        self.adaptive = Config.COLLECTION_ADAPTIVE if adaptive is None else adaptive
+        self._intervals = {}
+        self._previous = {}
+
+    def interval(self, device_id):
+        return self._intervals.get(device_id, self.base)
+
+    def _assess(self, rules, ts, values, previous):
+        """(urgent, calm) for one reading."""
+        urgent, calm = False, True
+        for rule in rules:
+            value = values.get(rule.channel)
+            if value is None:
+                continue
+            rate = None  # units per second
+            if previous is not None and previous[1].get(rule.channel) is not None and ts > previous[0]:
+                rate = (value - previous[1][rule.channel]) / (ts - previous[0])
+
+            if rule.kind == 'rate':
+                # Rate thresholds are per minute and may be negative (falling fast)
+                if rate is not None and abs(rate) * 60 >= abs(rule.threshold) / 2:
+                    urgent = True
+                continue
+
+            distance = value - rule.threshold
+            approaching = rate is not None and rate * distance < 0
+            time_to_cross = abs(distance / rate) if approaching else float('inf')
+            if abs(distance) <= self.margin or time_to_cross <= self.base:
+                urgent = True
+            if abs(distance) <= 2 * self.margin or time_to_cross <= self.maximum:
+                calm = False
+        return urgent, calm
+
+    def observe(self, device_id, ts, values):
+        """Update the device's interval from a new reading; returns the interval."""
+        previous = self._previous.get(device_id)
+        self._previous[device_id] = (ts, values)
+        rules = [r for r in self.rules if r.devices is None or device_id in r.devices]
+        if not self.adaptive or not rules:
+            interval = self.base
+        else:
+            urgent, calm = self._assess(rules, ts, values, previous)
+            if urgent:
+                interval = self.minimum
+            elif calm:
+                interval = min(max(self.interval(device_id) * 1.5, self.base), self.maximum)
+            else:
+                interval = self.base
+        self._intervals[device_id] = interval
+        INTERVAL_SECONDS.set(interval, device=device_id)
+        return interval
+
+class CollectionScheduler:
+    """Event-driven per-device polling on monotonic deadlines.
+
+    Each device has its own deadline in a heap. The loop sleeps on an Event
+    until the earliest one, so it only wakes when there is work, and
+    collects every device due within BATCH_WINDOW in one cycle. The next
+    deadline is the previous deadline plus the device's current interval,
+    never "now plus interval", so slow cycles and retries do not push the
+    schedule out; slots a long cycle overran are skipped, not replayed.
+    A fixed per-device offset (a hash of the device id, up to
+    COLLECTION_JITTER of the base interval) spreads devices over the
+    interval instead of polling them all at once.
+
+    collect(devices) runs one collection for the given devices; clock
+    (time.monotonic by default) is what deadlines are measured on.
+    """
+
+    def __init__(self, devices, collect, policy=None, jitter=None, clock=None):
+        self.devices = {device.device_id: device for device in devices}
+        self.collect = collect
+        self.policy = policy or AdaptiveInterval()
+        self.jitter = Config.COLLECTION_JITTER if jitter is None else jitter
+        self.clock = clock or time.monotonic
+        self.logger = logging.getLogger('IoTsync.scheduler')
+        self._heap = []
+        self._last_started = {}
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def offset(self, device_id):
+        return zlib.crc32(device_id.encode()) / 2 ** 32 * self.jitter * self.policy.base
+
+    def start(self, now=None):
+        """Schedule every device one interval (plus its offset) from now."""
+        now = self.clock() if now is None else now
+        self._heap = [
+            (now + self.policy.interval(device_id) + self.offset(device_id), device_id)
+            for device_id in self.devices
+        ]
+        heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now=None):
+        """Collect every device that is due; returns their ids."""
+        now = self.clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now + BATCH_WINDOW:
+            due.append(heapq.heappop(self._heap))
+        if not due:
+            return []
+
+        started = self.clock()
+        for deadline, device_id in due:
+            LATENESS_SECONDS.observe(max(started - deadline, 0))
+            if device_id in self._last_started:
+                CADENCE_SECONDS.observe(started - self._last_started[device_id])
+            self._last_started[device_id] = started
+        try:
+            self.collect([self.devices[device_id] for _, device_id in due])
+        except Exception as e:
+            self.logger.error(f"Collection cycle failed: {e}", exc_info=True)
+
+        finished = self.clock()
+        for deadline, device_id in due:
+            interval = self.policy.interval(device_id)
+            deadline += interval
+            if deadline <= finished:
+                missed = int((finished - deadline) // interval) + 1
+                MISSED_SLOTS.inc(missed)
+                self.logger.warning(f"Collection of {device_id} overran, skipping {missed} slot(s)")
+                deadline += missed * interval
+            heapq.heappush(self._heap, (deadline, device_id))
+        return [device_id for _, device_id in due]
+
+    def run(self):
+        """Block, collecting devices as they come due, until stop()."""
+        if not self._heap:
+            self.start()
+        while not self._stopping:
+            if not self._heap:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            timeout = self.next_deadline() - self.clock()
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue
+            self.run_due()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
@@ -14,29 +14,100 @@ class Config:
     # Server Configuration
     API_PORT = int(os.getenv('API_PORT', '8000'))
     FRONTEND_PORT = int(os.getenv('FRONTEND_PORT', '3000'))
+    API_DB_CONCURRENCY = int(os.getenv('API_DB_CONCURRENCY', '4'))  # concurrent API queries
+    SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '60'))  # seconds before cached stats roll forward
+    HTTP_CACHE_CONTROL = os.getenv('HTTP_CACHE_CONTROL', 'public, no-cache')  # revalidate with ETag every time
+    GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '1024'))  # bytes
+    HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', '5000'))  # upper bound for ?points=
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))  # rows per streamed chunk
+    EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '2'))  # simultaneous /api/readings/export
+    
+    # Live reading stream (Server-Sent Events)
+    STREAM_POLL_INTERVAL = float(os.getenv('STREAM_POLL_INTERVAL', '2'))  # seconds between change checks
+    STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '8'))  # pending events per client
+    STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))  # seconds
+    STREAM_RETRY_MS = int(os.getenv('STREAM_RETRY_MS', '5000'))  # client reconnect delay
     
     # Ensure directories exist
     DATA_DIR.mkdir(exist_ok=True)
     LOG_DIR.mkdir(exist_ok=True)
     
     # Database
-    DB_FILE = DATA_DIR / 'iotsync.db'
-    
+    DB_FILE = Path(os.getenv('DB_FILE', DATA_DIR / 'iotsync.db'))
+    DB_READER_POOL_SIZE = int(os.getenv('DB_READER_POOL_SIZE', '4'))
+    DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+    DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '128'))
+    DB_MIGRATION_CHUNK_SIZE = int(os.getenv('DB_MIGRATION_CHUNK_SIZE', '5000'))
+    DB_MIGRATION_PAUSE = float(os.getenv('DB_MIGRATION_PAUSE', '0.05'))  # seconds between chunks
+    DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '0'))  # log statements slower than this, 0 disables
+    # Retention (0 keeps data forever); rollup_day is never pruned
+    RETENTION_RAW_DAYS = float(os.getenv('RETENTION_RAW_DAYS', '90'))
+    RETENTION_MINUTE_DAYS = float(os.getenv('RETENTION_MINUTE_DAYS', '35'))
+    RETENTION_HOUR_DAYS = float(os.getenv('RETENTION_HOUR_DAYS', '400'))
+    RETENTION_OUTBOX_DAYS = float(os.getenv('RETENTION_OUTBOX_DAYS', '30'))
+    RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', str(24 * 60 * 60)))  # seconds between runs
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '2000'))  # rows per delete transaction
+    RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '1000'))  # pages per incremental_vacuum step
+    ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'  # export to .npy before pruning
+    ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', DATA_DIR / 'archive'))
+    ARCHIVE_CHUNK_ROWS = int(os.getenv('ARCHIVE_CHUNK_ROWS', '100000'))  # rows read per export step
+    ARCHIVE_COMPACT_CHUNKS = int(os.getenv('ARCHIVE_COMPACT_CHUNKS', '16'))  # chunks per month before merging
+    WRITE_BUFFER_ENABLED = os.getenv('WRITE_BUFFER_ENABLED', 'true').lower() == 'true'  # group-commit readings
+    WRITE_BUFFER_MAX_ROWS = int(os.getenv('WRITE_BUFFER_MAX_ROWS', '200'))  # flush once this many are queued
+    WRITE_BUFFER_MAX_DELAY = float(os.getenv('WRITE_BUFFER_MAX_DELAY', '1.0'))  # seconds a reading may wait
+    WRITE_SPOOL_FILE = DATA_DIR / 'write_spool.jsonl'  # readings held while the database is unavailable
+
     # Tuya API Configuration
     TUYA_BASE_URL = os.getenv('VITE_TUYABASEURL', 'https://openapi.tuyaus.com').rstrip('/')
     TUYA_ACCESS_KEY = os.getenv('VITE_ACCESSKEY')
     TUYA_SECRET_KEY = os.getenv('VITE_SECRETKEY')
     TUYA_USER_ID = os.getenv('VITE_TUYAUSERID')
+    TUYA_CLOCK_SYNC_INTERVAL = int(os.getenv('TUYA_CLOCK_SYNC_INTERVAL', '3600'))  # seconds between /v1.0/time calls
+    TUYA_REQUEST_TIMEOUT = float(os.getenv('TUYA_REQUEST_TIMEOUT', '10'))  # seconds
     DEVICE_ID = os.getenv('DEVICE_ID')
+    DEVICE_IDS = [d.strip() for d in os.getenv('DEVICE_IDS', '').split(',') if d.strip()]
+    DEVICES_FILE = Path(os.getenv('DEVICES_FILE', BASE_DIR / 'devices.json'))
+    DASHBOARD_DEVICE_ID = os.getenv('DASHBOARD_DEVICE_ID')
+    # Device shown on the dashboard and watched by the default pool rule;
+    # device_registry.resolve_default_device() checks it against the registry
+    DEFAULT_DEVICE_ID = DASHBOARD_DEVICE_ID or DEVICE_ID or (DEVICE_IDS[0] if DEVICE_IDS else 'default')
     
     # Data Collection Settings
-    COLLECTION_INTERVAL = 30*60  # seconds
+    COLLECTION_INTERVAL = int(os.getenv('COLLECTION_INTERVAL', str(30*60)))  # seconds, base polling interval
+    COLLECTION_MIN_INTERVAL = int(os.getenv('COLLECTION_MIN_INTERVAL', str(5*60)))  # near a threshold or changing fast
+    COLLECTION_MAX_INTERVAL = int(os.getenv('COLLECTION_MAX_INTERVAL', str(60*60)))  # while readings are stable
+    COLLECTION_ADAPTIVE = os.getenv('COLLECTION_ADAPTIVE', 'true').lower() == 'true'
+    COLLECTION_NEAR_MARGIN = float(os.getenv('COLLECTION_NEAR_MARGIN', '2.0'))  # alert rule units
+    COLLECTION_JITTER = float(os.getenv('COLLECTION_JITTER', '0.1'))  # per-device offset, fraction of the interval
     MAX_RETRIES = 3
     RETRY_DELAY = 5  # seconds
+    COLLECTION_CONCURRENCY = int(os.getenv('COLLECTION_CONCURRENCY', '8'))  # devices polled at once
+    
+    # Push ingestion (Tuya message service) instead of interval polling
+    INGESTION_MODE = os.getenv('INGESTION_MODE', 'poll')  # 'poll' or 'push'
+    TUYA_MQ_URL = os.getenv('TUYA_MQ_URL', 'wss://mqe.tuyaus.com:8285/')
+    TUYA_MQ_ENV = os.getenv('TUYA_MQ_ENV', 'event')  # 'event-test' for the test channel
+    INGEST_BATCH_WINDOW = float(os.getenv('INGEST_BATCH_WINDOW', '1.0'))  # seconds
+    INGEST_BATCH_MAX = int(os.getenv('INGEST_BATCH_MAX', '100'))  # messages
     
     # Alert Configuration
     ALERT_MIN_POOL_TEMP_F = 103.0
     ALERT_INTERVAL = 30  # minutes
+    STALE_DATA_MAX_AGE = float(os.getenv('STALE_DATA_MAX_AGE', str(8 * 60 * 60)))  # seconds without a reading
+    WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', '60'))  # seconds between staleness checks
+    WATERMARK_FILE = DATA_DIR / 'watermark.json'
+    ALERT_RULES_FILE = Path(os.getenv('ALERT_RULES_FILE', BASE_DIR / 'alert_rules.json'))
+    
+    # Notification delivery (outbox + background dispatcher)
+    NOTIFICATION_PROVIDER = os.getenv('NOTIFICATION_PROVIDER', 'auto')  # 'auto', 'log' or 'stub'
+    NOTIFY_POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL', '5'))  # seconds between outbox checks
+    NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', '20'))
+    NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '8'))
+    NOTIFY_RETRY_BASE = float(os.getenv('NOTIFY_RETRY_BASE', '30'))  # seconds, doubled per attempt
+    NOTIFY_RETRY_MAX = float(os.getenv('NOTIFY_RETRY_MAX', '3600'))  # seconds
     
     # Email Configuration
     SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
@@ -50,10 +121,25 @@ class Config:
     ALERT_PHONE_NUMBER = os.getenv('ALERT_PHONE_NUMBER')
     
     # Logging Configuration
-    LOG_LEVEL = 'DEBUG'
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_LEVELS = dict(  # per-component overrides, e.g. "tuya=DEBUG,db=WARNING"
+        (part.split('=', 1)[0].strip(), part.split('=', 1)[1].strip())
+        for part in os.getenv('LOG_LEVELS', '').split(',') if '=' in part
+    )
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
-    CONSOLE_LOG_LEVEL = 'INFO'
+    CONSOLE_LOG_LEVEL = os.getenv('CONSOLE_LOG_LEVEL', 'INFO').upper()
+    LOG_DEBUG_SAMPLE_RATE = int(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))  # keep 1 in N debug records per call site
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # records buffered before dropping
+    
+    # Metrics (/metrics); the collector publishes its registry to a file the API reads
+    METRICS_FILE = DATA_DIR / 'collector_metrics.json'
+    METRICS_PUBLISH_INTERVAL = float(os.getenv('METRICS_PUBLISH_INTERVAL', '15'))  # seconds
+    
+    # Profiling: Server-Timing headers on API responses, SIGUSR2 toggles a sampling profiler
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+    PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.005'))  # seconds between stack samples
+    PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', '300'))  # stops by itself after this
     
     @classmethod
     def validate(cls):
@@ -61,7 +147,7 @@ class Config:
         required = {
             'TUYA_ACCESS_KEY': cls.TUYA_ACCESS_KEY,
             'TUYA_SECRET_KEY': cls.TUYA_SECRET_KEY,
-            'DEVICE_ID': cls.DEVICE_ID,
+            'DEVICE_ID': cls.DEVICE_ID or cls.DEVICE_IDS or cls.DEVICES_FILE.exists(),
         }
         
         missing = [k for k, v in required.items() if not v]
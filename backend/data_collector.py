@@ -1,103 +1,150 @@
 import time
-import schedule
-import random
 import logging
 from datetime import datetime
 from tuya_device_data import TuyaClient
 from db_handler import DatabaseHandler
-from pathlib import Path
 from alert_manager import AlertManager
+from collection_engine import CollectionEngine
+from collection_scheduler import AdaptiveInterval, CollectionScheduler
+from device_registry import load_devices, resolve_default_device
+from message_ingest import MessageIngestor, PulsarWebSocketTransport
+from logging_setup import setup_logging
+from notifications import NotificationDispatcher
+from watermark import IngestionWatermark, StalenessWatchdog
+from retention import RetentionJob
+from metrics import REGISTRY, MetricsPublisher
+from profiling import install_profiler_toggle
 from config import Config
 
 class DataCollector:
     def __init__(self):
         self.setup_logging()
+        # Before anything reads Config.DEFAULT_DEVICE_ID (db handler, default alert rule)
+        self.devices = load_devices()
+        resolve_default_device(self.devices)
         self.tuya_client = TuyaClient()
-        self.db_handler = DatabaseHandler()
-        self.alert_manager = AlertManager()
-        self.max_retries = Config.MAX_RETRIES
-        self.retry_delay = Config.RETRY_DELAY
+        self.db_handler = DatabaseHandler(buffered=Config.WRITE_BUFFER_ENABLED)
+        # Alerts go to the outbox; delivery happens on the dispatcher thread
+        self.dispatcher = NotificationDispatcher()
+        self.alert_manager = AlertManager(self.dispatcher)
         self.collection_interval = Config.COLLECTION_INTERVAL
         self.logger = logging.getLogger('IoTsync')
-
-    def setup_logging(self):
-        # Create logs directory if it doesn't exist
-        Config.LOG_DIR.mkdir(exist_ok=True)
-        
-        # Configure logging
-        logger = logging.getLogger('IoTsync')
-        logger.setLevel(getattr(logging, Config.LOG_LEVEL))
         
-        # File handler for all logs
-        file_handler = logging.FileHandler(
-            Config.LOG_DIR / f'iotsync_{datetime.now().strftime("%Y%m%d")}.log'
+        # Last reading per device, watched on a timer independent of collection
+        self.watermark = IngestionWatermark(db_handler=self.db_handler)
+        self.watchdog = StalenessWatchdog(
+            self.watermark,
+            [device.device_id for device in self.devices],
+            on_stale=self.alert_manager.data_stale,
+            on_restored=self.alert_manager.data_restored
         )
-        file_handler.setLevel(getattr(logging, Config.LOG_LEVEL))
-        file_format = logging.Formatter(Config.LOG_FORMAT, datefmt=Config.LOG_DATE_FORMAT)
-        file_handler.setFormatter(file_format)
-        logger.addHandler(file_handler)
         
-        # Console handler for INFO and above
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_format = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
+        # Daily pruning and incremental vacuum on its own thread
+        self.retention = RetentionJob(self.db_handler)
+        # Metrics reach the API process through a snapshot file
+        self.metrics_publisher = MetricsPublisher(before_publish=self.sample_metrics)
+        # `kill -USR2 <pid>` starts/stops a sampling profiler writing to LOG_DIR
+        self.profiler = install_profiler_toggle('iotsync')
+        self.engine = CollectionEngine(
+            self.tuya_client,
+            self.db_handler,
+            self.devices,
+            on_reading=self.handle_reading,
+            on_batch=self.handle_batch
+        )
+        # Per-device deadlines; devices near an alert threshold are polled more often
+        self.scheduler = CollectionScheduler(
+            self.devices,
+            self.collect_devices,
+            AdaptiveInterval(self.alert_manager.rules)
         )
-        console_handler.setFormatter(console_format)
-        logger.addHandler(console_handler)
         
-        # Prevent logs from propagating to the root logger
-        logger.propagate = False
+        # Push mode stores readings from Tuya property-change messages instead of polling
+        self.ingestor = None
+        if Config.INGESTION_MODE == 'push':
+            self.ingestor = MessageIngestor(
+                PulsarWebSocketTransport(),
+                self.db_handler,
+                self.devices,
+                on_reading=self.handle_reading,
+                on_batch=self.handle_batch
+            )
+
+    def setup_logging(self):
+        # Queue-backed file and console logging, see logging_setup
+        setup_logging('iotsync')
+
+    def handle_reading(self, device, device_status):
+        """Keep push ingestion's property state in step with polled readings."""
+        if self.ingestor:
+            # Messages only carry changed properties, start from the full status
+            self.ingestor.seed(device.device_id, device_status)
+
+    def handle_batch(self, readings):
+        """Run the alert rules over every reading stored in one cycle or message batch."""
+        now = time.time()
+        for device, values in readings:
+            self.watermark.mark(device.device_id, now)
+            self.scheduler.policy.observe(device.device_id, now, values)
+        self.alert_manager.evaluate_batch([
+            (device.device_id, now, values) for device, values in readings
+        ])
+
+    def sample_metrics(self):
+        """Refresh the gauges that are read from component state before each publish."""
+        if self.db_handler.write_buffer is not None:
+            for key, value in self.db_handler.write_buffer.stats().items():
+                REGISTRY.gauge(f'iotsync_write_buffer_{key}', f'WriteBuffer.stats() {key}').set(float(value))
+        if self.retention.last_report:
+            for key, value in self.retention.last_report.items():
+                REGISTRY.gauge(f'iotsync_retention_last_{key}', f'Last retention run {key}').set(value)
+        REGISTRY.gauge(
+            'iotsync_notification_outbox_pending', 'Notifications waiting for delivery'
+        ).set(self.dispatcher.outbox.pending_count())
 
     def collect_data_with_retry(self):
-        for attempt in range(self.max_retries):
-            try:
-                # Get device status first, only refresh token if needed
-                try:
-                    device_status = self.tuya_client.get_device_status()
-                except Exception as e:
-                    self.logger.debug(f"Failed to get device status: {str(e)}, refreshing token...")
-                    self.tuya_client.connect()
-                    device_status = self.tuya_client.get_device_status()
-                
-                # Store the reading
-                self.db_handler.store_reading(device_status)
-                self.logger.info(f"Data collected successfully at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                # Log detailed device status at debug level
-                self.logger.debug(f"Device status: {device_status}")
-                
-                # Get pool temperature after storing reading
-                properties = {prop['code']: prop['value'] for prop in device_status.get('properties', [])}
-                pool_temp_c = self.db_handler.format_temperature(properties.get('ToutCh3'))
-                if pool_temp_c is not None:
-                    pool_temp_f = self.db_handler.celsius_to_fahrenheit(pool_temp_c)
-                    # Check temperature and send alerts if needed
-                    self.alert_manager.check_temperature(pool_temp_f)
-                
-                return True
-                
-            except Exception as e:
-                self.logger.error(
-                    f"Error collecting data (Attempt {attempt + 1}/{self.max_retries}): {str(e)}",
-                    exc_info=True
-                )
-                # Reset token info on any error
-                self.tuya_client.token_info = None
-                
-                if attempt < self.max_retries - 1:
-                    retry_wait = self.retry_delay * (attempt + 1)
-                    self.logger.info(f"Retrying in {retry_wait} seconds...")
-                    time.sleep(retry_wait)
+        """Collect from every device concurrently; True if any device succeeded."""
+        if not self.devices:
+            self.logger.error("No devices configured, set DEVICE_ID, DEVICE_IDS or DEVICES_FILE")
+            return False
         
-        return False
+        results = self.engine.run_cycle()
+        succeeded = sum(results.values())
+        self.logger.info(
+            f"Data collected from {succeeded}/{len(results)} devices at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        return succeeded > 0
+
+    def collect_devices(self, devices):
+        """Collect from the devices the scheduler found due."""
+        results = self.engine.run_cycle(devices)
+        succeeded = sum(results.values())
+        self.logger.info(f"Data collected from {succeeded}/{len(results)} due devices")
+        return succeeded > 0
 
     def start(self):
         self.logger.info("Starting data collection service...")
-        self.logger.info(f"Collection interval: {self.collection_interval} seconds")
+        self.logger.info(
+            f"Collection interval: {self.collection_interval} seconds"
+            + (f" (adaptive {Config.COLLECTION_MIN_INTERVAL}-{Config.COLLECTION_MAX_INTERVAL}s)"
+               if Config.COLLECTION_ADAPTIVE else "")
+        )
         self.logger.info("Press Ctrl+C to stop")
         
+        self.dispatcher.start()
+        self.watchdog.start()
+        self.retention.start()
+        self.metrics_publisher.start()
+        try:
+            self._run()
+        finally:
+            self.metrics_publisher.stop()
+            self.retention.stop()
+            self.watchdog.stop()
+            self.dispatcher.stop()
+            self.db_handler.close()
+
+    def _run(self):
         while True:
             try:
                 # Initial connection
@@ -114,17 +161,20 @@ class DataCollector:
                 self.logger.error(f"Fatal error during initialization: {str(e)}", exc_info=True)
                 time.sleep(10)
 
+        if self.ingestor:
+            self.logger.info("Ingestion mode: push, consuming Tuya property-change messages")
+            try:
+                self.ingestor.run()
+            except KeyboardInterrupt:
+                self.logger.info("Stopping data collection service...")
+            return
+
         try:
-            # Schedule the job to run every 55 seconds instead of every minute
-            schedule.every(self.collection_interval).seconds.do(self.collect_data_with_retry)
-            
-            # Keep the script running
-            while True:
-                schedule.run_pending()
-                time.sleep(1)
-                
+            # Sleeps until the next device is due; see collection_scheduler
+            self.scheduler.run()
         except KeyboardInterrupt:
             self.logger.info("Stopping data collection service...")
+            self.scheduler.stop()
         except Exception as e:
             self.logger.error(f"Fatal error: {str(e)}", exc_info=True)
             raise
@@ -0,0 +1,156 @@
+import queue
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from config import Config
+from profiling import ProfiledConnection
+
+class ConnectionManager:
+    """Long-lived SQLite connections shared by everything in one process.
+
+    There is a single writer connection, serialized with a lock, and a small
+    pool of read-only reader connections. The database runs in WAL mode so
+    readers never block the writer (and vice versa), and because connections
+    are reused, sqlite3's per-connection statement cache keeps the prepared
+    statements for our fixed SQL strings alive between calls.
+    """
+
+    def __init__(self, db_path=None, pool_size=None):
+        self.db_path = Path(db_path or Config.DB_FILE)
+        self.pool_size = pool_size or Config.DB_READER_POOL_SIZE
+        self.logger = logging.getLogger('IoTsync.db')
+
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+
+    def _connect(self, database, uri=False):
+        # Statements are timed only when Server-Timing or the slow-query log is on
+        profiled = Config.DB_SLOW_QUERY_MS > 0 or Config.SERVER_TIMING_ENABLED
+        return sqlite3.connect(
+            database,
+            uri=uri,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000.0,
+            check_same_thread=False,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE,
+            factory=ProfiledConnection if profiled else sqlite3.Connection,
+        )
+
+    def _apply_pragmas(self, conn):
+        conn.execute(f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size = -{int(Config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+    def _open_writer(self):
+        conn = self._connect(str(self.db_path))
+        # Only takes effect on a new database; existing ones are converted by
+        # `python retention.py --enable-incremental-vacuum`
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            self.logger.warning("Could not enable WAL mode, journal_mode is %s", journal_mode)
+        conn.execute(f"PRAGMA synchronous = {Config.DB_SYNCHRONOUS}")
+        self._apply_pragmas(conn)
+        return conn
+
+    def _open_reader(self):
+        # Read-only connections need the database (and its WAL) to exist
+        if not self.db_path.exists():
+            with self.writer():
+                pass
+        conn = self._connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        self._apply_pragmas(conn)
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def open_dedicated_reader(self):
+        """Open a read-only connection outside the pool.
+
+        For callers that need connection-scoped state, such as
+        PRAGMA data_version, which only changes for commits made by
+        *other* connections. The caller owns and closes it.
+        """
+        return self._open_reader()
+
+    @contextmanager
+    def writer(self):
+        """Yield the shared writer connection, committing on success."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            if self._reader_count < self.pool_size:
+                self._reader_count += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._open_reader()
+            except Exception:
+                with self._pool_lock:
+                    self._reader_count -= 1
+                raise
+
+        try:
+            return self._readers.get(timeout=Config.DB_BUSY_TIMEOUT_MS / 1000.0)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a reader connection")
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the pool."""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        """Close every connection owned by this manager."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._pool_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._reader_count = 0
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_path=None):
+    """Return the process-wide ConnectionManager for a database file."""
+    path = Path(db_path or Config.DB_FILE).resolve()
+    with _managers_lock:
+        manager = _managers.get(path)
+        if manager is None:
+            manager = ConnectionManager(path)
+            _managers[path] = manager
+        return manager
@@ -1,15 +1,136 @@
-import sqlite3
-from datetime import datetime
+import time
+import logging
+import calendar
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 from config import Config
+from db_connection import get_connection_manager
+from device_registry import DEFAULT_CHANNELS
+from write_buffer import WriteBuffer
+from metrics import REGISTRY, DB_BUCKETS
+
+# SQLite expression converting the ISO `timestamp` text column to epoch milliseconds
+TIMESTAMP_TO_EPOCH_MS_SQL = "CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER)"
+
+# Numeric sensor_readings columns aggregated into the rollup tables
+ROLLUP_CHANNELS = [
+    'indoor_temp_c', 'pool_temp_c', 'indoor_humidity',
+    'outdoor_ch1_temp_c', 'outdoor_ch1_humidity',
+    'outdoor_ch2_temp_c', 'outdoor_ch2_humidity',
+    'outdoor_ch3_temp_c', 'outdoor_ch3_humidity',
+    'atmospheric_pressure',
+]
+
+# Rollup table name -> bucket width in milliseconds, finest first
+ROLLUP_TABLES = {
+    'rollup_minute': 60 * 1000,
+    'rollup_hour': 60 * 60 * 1000,
+    'rollup_day': 24 * 60 * 60 * 1000,
+}
+
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO {table} (
+        device_id, channel, bucket_ms,
+        sample_count, value_sum, value_min, value_max,
+        value_first, first_ts_ms, value_last, last_ts_ms
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device_id, channel, bucket_ms) DO UPDATE SET
+        sample_count = sample_count + excluded.sample_count,
+        value_sum = value_sum + excluded.value_sum,
+        value_min = MIN(value_min, excluded.value_min),
+        value_max = MAX(value_max, excluded.value_max),
+        value_first = CASE WHEN excluded.first_ts_ms < first_ts_ms
+                           THEN excluded.value_first ELSE value_first END,
+        first_ts_ms = MIN(first_ts_ms, excluded.first_ts_ms),
+        value_last = CASE WHEN excluded.last_ts_ms >= last_ts_ms
+                          THEN excluded.value_last ELSE value_last END,
+        last_ts_ms = MAX(last_ts_ms, excluded.last_ts_ms)
+'''
+
+# Raw sensor_readings columns written for every reading, after timestamp
+READING_COLUMNS = [
+    'indoor_temp_c', 'indoor_temp_f',
+    'pool_temp_c', 'pool_temp_f',
+    'indoor_humidity',
+    'outdoor_ch1_temp_c', 'outdoor_ch1_temp_f', 'outdoor_ch1_humidity',
+    'outdoor_ch2_temp_c', 'outdoor_ch2_temp_f', 'outdoor_ch2_humidity',
+    'outdoor_ch3_temp_c', 'outdoor_ch3_temp_f', 'outdoor_ch3_humidity',
+    'atmospheric_pressure', 'pressure_units',
+]
+
+INSERT_READING_SQL = f'''
+    INSERT INTO sensor_readings (timestamp, {', '.join(READING_COLUMNS)}, device_id, ts_ms)
+    VALUES ({', '.join('?' * (len(READING_COLUMNS) + 3))})
+'''
+
+_migration_lock = threading.RLock()
+
+STORE_READING_SECONDS = REGISTRY.histogram(
+    'iotsync_store_reading_seconds', 'store_reading() call time (queueing only when buffered)',
+    buckets=DB_BUCKETS
+)
+DB_WRITE_SECONDS = REGISTRY.histogram(
+    'iotsync_db_write_seconds', 'Transaction inserting a batch of readings and their rollups',
+    buckets=DB_BUCKETS
+)
+
+def to_epoch_ms(dt):
+    """Convert a naive datetime to epoch milliseconds.
+
+    Naive datetimes are interpreted the same way SQLite's julianday() does, so
+    values computed here line up with rows backfilled by the migration.
+    """
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+def epoch_seconds(ts_ms):
+    """Convert a ts_ms value back to real epoch seconds, like time.time().
+
+    ts_ms is local wall time encoded as if it were UTC (see to_epoch_ms), so
+    it is off by the UTC offset until read back as a local time.
+    """
+    wall = datetime(1970, 1, 1) + timedelta(milliseconds=ts_ms)
+    return time.mktime(wall.timetuple()) + wall.microsecond / 1e6
+
+def aggregate_rollup_buckets(rows, width):
+    """Aggregate (device_id, ts_ms, values in ROLLUP_CHANNELS order) rows into
+    rollup upsert parameters for buckets of `width` milliseconds."""
+    buckets = {}
+    for row in rows:
+        device_id, ts_ms = row[0], row[1]
+        for channel, value in zip(ROLLUP_CHANNELS, row[2]):
+            if value is None:
+                continue
+            key = (device_id, channel, ts_ms - ts_ms % width)
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, value, value, value, value, ts_ms, value, ts_ms]
+                continue
+            agg[0] += 1
+            agg[1] += value
+            agg[2] = min(agg[2], value)
+            agg[3] = max(agg[3], value)
+            if ts_ms < agg[5]:
+                agg[4], agg[5] = value, ts_ms
+            if ts_ms >= agg[7]:
+                agg[6], agg[7] = value, ts_ms
+    return [key + tuple(agg) for key, agg in buckets.items()]
 
 class DatabaseHandler:
-    def __init__(self):
+    def __init__(self, buffered=False):
         self.db_path = Config.DB_FILE
+        self.db = get_connection_manager(self.db_path)
+        self.device_id = Config.DEFAULT_DEVICE_ID
+        self.logger = logging.getLogger('IoTsync.db')
         self.init_db()
+        
+        # Readings go through a group-commit buffer when buffered=True
+        self.write_buffer = None
+        if buffered:
+            self.write_buffer = WriteBuffer(self)
 
     def init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.db.writer() as conn:
             cursor = conn.cursor()
             
             # First, check if we need to migrate the temperature_alerts table
@@ -30,8 +151,8 @@ class DatabaseHandler:
                             id INTEGER PRIMARY KEY AUTOINCREMENT,
                             timestamp DATETIME NOT NULL,
                             alert_type TEXT NOT NULL,
-                            temperature_f REAL NOT NULL,
-                            threshold_f REAL NOT NULL,
+                            temperature_f REAL,
+                            threshold_f REAL,
                             email_sent BOOLEAN NOT NULL,
                             sms_sent BOOLEAN NOT NULL,
                             email_recipient TEXT,
@@ -55,6 +176,38 @@ class DatabaseHandler:
                     cursor.execute("DROP TABLE temperature_alerts_old")
                     
                     conn.commit()
+                
+                # Alerts without a reading (stale data) have no temperature or
+                # threshold; SQLite cannot drop NOT NULL in place, so rebuild
+                # the table keeping ids, which the outbox and snapshot refer to
+                cursor.execute("PRAGMA table_info(temperature_alerts)")
+                if any(col[1] in ('temperature_f', 'threshold_f') and col[3] for col in cursor.fetchall()):
+                    cursor.execute("ALTER TABLE temperature_alerts RENAME TO temperature_alerts_old")
+                    cursor.execute('''
+                        CREATE TABLE temperature_alerts (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            timestamp DATETIME NOT NULL,
+                            alert_type TEXT NOT NULL,
+                            temperature_f REAL,
+                            threshold_f REAL,
+                            email_sent BOOLEAN NOT NULL,
+                            sms_sent BOOLEAN NOT NULL,
+                            email_recipient TEXT,
+                            phone_recipient TEXT,
+                            message TEXT
+                        )
+                    ''')
+                    cursor.execute('''
+                        INSERT INTO temperature_alerts
+                        (id, timestamp, alert_type, temperature_f, threshold_f,
+                         email_sent, sms_sent, email_recipient, phone_recipient, message)
+                        SELECT
+                            id, timestamp, alert_type, temperature_f, threshold_f,
+                            email_sent, sms_sent, email_recipient, phone_recipient, message
+                        FROM temperature_alerts_old
+                    ''')
+                    cursor.execute("DROP TABLE temperature_alerts_old")
+                    conn.commit()
             else:
                 # Create table if it doesn't exist
                 cursor.execute('''
@@ -62,8 +215,8 @@ class DatabaseHandler:
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         timestamp DATETIME NOT NULL,
                         alert_type TEXT NOT NULL,
-                        temperature_f REAL NOT NULL,
-                        threshold_f REAL NOT NULL,
+                        temperature_f REAL,
+                        threshold_f REAL,
                         email_sent BOOLEAN NOT NULL,
                         sms_sent BOOLEAN NOT NULL,
                         email_recipient TEXT,
@@ -92,10 +245,185 @@ class DatabaseHandler:
                     outdoor_ch3_temp_f REAL,
                     outdoor_ch3_humidity INTEGER,
                     atmospheric_pressure REAL,
-                    pressure_units TEXT
+                    pressure_units TEXT,
+                    device_id TEXT,
+                    ts_ms INTEGER
+                )
+            ''')
+            
+            # Older databases predate the device/epoch columns, add them in place
+            cursor.execute("PRAGMA table_info(sensor_readings)")
+            columns = [col[1] for col in cursor.fetchall()]
+            if 'device_id' not in columns:
+                cursor.execute("ALTER TABLE sensor_readings ADD COLUMN device_id TEXT")
+            if 'ts_ms' not in columns:
+                cursor.execute("ALTER TABLE sensor_readings ADD COLUMN ts_ms INTEGER")
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_ts
+                ON sensor_readings (device_id, ts_ms)
+            ''')
+            
+            # Per-bucket aggregates, maintained incrementally by store_reading()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rollup_minute'")
+            rollups_missing = cursor.fetchone() is None
+            for table in ROLLUP_TABLES:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        device_id TEXT NOT NULL,
+                        channel TEXT NOT NULL,
+                        bucket_ms INTEGER NOT NULL,
+                        sample_count INTEGER NOT NULL,
+                        value_sum REAL NOT NULL,
+                        value_min REAL NOT NULL,
+                        value_max REAL NOT NULL,
+                        value_first REAL NOT NULL,
+                        first_ts_ms INTEGER NOT NULL,
+                        value_last REAL NOT NULL,
+                        last_ts_ms INTEGER NOT NULL,
+                        PRIMARY KEY (device_id, channel, bucket_ms)
+                    ) WITHOUT ROWID
+                ''')
+            
+            # Small key/value store for maintenance state (e.g. retention)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS db_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
                 )
             ''')
+            
+            # Notifications waiting for the dispatcher, see notifications.py
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_ms INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    recipient TEXT,
+                    subject TEXT,
+                    body TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    alert_id INTEGER,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    coalesced INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_ms INTEGER NOT NULL,
+                    sent_ms INTEGER,
+                    last_error TEXT
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending
+                ON notification_outbox (status, next_attempt_ms)
+            ''')
             conn.commit()
+            
+            cursor.execute("SELECT MIN(id), MAX(id) FROM sensor_readings WHERE ts_ms IS NULL")
+            pending = cursor.fetchone()
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM sensor_readings)")
+            needs_rebuild = rollups_missing and cursor.fetchone()[0]
+        
+        if pending[0] is not None or needs_rebuild:
+            # Migrate in the background so the collector can keep writing meanwhile
+            threading.Thread(
+                target=self._migrate_in_background,
+                args=(pending[0], pending[1], needs_rebuild),
+                name='db-migration',
+                daemon=True
+            ).start()
+
+    def _migrate_in_background(self, first_id, last_id, rebuild_rollups):
+        with _migration_lock:
+            if first_id is not None:
+                self.backfill_epoch_ms(first_id, last_id)
+            if rebuild_rollups:
+                self.rebuild_rollups()
+
+    def backfill_epoch_ms(self, first_id, last_id):
+        """Populate ts_ms/device_id for legacy rows in small chunks.
+
+        Each chunk is its own short write transaction, so the writer lock is
+        released between chunks and regular inserts are never held up for
+        longer than one chunk.
+        """
+        if not _migration_lock.acquire(blocking=False):
+            return
+        try:
+            chunk_size = Config.DB_MIGRATION_CHUNK_SIZE
+            updated = 0
+            self.logger.info(f"Backfilling ts_ms for sensor_readings ids {first_id}..{last_id}")
+            for start in range(first_id, last_id + 1, chunk_size):
+                with self.db.writer() as conn:
+                    cursor = conn.execute(f'''
+                        UPDATE sensor_readings
+                        SET ts_ms = {TIMESTAMP_TO_EPOCH_MS_SQL},
+                            device_id = COALESCE(device_id, ?)
+                        WHERE id >= ? AND id < ? AND ts_ms IS NULL
+                    ''', (self.device_id, start, start + chunk_size))
+                    updated += cursor.rowcount
+                time.sleep(Config.DB_MIGRATION_PAUSE)
+            self.logger.info(f"Backfill complete, {updated} rows updated")
+        except Exception as e:
+            self.logger.error(f"Failed to backfill ts_ms: {e}", exc_info=True)
+        finally:
+            _migration_lock.release()
+
+    def rebuild_rollups(self):
+        """Recompute every rollup table from sensor_readings.
+
+        The rollups are cleared and the current max id recorded in one
+        transaction; readings stored after that point are rolled up by
+        store_reading() as usual, so the rebuild only has to cover ids up to
+        that mark and can proceed in short chunks alongside the collector.
+        """
+        with _migration_lock:
+            return self._rebuild_rollups()
+
+    def _rebuild_rollups(self):
+        # Buckets older than the retained raw readings can't be recomputed, keep them
+        retained_from = self.get_meta('raw_retained_from_ms')
+        since = {
+            table: 0 if retained_from is None else -(-int(retained_from) // width) * width
+            for table, width in ROLLUP_TABLES.items()
+        }
+        with self.db.writer() as conn:
+            for table in ROLLUP_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE bucket_ms >= ?", (since[table],))
+            last_id = conn.execute("SELECT MAX(id) FROM sensor_readings").fetchone()[0]
+        
+        if last_id is None:
+            return 0
+        
+        chunk_size = Config.DB_MIGRATION_CHUNK_SIZE
+        columns = ', '.join(ROLLUP_CHANNELS)
+        rolled_up = 0
+        self.logger.info(f"Rebuilding rollups for sensor_readings ids up to {last_id}")
+        for start in range(0, last_id + 1, chunk_size):
+            with self.db.reader() as conn:
+                rows = conn.execute(f'''
+                    SELECT device_id, ts_ms, {columns}
+                    FROM sensor_readings
+                    WHERE id >= ? AND id < ? AND id <= ? AND ts_ms IS NOT NULL
+                ''', (start, start + chunk_size, last_id)).fetchall()
+            if not rows:
+                continue
+            
+            with self.db.writer() as conn:
+                self._upsert_rollups(conn, [(row[0], row[1], row[2:]) for row in rows], since)
+            rolled_up += len(rows)
+            time.sleep(Config.DB_MIGRATION_PAUSE)
+        
+        self.logger.info(f"Rollup rebuild complete, {rolled_up} readings aggregated")
+        return rolled_up
+
+    def _upsert_rollups(self, conn, rows, since=None):
+        """Fold (device_id, ts_ms, values in ROLLUP_CHANNELS order) rows into every rollup table.
+
+        since optionally maps a table to the first bucket it should receive.
+        """
+        for table, width in ROLLUP_TABLES.items():
+            table_rows = rows if not since else [row for row in rows if row[1] >= since[table]]
+            conn.executemany(ROLLUP_UPSERT_SQL.format(table=table), aggregate_rollup_buckets(table_rows, width))
 
     def celsius_to_fahrenheit(self, celsius):
         if celsius is None:
@@ -106,47 +434,99 @@ class DatabaseHandler:
         """Convert temperature value to proper format (divide by 10)."""
         return value / 10.0 if value is not None else None
 
-    def store_reading(self, device_status):
+    def reading_values(self, device_status, channels=None):
+        """sensor_readings column values for a device status, keyed by column name."""
         properties = {prop['code']: prop['value'] for prop in device_status.get('properties', [])}
+        channels = channels or DEFAULT_CHANNELS
         
-        # Convert temperatures from device format to Celsius
-        indoor_temp_c = self.format_temperature(properties.get('Tin'))
-        pool_temp_c = self.format_temperature(properties.get('ToutCh3'))
-        outdoor_ch1_temp_c = self.format_temperature(properties.get('ToutCh1'))
-        outdoor_ch2_temp_c = self.format_temperature(properties.get('ToutCh2'))
+        def channel(name):
+            """Raw property value for one of our channels on this device."""
+            code = channels.get(name)
+            return properties.get(code) if code else None
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO sensor_readings (
-                    timestamp,
-                    indoor_temp_c, indoor_temp_f,
-                    pool_temp_c, pool_temp_f,
-                    indoor_humidity,
-                    outdoor_ch1_temp_c, outdoor_ch1_temp_f, outdoor_ch1_humidity,
-                    outdoor_ch2_temp_c, outdoor_ch2_temp_f, outdoor_ch2_humidity,
-                    outdoor_ch3_temp_c, outdoor_ch3_temp_f, outdoor_ch3_humidity,
-                    atmospheric_pressure, pressure_units
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datetime.now().isoformat(),
-                indoor_temp_c, self.celsius_to_fahrenheit(indoor_temp_c),
-                pool_temp_c, self.celsius_to_fahrenheit(pool_temp_c),
-                properties.get('Hin'),
-                outdoor_ch1_temp_c, self.celsius_to_fahrenheit(outdoor_ch1_temp_c),
-                properties.get('HoutCh1'),
-                outdoor_ch2_temp_c, self.celsius_to_fahrenheit(outdoor_ch2_temp_c),
-                properties.get('HoutCh2'),
-                pool_temp_c, self.celsius_to_fahrenheit(pool_temp_c),
-                properties.get('HoutCh3'),
-                properties.get('atmosphere'),
-                properties.get('pressure_units')
-            ))
-            conn.commit() 
+        # Convert temperatures from device format to Celsius
+        indoor_temp_c = self.format_temperature(channel('indoor_temp'))
+        pool_temp_c = self.format_temperature(channel('pool_temp'))
+        outdoor_ch1_temp_c = self.format_temperature(channel('outdoor_ch1_temp'))
+        outdoor_ch2_temp_c = self.format_temperature(channel('outdoor_ch2_temp'))
+        outdoor_ch3_temp_c = self.format_temperature(channel('outdoor_ch3_temp'))
+        return {
+            'indoor_temp_c': indoor_temp_c,
+            'indoor_temp_f': self.celsius_to_fahrenheit(indoor_temp_c),
+            'pool_temp_c': pool_temp_c,
+            'pool_temp_f': self.celsius_to_fahrenheit(pool_temp_c),
+            'indoor_humidity': channel('indoor_humidity'),
+            'outdoor_ch1_temp_c': outdoor_ch1_temp_c,
+            'outdoor_ch1_temp_f': self.celsius_to_fahrenheit(outdoor_ch1_temp_c),
+            'outdoor_ch1_humidity': channel('outdoor_ch1_humidity'),
+            'outdoor_ch2_temp_c': outdoor_ch2_temp_c,
+            'outdoor_ch2_temp_f': self.celsius_to_fahrenheit(outdoor_ch2_temp_c),
+            'outdoor_ch2_humidity': channel('outdoor_ch2_humidity'),
+            'outdoor_ch3_temp_c': outdoor_ch3_temp_c,
+            'outdoor_ch3_temp_f': self.celsius_to_fahrenheit(outdoor_ch3_temp_c),
+            'outdoor_ch3_humidity': channel('outdoor_ch3_humidity'),
+            'atmospheric_pressure': channel('atmospheric_pressure'),
+            'pressure_units': channel('pressure_units'),
+        }
+
+    def store_reading(self, device_status, device_id=None, channels=None):
+        """Store one reading; returns its column values.
+
+        With a write buffer attached the row is queued and committed with
+        others in the next group commit instead of in its own transaction.
+        """
+        with STORE_READING_SECONDS.time():
+            values = self.reading_values(device_status, channels)
+            now = datetime.now()
+            row = (now.isoformat(), device_id or self.device_id, to_epoch_ms(now), values)
+            if self.write_buffer is not None:
+                self.write_buffer.add(row)
+            else:
+                self.store_rows([row])
+        return values
+
+    def store_rows(self, rows):
+        """Insert (timestamp_iso, device_id, ts_ms, values) rows in one transaction."""
+        with DB_WRITE_SECONDS.time(), self.db.writer() as conn:
+            conn.executemany(INSERT_READING_SQL, [
+                (timestamp, *(values.get(column) for column in READING_COLUMNS), device_id, ts_ms)
+                for timestamp, device_id, ts_ms, values in rows
+            ])
+            # Keep the rollups in the same transaction as the raw rows
+            self._upsert_rollups(conn, [
+                (device_id, ts_ms, [values.get(channel) for channel in ROLLUP_CHANNELS])
+                for _, device_id, ts_ms, values in rows
+            ])
+
+    def flush(self):
+        """Commit (or spool) every buffered reading now; a no-op when unbuffered."""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    def existing_reading_keys(self, keys):
+        """The (device_id, ts_ms) pairs among keys that are already stored."""
+        found = set()
+        with self.db.reader() as conn:
+            for device_id, ts_ms in keys:
+                if conn.execute(
+                    "SELECT 1 FROM sensor_readings WHERE device_id = ? AND ts_ms = ? LIMIT 1",
+                    (device_id, ts_ms)
+                ).fetchone():
+                    found.add((device_id, ts_ms))
+        return found
+
+    def close(self):
+        """Flush and stop the write buffer, if any."""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
 
     def log_alert(self, alert_type, temperature_f, threshold_f, email_sent, sms_sent, email_recipient, phone_recipient, message):
-        """Log a temperature alert to the database."""
-        with sqlite3.connect(self.db_path) as conn:
+        """Log an alert to the database; returns the alert id.
+
+        temperature_f and threshold_f may be None for alerts that are not
+        about a reading, such as stale data.
+        """
+        with self.db.writer() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO temperature_alerts 
@@ -164,10 +544,33 @@ class DatabaseHandler:
                 message
             ))
             conn.commit()
+            return cursor.lastrowid
+
+    def get_meta(self, key):
+        with self.db.reader() as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.db.writer() as conn:
+            conn.execute('''
+                INSERT INTO db_meta (key, value) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            ''', (key, str(value)))
 
-    def get_latest_reading(self):
+    def get_last_seen(self):
+        """Epoch seconds (as from time.time()) of the newest reading per device."""
+        with self.db.reader() as conn:
+            rows = conn.execute('''
+                SELECT device_id, MAX(ts_ms) FROM sensor_readings
+                WHERE device_id IS NOT NULL
+                GROUP BY device_id
+            ''').fetchall()
+        return {device_id: epoch_seconds(ts_ms) for device_id, ts_ms in rows if ts_ms is not None}
+
+    def get_latest_reading(self, device_id=None):
         """Get the most recent sensor reading from the database."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.db.reader() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 
@@ -184,9 +587,10 @@ class DatabaseHandler:
                     atmospheric_pressure,
                     pressure_units
                 FROM sensor_readings 
-                ORDER BY timestamp DESC 
+                WHERE device_id = ?
+                ORDER BY ts_ms DESC 
                 LIMIT 1
-            ''')
+            ''', (device_id or self.device_id,))
             row = cursor.fetchone()
             
             if row:
@@ -204,4 +608,20 @@ class DatabaseHandler:
                     'atmospheric_pressure': row[10],
                     'pressure_units': row[11]
                 }
-            return None
\ No newline at end of file
+            return None
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="IoTsync database maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild-rollups', help="Recompute the minute/hour/day rollup tables")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    db_handler = DatabaseHandler()
+    if args.command == 'rebuild-rollups':
+        count = db_handler.rebuild_rollups()
+        print(f"Rebuilt rollups from {count} readings")
+
+if __name__ == "__main__":
+    main()
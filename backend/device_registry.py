@@ -0,0 +1,84 @@
+import json
+import logging
+from config import Config
+
+# sensor channel -> Tuya property code, matching the PT-3 thermometer layout
+DEFAULT_CHANNELS = {
+    'indoor_temp': 'Tin',
+    'indoor_humidity': 'Hin',
+    'pool_temp': 'ToutCh3',
+    'outdoor_ch1_temp': 'ToutCh1',
+    'outdoor_ch1_humidity': 'HoutCh1',
+    'outdoor_ch2_temp': 'ToutCh2',
+    'outdoor_ch2_humidity': 'HoutCh2',
+    'outdoor_ch3_temp': 'ToutCh3',
+    'outdoor_ch3_humidity': 'HoutCh3',
+    'atmospheric_pressure': 'atmosphere',
+    'pressure_units': 'pressure_units',
+}
+
+class Device:
+    """A Tuya device to collect from and how its properties map to our channels."""
+
+    def __init__(self, device_id, name=None, channels=None):
+        self.device_id = device_id
+        self.name = name or device_id
+        # Per-device overrides on top of the default PT-3 mapping
+        self.channels = dict(DEFAULT_CHANNELS, **(channels or {}))
+
+    def __repr__(self):
+        return f"Device({self.device_id!r}, name={self.name!r})"
+
+def load_devices():
+    """Load the device registry.
+
+    Devices come from the JSON file at Config.DEVICES_FILE when it exists:
+
+        [{"id": "...", "name": "Pool", "channels": {"pool_temp": "ToutCh1"}}]
+
+    otherwise from the comma separated DEVICE_IDS, and finally from the
+    single DEVICE_ID, so existing single-device setups keep working.
+    """
+    logger = logging.getLogger('IoTsync.devices')
+
+    if Config.DEVICES_FILE.exists():
+        with open(Config.DEVICES_FILE) as f:
+            entries = json.load(f)
+        devices = [
+            Device(entry['id'], entry.get('name'), entry.get('channels'))
+            for entry in entries
+        ]
+        logger.info(f"Loaded {len(devices)} devices from {Config.DEVICES_FILE}")
+        return devices
+
+    if Config.DEVICE_IDS:
+        return [Device(device_id) for device_id in Config.DEVICE_IDS]
+
+    if Config.DEVICE_ID:
+        return [Device(Config.DEVICE_ID)]
+
+    return []
+
+def resolve_default_device(devices=None):
+    """Point Config.DEFAULT_DEVICE_ID at a registered device and return it.
+
+    DASHBOARD_DEVICE_ID wins when set, then DEVICE_ID if it is registered,
+    then the first device load_devices() returns, so a setup configured
+    only through devices.json no longer falls back to 'default'.
+    """
+    logger = logging.getLogger('IoTsync.devices')
+    device_ids = [device.device_id for device in (load_devices() if devices is None else devices)]
+
+    if Config.DASHBOARD_DEVICE_ID:
+        device_id = Config.DASHBOARD_DEVICE_ID
+    elif Config.DEVICE_ID in device_ids:
+        device_id = Config.DEVICE_ID
+    elif device_ids:
+        device_id = device_ids[0]
+    else:
+        device_id = Config.DEFAULT_DEVICE_ID
+
+    if device_id not in device_ids:
+        logger.warning(f"Dashboard device {device_id} is not a configured device, it will have no readings")
+    Config.DEFAULT_DEVICE_ID = device_id
+    return device_id
@@ -0,0 +1,115 @@
+import numpy as np
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the n_out points to keep. The first and last
+    points are always kept; for every bucket in between we keep the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket, which preserves the visual shape of the
+    series, spikes included.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Averages of every bucket up front, plus the last point as the final "next"
+    sums_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    counts = ends - starts
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = starts[i], ends[i]
+        bx, by = x[start:end], y[start:end]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs(
+            (x[prev] - avg_x[i + 1]) * (by - y[prev])
+            - (x[prev] - bx) * (avg_y[i + 1] - y[prev])
+        )
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+def min_max(x, y, n_out):
+    """Keep the minimum and maximum of each of n_out // 2 buckets.
+
+    Fully vectorized and guaranteed to keep every local extreme, at the cost
+    of a slightly less smooth line than LTTB.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    bucket_of = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+
+    # Sort by (bucket, value) once, then the first and last entry of every
+    # bucket are its argmin and argmax
+    order = np.lexsort((y, bucket_of))
+    bucket_ends = np.append(starts[1:], n) - 1
+    keep = np.concatenate([order[starts], order[bucket_ends]])
+    return np.unique(keep)
+
+def min_max_extremes(lows, highs, n_out):
+    """Lowest low and highest high of each of n_out // 2 buckets.
+
+    For pre-aggregated series that carry each point's own min and max, such
+    as the rollup tables, so an extreme inside a point is kept even when that
+    point's average hides it. Returns (indices, values) in index order; a
+    point that holds both of its bucket's extremes appears twice.
+    """
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    n = len(lows)
+    buckets = n_out // 2
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    bucket_of = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+    bucket_ends = np.append(starts[1:], n) - 1
+
+    argmin = np.lexsort((lows, bucket_of))[starts]
+    argmax = np.lexsort((highs, bucket_of))[bucket_ends]
+    indices = np.concatenate([argmin, argmax])
+    values = np.concatenate([lows[argmin], highs[argmax]])
+
+    order = np.lexsort((values, indices))
+    indices, values = indices[order], values[order]
+    # A point whose low equals its high is only needed once
+    keep = np.ones(len(indices), dtype=bool)
+    keep[1:] = (indices[1:] != indices[:-1]) | (values[1:] != values[:-1])
+    return indices[keep], values[keep]
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': min_max,
+}
+
+def downsample(x, y, n_out, method='lttb'):
+    """Indices of at most n_out points of (x, y) chosen by the named method."""
+    return METHODS[method](x, y, n_out)
+
+def downsample_buckets(x, averages, lows, highs, n_out, method='lttb'):
+    """Indices and values of at most n_out points of a rollup series.
+
+    LTTB picks among the bucket averages; minmax keeps every output bucket's
+    lowest low and highest high so short spikes survive the rollup.
+    """
+    averages = np.asarray(averages, dtype=np.float64)
+    if n_out >= len(averages):
+        return np.arange(len(averages)), averages
+    if method == 'minmax':
+        return min_max_extremes(lows, highs, n_out)
+    keep = downsample(x, averages, n_out, method)
+    return keep, averages[keep]
@@ -0,0 +1,43 @@
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = ('rows', 'columnar')
+
+# Celsius is sent as integers in hundredths of a degree
+VALUE_SCALE = 100
+
+def dumps(obj):
+    """Serialize to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def columnar(bucket_ms, temps_c):
+    """Encode a history series as parallel arrays.
+
+    Times are a base timestamp t0 (epoch ms, same clock as `time` in the row
+    format) plus offsets in multiples of `unit` ms: a single `step` when the
+    buckets are evenly spaced, otherwise `dt` with the n-1 gaps. Temperatures
+    are Celsius quantized to 1/VALUE_SCALE degree; Fahrenheit is derived on
+    the client.
+    """
+    t = np.asarray(bucket_ms, dtype=np.int64)
+    values = np.rint(np.asarray(temps_c, dtype=np.float64) * VALUE_SCALE).astype(np.int64)
+    result = {'format': 'columnar', 'n': len(t), 't0': int(t[0]) if len(t) else None,
+              'scale': VALUE_SCALE}
+
+    gaps = np.diff(t)
+    unit = int(np.gcd.reduce(gaps)) if len(gaps) else 0
+    result['unit'] = unit or 1
+    if len(gaps) and (gaps == gaps[0]).all():
+        result['step'] = int(gaps[0]) // result['unit']
+    else:
+        result['dt'] = (gaps // result['unit']).tolist()
+
+    result['temperature'] = values.tolist()
+    return result
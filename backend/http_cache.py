@@ -0,0 +1,106 @@
+import time
+import hashlib
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.routing import Match
+from config import Config
+
+class ConditionalGetMiddleware:
+    """Answer repeat GETs with 304 Not Modified without running the endpoint.
+
+    The read endpoints only return something new after the collector stores a
+    reading or an alert is logged, so their validators come straight from the
+    ReadingSnapshot (latest reading id + latest alert id) instead of from the
+    response body. A matching If-None-Match / If-Modified-Since is answered
+    before the request ever reaches the query path.
+
+    Endpoints in `windowed` cover a rolling time window (24h stats, history
+    ranges), so their bodies also change as the window moves with no new
+    reading. Their validators additionally carry the current
+    WINDOW_SECONDS bucket.
+    """
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self, app, snapshot, paths, windowed=()):
+        self.app = app
+        self.snapshot = snapshot
+        self.paths = set(paths)
+        self.windowed = set(windowed)
+        self.logger = logging.getLogger('IoTsync.api')
+
+    def _etag(self, scope, tag):
+        key = f"{scope['path']}?{scope['query_string'].decode('latin-1')}|{tag}"
+        return 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+    def _not_modified(self, headers, etag, last_modified):
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            # Weak comparison, and If-None-Match takes precedence over If-Modified-Since
+            candidates = [c.strip() for c in if_none_match.split(',')]
+            return '*' in candidates or any(
+                c.removeprefix('W/') == etag.removeprefix('W/') for c in candidates
+            )
+
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since and last_modified:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return last_modified <= since
+        return False
+
+    def _set_route(self, scope):
+        """Record the matching route, which routing would otherwise set, for request metrics."""
+        app = scope.get('app')
+        for route in getattr(app, 'routes', ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope['route'] = route
+                return
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD')
+                or scope['path'] not in self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            # Cached values; the first load runs on a worker thread
+            await self.snapshot.ensure_loaded()
+            tag, last_modified = self.snapshot.validator()
+        except Exception as e:
+            # No validators (e.g. database not initialized yet), serve normally
+            self.logger.warning(f"Skipping conditional GET handling: {e}")
+            await self.app(scope, receive, send)
+            return
+
+        if scope['path'] in self.windowed:
+            window_start = int(time.time()) // self.WINDOW_SECONDS * self.WINDOW_SECONDS
+            tag = f"{tag}@{window_start}"
+            last_modified = max(last_modified or 0, window_start)
+
+        etag = self._etag(scope, tag)
+        validator_headers = {
+            'ETag': etag,
+            'Cache-Control': Config.HTTP_CACHE_CONTROL,
+        }
+        if last_modified:
+            validator_headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+
+        if self._not_modified(Headers(scope=scope), etag, last_modified):
+            self._set_route(scope)
+            await Response(status_code=304, headers=validator_headers)(scope, receive, send)
+            return
+
+        async def send_with_validators(message):
+            if message['type'] == 'http.response.start' and message['status'] == 200:
+                headers = MutableHeaders(scope=message)
+                for key, value in validator_headers.items():
+                    headers[key] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
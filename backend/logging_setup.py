@@ -0,0 +1,117 @@
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from datetime import datetime
+from config import Config
+
+_listener = None
+_setup_lock = threading.Lock()
+
+class Formatter(logging.Formatter):
+    """Formatter whose datefmt may use %f (microseconds)."""
+
+    def formatTime(self, record, datefmt=None):
+        created = datetime.fromtimestamp(record.created)
+        return created.strftime(datefmt) if datefmt else created.isoformat(sep=' ')
+
+class SamplingFilter(logging.Filter):
+    """Let through one in every `rate` DEBUG records per call site.
+
+    Records at INFO and above always pass. Counting per (logger, line) keeps
+    a rare debug message from being starved by a chatty one.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counts = {}
+
+    def filter(self, record):
+        if self.rate == 1 or record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.rate == 0
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full.
+
+    Records are queued as they are, unformatted: the queue never leaves the
+    process, so the message and traceback are rendered by the listener's
+    handlers rather than by the thread that logged them.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(log_name='iotsync'):
+    """Configure the IoTsync logger tree once per process.
+
+    Callers only pay for putting a record on a queue; a QueueListener thread
+    does the formatting and the file/console I/O. Levels come from
+    Config.LOG_LEVEL, with per-component overrides from Config.LOG_LEVELS
+    (e.g. LOG_LEVELS=tuya=DEBUG,db=WARNING). Returns the 'IoTsync' logger.
+    """
+    global _listener
+    logger = logging.getLogger('IoTsync')
+
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+
+        Config.LOG_DIR.mkdir(exist_ok=True)
+        logger.setLevel(Config.LOG_LEVEL)
+        for component, level in Config.LOG_LEVELS.items():
+            name = component if component.startswith('IoTsync') else f'IoTsync.{component}'
+            logging.getLogger(name).setLevel(level.upper())
+
+        # File handler for all logs
+        file_handler = logging.FileHandler(
+            Config.LOG_DIR / f'{log_name}_{datetime.now().strftime("%Y%m%d")}.log'
+        )
+        file_handler.setFormatter(Formatter(Config.LOG_FORMAT, datefmt=Config.LOG_DATE_FORMAT))
+
+        # Console handler for INFO and above
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(Config.CONSOLE_LOG_LEVEL)
+        console_handler.setFormatter(Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+        queue_handler = DroppingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+        queue_handler.addFilter(SamplingFilter(Config.LOG_DEBUG_SAMPLE_RATE))
+        logger.addHandler(queue_handler)
+
+        # Prevent logs from propagating to the root logger
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(
+            queue_handler.queue, file_handler, console_handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return logger
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
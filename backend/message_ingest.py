@@ -0,0 +1,275 @@
+import json
+import time
+import queue
+import base64
+import hashlib
+import logging
+from config import Config
+
+class TransportMessage:
+    """One message as delivered by a transport, before decoding."""
+
+    def __init__(self, message_id, payload):
+        self.message_id = message_id
+        self.payload = payload
+
+class MessageTransport:
+    """Where property-change messages come from.
+
+    Implementations deliver raw Tuya message envelopes (JSON text) and get an
+    acknowledgement once the message has been stored. Delivery is
+    at-least-once: anything not acknowledged may be redelivered.
+    """
+
+    def connect(self):
+        pass
+
+    def receive(self, timeout):
+        """Return the next TransportMessage, or None if nothing arrived in time."""
+        raise NotImplementedError
+
+    def acknowledge(self, message):
+        pass
+
+    def close(self):
+        pass
+
+class LocalBrokerTransport(MessageTransport):
+    """In-process stand-in for the Tuya message service, for tests and local runs."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._next_id = 0
+        self.acknowledged = []
+
+    def publish(self, device_id, status):
+        """Queue a property-change message the way Tuya would send it (unencrypted)."""
+        self._next_id += 1
+        envelope = {
+            'protocol': 4,
+            't': int(time.time() * 1000),
+            'data': {'devId': device_id, 'status': status},
+        }
+        self._queue.put(TransportMessage(str(self._next_id), json.dumps(envelope)))
+
+    def receive(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def acknowledge(self, message):
+        self.acknowledged.append(message.message_id)
+
+class PulsarWebSocketTransport(MessageTransport):
+    """Tuya message service consumer over the Pulsar WebSocket API.
+
+    Requires the optional `websocket-client` package.
+    """
+
+    def __init__(self, url=None, access_id=None, access_key=None, env=None):
+        self.url = (url or Config.TUYA_MQ_URL).rstrip('/')
+        self.access_id = access_id or Config.TUYA_ACCESS_KEY
+        self.access_key = access_key or Config.TUYA_SECRET_KEY
+        self.env = env or Config.TUYA_MQ_ENV
+        self.logger = logging.getLogger('IoTsync.mq')
+        self._ws = None
+
+    def _password(self):
+        key_digest = hashlib.md5(self.access_key.encode()).hexdigest()
+        return hashlib.md5(f"{self.access_id}{key_digest}".encode()).hexdigest()[8:24]
+
+    def connect(self):
+        try:
+            import websocket
+        except ImportError:
+            raise RuntimeError("Push ingestion needs the websocket-client package")
+
+        topic = f"persistent/{self.access_id}/out/{self.env}/{self.access_id}-sub"
+        url = f"{self.url}/ws/v2/consumer/{topic}?ackTimeoutMillis=3000&subscriptionType=Failover"
+        self._ws = websocket.create_connection(url, header={
+            'Connection': 'Upgrade',
+            'username': self.access_id,
+            'password': self._password(),
+        })
+        self.logger.info(f"Connected to Tuya message service at {self.url}")
+
+    def receive(self, timeout):
+        import websocket
+        self._ws.settimeout(timeout)
+        try:
+            frame = json.loads(self._ws.recv())
+        except websocket.WebSocketTimeoutException:
+            return None
+        payload = base64.b64decode(frame['payload']).decode('utf-8')
+        return TransportMessage(frame['messageId'], payload)
+
+    def acknowledge(self, message):
+        self._ws.send(json.dumps({'messageId': message.message_id}))
+
+    def close(self):
+        if self._ws is not None:
+            self._ws.close()
+            self._ws = None
+
+def decrypt_payload(data, access_key):
+    """Decrypt an AES-ECB encrypted message body (key: access secret chars 8-24)."""
+    try:
+        from Crypto.Cipher import AES
+    except ImportError:
+        raise RuntimeError("Decrypting Tuya messages needs the pycryptodome package")
+    cipher = AES.new(access_key[8:24].encode('utf-8'), AES.MODE_ECB)
+    decrypted = cipher.decrypt(base64.b64decode(data))
+    return decrypted[:-decrypted[-1]].decode('utf-8')  # strip PKCS#7 padding
+
+def decode_message(payload, access_key=None):
+    """Return (device_id, [{'code', 'value'}, ...]) for a status message, else None."""
+    envelope = json.loads(payload)
+    data = envelope.get('data')
+    if isinstance(data, str):
+        data = json.loads(decrypt_payload(data, access_key or Config.TUYA_SECRET_KEY))
+    if not isinstance(data, dict) or 'devId' not in data or 'status' not in data:
+        return None
+    return data['devId'], [
+        {'code': item['code'], 'value': item['value']}
+        for item in data['status']
+        if 'code' in item
+    ]
+
+class MessageIngestor:
+    """Store readings as property-change messages arrive instead of polling.
+
+    Messages only carry the properties that changed, so the last known value
+    of every property is kept per device and a full reading is stored from
+    that. Messages are collected for up to INGEST_BATCH_WINDOW seconds (or
+    INGEST_BATCH_MAX messages), every device touched in the batch gets one
+    reading stored, the on_reading/on_batch callbacks (alerts) run, and only
+    then are the messages acknowledged. With a write buffer the readings
+    are flushed first, so nothing is acknowledged while it only exists in
+    memory.
+    """
+
+    def __init__(self, transport, db_handler, devices, on_reading=None, on_batch=None):
+        self.transport = transport
+        self.db_handler = db_handler
+        self.devices = {device.device_id: device for device in devices}
+        self.on_reading = on_reading
+        self.on_batch = on_batch
+        self.batch_window = Config.INGEST_BATCH_WINDOW
+        self.batch_max = Config.INGEST_BATCH_MAX
+        self.properties = {device_id: {} for device_id in self.devices}
+        self.logger = logging.getLogger('IoTsync.ingest')
+        self._running = False
+
+    def seed(self, device_id, device_status):
+        """Start from a full status snapshot, e.g. one initial poll."""
+        if device_id in self.properties:
+            self.properties[device_id].update(
+                (prop['code'], prop['value']) for prop in device_status.get('properties', [])
+            )
+
+    def _collect_batch(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_max:
+            timeout = self.batch_window if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            message = self.transport.receive(timeout)
+            if message is None:
+                break
+            batch.append(message)
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_window
+        return batch
+
+    def process_batch(self, batch):
+        """Apply a batch of messages; returns the device ids that got a reading.
+
+        If storing fails partway, the devices already stored are flushed and
+        their messages acknowledged before the error is raised, so only the
+        rest of the batch is redelivered and nothing is stored twice.
+        """
+        changed = []
+        # Device each message is for, or None for messages with no reading to store
+        targets = []
+        for message in batch:
+            targets.append((message, None))
+            try:
+                decoded = decode_message(message.payload)
+            except Exception as e:
+                self.logger.error(f"Dropping undecodable message {message.message_id}: {e}")
+                continue
+            if decoded is None:
+                continue
+            device_id, status = decoded
+            if device_id not in self.devices:
+                self.logger.debug("Ignoring message for unregistered device %s", device_id)
+                continue
+            self.properties[device_id].update((item['code'], item['value']) for item in status)
+            targets[-1] = (message, device_id)
+            if device_id not in changed:
+                changed.append(device_id)
+
+        stored = []
+        failure = None
+        for device_id in changed:
+            device = self.devices[device_id]
+            device_status = {
+                'properties': [
+                    {'code': code, 'value': value}
+                    for code, value in self.properties[device_id].items()
+                ]
+            }
+            try:
+                values = self.db_handler.store_reading(device_status, device_id, device.channels)
+            except Exception as e:
+                failure = e
+                break
+            stored.append((device, values))
+            if self.on_reading:
+                try:
+                    self.on_reading(device, device_status)
+                except Exception as e:
+                    self.logger.error(f"Reading handler failed for {device.name}: {e}", exc_info=True)
+
+        if self.on_batch and stored:
+            try:
+                self.on_batch(stored)
+            except Exception as e:
+                self.logger.error(f"Batch handler failed: {e}", exc_info=True)
+
+        # Committed or in the fsync'd spool before the broker may forget them
+        self.db_handler.flush()
+        stored_ids = {device.device_id for device, _ in stored}
+        for message, device_id in targets:
+            if device_id is None or device_id in stored_ids:
+                self.transport.acknowledge(message)
+        if failure is not None:
+            raise failure
+        return changed
+
+    def run(self):
+        """Consume messages until stop() is called, reconnecting on failure."""
+        self._running = True
+        backoff = Config.RETRY_DELAY
+        while self._running:
+            try:
+                self.transport.connect()
+                backoff = Config.RETRY_DELAY
+                while self._running:
+                    batch = self._collect_batch()
+                    if batch:
+                        changed = self.process_batch(batch)
+                        self.logger.info(
+                            f"Ingested {len(batch)} messages, stored readings for {len(changed)} devices"
+                        )
+            except Exception as e:
+                self.logger.error(f"Message ingestion failed: {e}, reconnecting in {backoff}s", exc_info=True)
+                self.transport.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+        self.transport.close()
+
+    def stop(self):
+        self._running = False
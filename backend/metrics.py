@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from config import Config
+
+# Upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {'kind': self.kind, 'help': self.help, 'labelnames': list(self.labelnames),
+                'samples': samples}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+        return {'kind': self.kind, 'help': self.help, 'labelnames': list(self.labelnames),
+                'buckets': list(self.buckets), 'samples': samples}
+
+class MetricsRegistry:
+    """The metrics of one process.
+
+    Recording is a dict update under a per-metric lock. snapshot() returns
+    plain JSON-able data, which is what the collector publishes to the API
+    and what render() turns into the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+REGISTRY = MetricsRegistry()
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(snapshots):
+    """Prometheus text exposition of registry snapshots keyed by process name.
+
+    Every sample gets a `process` label, so a metric recorded by several
+    processes (database timings, slow queries) keeps each one's samples
+    side by side instead of one hiding the others.
+    """
+    families = {}
+    for process, snapshot in snapshots.items():
+        for name, family in snapshot.items():
+            if not family['samples']:
+                continue
+            merged = families.get(name)
+            if merged is None:
+                merged = families[name] = dict(
+                    family, labelnames=family['labelnames'] + ['process'], samples=[]
+                )
+            merged['samples'].extend(
+                [labelvalues + [process], value] for labelvalues, value in family['samples']
+            )
+
+    lines = []
+    for name, family in sorted(families.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        labelnames = family['labelnames']
+        for labelvalues, value in sorted(family['samples']):
+            if family['kind'] != 'histogram':
+                lines.append(f"{name}{_labels(labelnames, labelvalues)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(family['buckets'] + [float('inf')], counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{name}_bucket{_labels(labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labelnames, labelvalues)} {_format_value(float(total))}")
+            lines.append(f"{name}_count{_labels(labelnames, labelvalues)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+def read_published(path=None):
+    """The last snapshot another process published, with its age in seconds."""
+    try:
+        with open(path or Config.METRICS_FILE) as f:
+            published = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}, None
+    return published['metrics'], time.time() - published['published_at']
+
+class MetricsPublisher:
+    """Background thread writing the registry snapshot to METRICS_FILE.
+
+    The collector runs as its own process, so this is how its metrics
+    reach the API: a small JSON file replaced atomically every
+    METRICS_PUBLISH_INTERVAL seconds. before_publish() runs first, to
+    refresh gauges that are sampled rather than recorded.
+    """
+
+    def __init__(self, registry=None, path=None, interval=None, before_publish=None):
+        self.registry = registry or REGISTRY
+        self.path = path or Config.METRICS_FILE
+        self.interval = interval or Config.METRICS_PUBLISH_INTERVAL
+        self.before_publish = before_publish
+        self.logger = logging.getLogger('IoTsync.metrics')
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.publish()
+
+    def publish(self):
+        if self.before_publish:
+            self.before_publish()
+        data = {'published_at': time.time(), 'metrics': self.registry.snapshot()}
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.error(f"Failed to publish metrics: {e}")
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                self.logger.error(f"Metrics publish failed: {e}", exc_info=True)
+
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    'iotsync_api_request_seconds', 'API request latency', ['method', 'route', 'status']
+)
+
+class RequestMetricsMiddleware:
+    """Time every HTTP request, labelled by route template rather than raw path."""
+
+    def __init__(self, app, exclude=()):
+        self.app = app
+        # Long-lived requests (the SSE stream) would swamp the latency quantiles
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            API_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=status['code']
+            )
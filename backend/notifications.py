@@ -0,0 +1,301 @@
+import time
+import random
+import logging
+import threading
+from config import Config
+from db_connection import get_connection_manager
+from metrics import REGISTRY
+
+DISPATCH_SECONDS = REGISTRY.histogram(
+    'iotsync_alert_dispatch_seconds', 'Time from queueing a notification to delivering it', ['channel'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+)
+NOTIFY_RETRIES = REGISTRY.counter(
+    'iotsync_notification_retries_total', 'Notification deliveries scheduled for another attempt', ['channel']
+)
+
+# temperature_alerts column flipped once a notification on that channel is delivered
+ALERT_SENT_COLUMNS = {
+    'email': 'email_sent',
+    'sms': 'sms_sent',
+}
+
+class NotificationProvider:
+    """Delivers one notification on one channel; raises on failure."""
+
+    channel = None
+    # False for providers that only pretend to deliver (logging, not configured)
+    delivers = True
+
+    def send(self, recipient, subject, body):
+        raise NotImplementedError
+
+class SendGridProvider(NotificationProvider):
+    channel = 'email'
+
+    def __init__(self, api_key=None, from_email=None):
+        self.api_key = api_key or Config.SENDGRID_API_KEY
+        self.from_email = from_email or Config.SENDGRID_FROM_EMAIL
+        self._client = None
+
+    def send(self, recipient, subject, body):
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, Content
+
+        # One client for the lifetime of the worker
+        if self._client is None:
+            self._client = SendGridAPIClient(self.api_key)
+        message = Mail(
+            from_email=Email(self.from_email),
+            to_emails=To(recipient),
+            subject=subject,
+            plain_text_content=Content("text/plain", body)
+        )
+        response = self._client.send(message)
+        if response.status_code not in (200, 201, 202):
+            raise RuntimeError(f"SendGrid API returned status code: {response.status_code}")
+
+class TwilioProvider(NotificationProvider):
+    channel = 'sms'
+
+    def __init__(self, account_sid=None, auth_token=None, from_number=None):
+        self.account_sid = account_sid or Config.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or Config.TWILIO_AUTH_TOKEN
+        self.from_number = from_number or Config.TWILIO_FROM_NUMBER
+        self._client = None
+
+    def send(self, recipient, subject, body):
+        from twilio.rest import Client
+
+        if self._client is None:
+            self._client = Client(self.account_sid, self.auth_token)
+        message = self._client.messages.create(body=body, from_=self.from_number, to=recipient)
+        if not message.sid:
+            raise RuntimeError("Twilio did not return a message sid")
+
+class LogProvider(NotificationProvider):
+    """Logs notifications instead of sending them, used when credentials are missing."""
+
+    delivers = False
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.logger = logging.getLogger('IoTsync.notify')
+
+    def send(self, recipient, subject, body):
+        self.logger.info(f"Would send {self.channel} to {recipient}: {subject or ''}\n{body}")
+
+class StubProvider(NotificationProvider):
+    """Records notifications in memory, optionally failing the first few, for tests."""
+
+    def __init__(self, channel, fail_times=0):
+        self.channel = channel
+        self.fail_times = fail_times
+        self.sent = []
+
+    def send(self, recipient, subject, body):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError(f"Stub {self.channel} provider failure")
+        self.sent.append((recipient, subject, body))
+
+def build_providers(mode=None):
+    """Providers keyed by channel for Config.NOTIFICATION_PROVIDER.
+
+    'auto' uses SendGrid/Twilio when their credentials are configured and
+    logs otherwise, 'log' always logs and 'stub' records in memory.
+    """
+    logger = logging.getLogger('IoTsync.notify')
+    mode = mode or Config.NOTIFICATION_PROVIDER
+    if mode == 'stub':
+        return {'email': StubProvider('email'), 'sms': StubProvider('sms')}
+    if mode == 'log':
+        return {'email': LogProvider('email'), 'sms': LogProvider('sms')}
+
+    providers = {}
+    if all([Config.SENDGRID_API_KEY, Config.SENDGRID_FROM_EMAIL]):
+        providers['email'] = SendGridProvider()
+    else:
+        logger.warning("SendGrid credentials not configured. Email alerts will be logged only.")
+        providers['email'] = LogProvider('email')
+    if all([Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN, Config.TWILIO_FROM_NUMBER]):
+        providers['sms'] = TwilioProvider()
+    else:
+        logger.warning("Twilio credentials not configured. SMS alerts will be logged only.")
+        providers['sms'] = LogProvider('sms')
+    return providers
+
+class NotificationOutbox:
+    """Durable queue of notifications in the notification_outbox table.
+
+    Enqueueing is a single short write, so raising an alert never waits on a
+    provider. A pending notification with the same channel, recipient and
+    dedupe key is updated in place instead of queueing a duplicate. due()
+    claims the rows it returns by moving them to 'sending', so a
+    notification that is being delivered is never rewritten underneath the
+    dispatcher; a new one is queued instead.
+    """
+
+    def __init__(self, manager=None):
+        self.db = manager or get_connection_manager()
+
+    def release_claims(self):
+        """Return notifications left in 'sending' by a crash to the queue (at-least-once)."""
+        with self.db.writer() as conn:
+            return conn.execute(
+                "UPDATE notification_outbox SET status = 'pending' WHERE status = 'sending'"
+            ).rowcount
+
+    def enqueue(self, channel, recipient, subject, body, dedupe_key=None, alert_id=None):
+        """Queue a notification; returns its outbox id."""
+        now_ms = int(time.time() * 1000)
+        with self.db.writer() as conn:
+            if dedupe_key is not None:
+                row = conn.execute('''
+                    SELECT id FROM notification_outbox
+                    WHERE status = 'pending' AND channel = ? AND recipient IS ? AND dedupe_key = ?
+                    ORDER BY id DESC LIMIT 1
+                ''', (channel, recipient, dedupe_key)).fetchone()
+                if row is not None:
+                    conn.execute('''
+                        UPDATE notification_outbox
+                        SET subject = ?, body = ?, alert_id = COALESCE(alert_id, ?),
+                            coalesced = coalesced + 1
+                        WHERE id = ?
+                    ''', (subject, body, alert_id, row[0]))
+                    return row[0]
+            cursor = conn.execute('''
+                INSERT INTO notification_outbox (
+                    created_ms, channel, recipient, subject, body,
+                    dedupe_key, alert_id, next_attempt_ms
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (now_ms, channel, recipient, subject, body, dedupe_key, alert_id, now_ms))
+            return cursor.lastrowid
+
+    def due(self, limit):
+        """Claim the pending notifications whose next attempt is due, oldest first."""
+        with self.db.writer() as conn:
+            rows = conn.execute('''
+                SELECT id, channel, recipient, subject, body, attempts, alert_id, created_ms
+                FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_ms <= ?
+                ORDER BY next_attempt_ms, id
+                LIMIT ?
+            ''', (int(time.time() * 1000), limit)).fetchall()
+            conn.executemany(
+                "UPDATE notification_outbox SET status = 'sending' WHERE id = ?",
+                [(row[0],) for row in rows]
+            )
+            return rows
+
+    def mark_sent(self, outbox_id, channel, alert_id, delivered):
+        with self.db.writer() as conn:
+            conn.execute('''
+                UPDATE notification_outbox
+                SET status = 'sent', attempts = attempts + 1, sent_ms = ?, last_error = NULL
+                WHERE id = ?
+            ''', (int(time.time() * 1000), outbox_id))
+            if delivered and alert_id is not None and channel in ALERT_SENT_COLUMNS:
+                conn.execute(
+                    f"UPDATE temperature_alerts SET {ALERT_SENT_COLUMNS[channel]} = 1 WHERE id = ?",
+                    (alert_id,)
+                )
+
+    def mark_failed(self, outbox_id, error, next_attempt_ms=None):
+        """Record a failed attempt; without next_attempt_ms the notification is given up."""
+        with self.db.writer() as conn:
+            conn.execute('''
+                UPDATE notification_outbox
+                SET attempts = attempts + 1, last_error = ?,
+                    status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+                    next_attempt_ms = COALESCE(?, next_attempt_ms)
+                WHERE id = ?
+            ''', (str(error), next_attempt_ms, next_attempt_ms, outbox_id))
+
+    def pending_count(self):
+        with self.db.reader() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM notification_outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+class NotificationDispatcher:
+    """Background thread delivering notifications from the outbox.
+
+    Providers are created once and reused. Failed deliveries are retried
+    with exponential backoff plus jitter, up to NOTIFY_MAX_ATTEMPTS, and
+    since the outbox lives in SQLite anything still pending survives a
+    restart.
+    """
+
+    def __init__(self, outbox=None, providers=None):
+        self.outbox = outbox or NotificationOutbox()
+        self.providers = providers if providers is not None else build_providers()
+        self.poll_interval = Config.NOTIFY_POLL_INTERVAL
+        self.batch_size = Config.NOTIFY_BATCH_SIZE
+        self.max_attempts = Config.NOTIFY_MAX_ATTEMPTS
+        self.logger = logging.getLogger('IoTsync.notify')
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            released = self.outbox.release_claims()
+            if released:
+                self.logger.info(f"Re-queued {released} notifications interrupted by a restart")
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Deliver newly queued notifications now instead of at the next poll."""
+        self._wakeup.set()
+
+    def retry_delay(self, attempts):
+        delay = min(Config.NOTIFY_RETRY_BASE * 2 ** (attempts - 1), Config.NOTIFY_RETRY_MAX)
+        return delay * random.uniform(0.8, 1.2)
+
+    def dispatch_pending(self):
+        """Attempt every due notification once; returns how many were delivered."""
+        delivered = 0
+        for outbox_id, channel, recipient, subject, body, attempts, alert_id, created_ms in self.outbox.due(self.batch_size):
+            provider = self.providers.get(channel)
+            if provider is None:
+                self.outbox.mark_failed(outbox_id, f"No provider for channel {channel}")
+                continue
+            try:
+                provider.send(recipient, subject, body)
+            except Exception as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    self.logger.error(f"Giving up on {channel} notification {outbox_id} after {attempts} attempts: {e}")
+                    self.outbox.mark_failed(outbox_id, e)
+                else:
+                    delay = self.retry_delay(attempts)
+                    NOTIFY_RETRIES.inc(channel=channel)
+                    self.logger.warning(f"Failed to send {channel} notification {outbox_id}: {e}, retrying in {delay:.0f}s")
+                    self.outbox.mark_failed(outbox_id, e, int((time.time() + delay) * 1000))
+                continue
+            self.outbox.mark_sent(outbox_id, channel, alert_id, provider.delivers)
+            DISPATCH_SECONDS.observe(max(time.time() - created_ms / 1000, 0), channel=channel)
+            if provider.delivers:
+                self.logger.info(f"Alert {channel} sent: {subject or body[:40]}")
+            delivered += 1
+        return delivered
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                while self.dispatch_pending() == self.batch_size and not self._stopping.is_set():
+                    pass
+            except Exception as e:
+                self.logger.error(f"Notification dispatch failed: {e}", exc_info=True)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
@@ -0,0 +1,274 @@
+import sys
+import time
+import signal
+import sqlite3
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from config import Config
+from metrics import REGISTRY
+
+# Phase timings of the request being served, shared with its executor threads
+_timings = contextvars.ContextVar('server_timings', default=None)
+
+SLOW_QUERIES = REGISTRY.counter(
+    'iotsync_db_slow_queries_total', 'Statements slower than DB_SLOW_QUERY_MS'
+)
+
+def record(name, seconds):
+    """Add a phase duration to the current request's Server-Timing, if any."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+def open_entry(name):
+    """Add a phase to the current request that the caller keeps adding time to.
+
+    Returns the mutable [name, seconds] entry, or None outside a request.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return None
+    entry = [name, 0.0]
+    timings.append(entry)
+    return entry
+
+@contextmanager
+def phase(name):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, time.perf_counter() - started))
+
+class ServerTimingMiddleware:
+    """Report per-request phase durations in a Server-Timing header.
+
+    Phases are whatever the request recorded with phase()/record(): `sql`
+    from every statement run through a profiled connection, `db_wait` for
+    time queued behind the reader pool, and the endpoint's own phases such
+    as `rows` and `serialize`. `total` is the time to the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                totals = {}
+                for name, seconds in timings:
+                    totals[name] = totals.get(name, 0.0) + seconds
+                totals['total'] = time.perf_counter() - started
+                value = ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in totals.items())
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'server-timing', value.encode('latin-1')),
+                    (b'timing-allow-origin', b'*'),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute and fetch calls per statement.
+
+    The time goes to the request's `sql` phase as one entry per statement,
+    however many rows are fetched, and a statement whose accumulated time
+    crosses DB_SLOW_QUERY_MS is logged once with its parameters and
+    EXPLAIN QUERY PLAN output.
+    """
+
+    _statement = None
+    _parameters = None
+    _elapsed = 0.0
+    _reported = False
+    _entry = None
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._elapsed += elapsed
+            if self._entry is None:
+                self._entry = open_entry('sql')
+            if self._entry is not None:
+                self._entry[1] += elapsed
+            threshold = Config.DB_SLOW_QUERY_MS
+            if threshold > 0 and not self._reported and self._elapsed * 1000 >= threshold:
+                self._reported = True
+                _log_slow_query(self.connection, self._statement, self._parameters, self._elapsed)
+
+    def _begin(self, sql, parameters):
+        self._statement, self._parameters = sql, parameters
+        self._elapsed, self._reported, self._entry = 0.0, False, None
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements all go through ProfiledCursor.
+
+    Only used when DB_SLOW_QUERY_MS or SERVER_TIMING_ENABLED is set.
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+_plans = {}
+_slow_logger = logging.getLogger('IoTsync.slowquery')
+
+def _query_plan(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN output for a statement, cached per SQL text."""
+    plan = _plans.get(sql)
+    if plan is None:
+        try:
+            rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+            plan = '\n'.join(f"    {row[3]}" for row in rows)
+        except sqlite3.Error as e:
+            plan = f"    (no plan: {e})"
+        if len(_plans) >= 256:
+            _plans.clear()
+        _plans[sql] = plan
+    return plan
+
+def _log_slow_query(conn, sql, parameters, elapsed):
+    SLOW_QUERIES.inc()
+    statement = ' '.join(sql.split())
+    if parameters is None:
+        # executemany: the parameter rows may be a one-shot iterator
+        _slow_logger.warning("Slow statement (%.1fms, executemany): %s", elapsed * 1000, statement)
+        return
+    params = repr(parameters)
+    if len(params) > 200:
+        params = params[:200] + '...'
+    _slow_logger.warning(
+        "Slow query (%.1fms): %s\n  params: %s\n  plan:\n%s",
+        elapsed * 1000, statement, params, _query_plan(conn, sql, parameters)
+    )
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's stack at a fixed interval.
+
+    Output is the folded-stack format ("thread;outer;...;inner count") read
+    by flamegraph.pl and speedscope. Sampling stops by itself after
+    PROFILER_MAX_SECONDS so a forgotten toggle cannot run forever.
+    """
+
+    def __init__(self, name, interval=None, max_seconds=None):
+        self.name = name
+        self.interval = interval or Config.PROFILER_INTERVAL
+        self.max_seconds = max_seconds or Config.PROFILER_MAX_SECONDS
+        self.logger = logging.getLogger('IoTsync.profiler')
+        self.samples = Counter()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _sample(self, own_id):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        # Logged from here rather than start(), which runs in a signal handler
+        self.logger.info(f"Sampling profiler started ({self.interval * 1000:.0f}ms interval)")
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stopping.wait(self.interval):
+            self._sample(own_id)
+            if time.monotonic() >= deadline:
+                break
+        self.write()
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def write(self):
+        path = Config.LOG_DIR / f"profile_{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        path.write_text(self.folded())
+        self.logger.info(f"Sampling profiler stopped, {sum(self.samples.values())} samples written to {path}")
+        return path
+
+def install_profiler_toggle(name):
+    """Toggle a SamplingProfiler with SIGUSR2 (`kill -USR2 <pid>`); returns it."""
+    profiler = SamplingProfiler(name)
+    if not hasattr(signal, 'SIGUSR2'):
+        return profiler
+
+    def toggle(signum, frame):
+        if profiler.running:
+            profiler.stop()
+        else:
+            profiler.start()
+
+    try:
+        signal.signal(signal.SIGUSR2, toggle)
+    except ValueError:
+        # Not the main thread (e.g. imported by a test client); no toggle then
+        logging.getLogger('IoTsync.profiler').debug("Profiler toggle not installed outside the main thread")
+    return profiler
@@ -0,0 +1,106 @@
+import io
+import csv
+import json
+import threading
+from config import Config
+from db_connection import get_connection_manager
+from db_handler import READING_COLUMNS
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Exports hold a connection for their whole duration, so only a few at a time
+_export_slots = threading.BoundedSemaphore(Config.EXPORT_CONCURRENCY)
+
+class ExportBusy(Exception):
+    pass
+
+class ReadingExport:
+    """Stream sensor_readings rows out of a cursor in constant memory.
+
+    Rows are pulled with fetchmany(EXPORT_BATCH_SIZE) on a dedicated
+    read-only connection, and each batch is rendered to one text chunk, so
+    memory use depends on the batch size, never on the size of the range.
+    """
+
+    def __init__(self, device_id=None, channels=None, start_ms=None, end_ms=None, manager=None):
+        self._holds_slot = False
+        unknown = [c for c in (channels or []) if c not in READING_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown channels: {', '.join(unknown)}")
+        self.device_id = device_id
+        self.channels = list(channels) if channels else list(READING_COLUMNS)
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.manager = manager or get_connection_manager()
+        self.batch_size = Config.EXPORT_BATCH_SIZE
+        self.columns = ['timestamp', 'device_id', 'ts_ms'] + self.channels
+        if not _export_slots.acquire(blocking=False):
+            raise ExportBusy("Too many exports in progress")
+        self._holds_slot = True
+
+    def _release(self):
+        if self._holds_slot:
+            self._holds_slot = False
+            _export_slots.release()
+
+    def __del__(self):
+        # A response that never started streaming still gives its slot back
+        self._release()
+
+    def _query(self):
+        where, params = ['ts_ms IS NOT NULL'], []
+        if self.device_id:
+            where.append('device_id = ?')
+            params.append(self.device_id)
+        if self.start_ms is not None:
+            where.append('ts_ms >= ?')
+            params.append(self.start_ms)
+        if self.end_ms is not None:
+            where.append('ts_ms < ?')
+            params.append(self.end_ms)
+        # With a device this walks idx_sensor_readings_device_ts in order
+        order = 'ts_ms' if self.device_id else 'id'
+        return f'''
+            SELECT {', '.join(self.columns)}
+            FROM sensor_readings
+            WHERE {' AND '.join(where)}
+            ORDER BY {order}
+        ''', params
+
+    def _batches(self):
+        conn = self.manager.open_dedicated_reader()
+        try:
+            sql, params = self._query()
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+            self._release()
+
+    def ndjson(self):
+        columns = self.columns
+        for rows in self._batches():
+            yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+    def csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.columns)
+        for rows in self._batches():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            # Header only, the range was empty
+            yield buffer.getvalue()
+
+    def stream(self, fmt):
+        return self.ndjson() if fmt == 'ndjson' else self.csv()
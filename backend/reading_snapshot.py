@@ -0,0 +1,167 @@
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from db_connection import get_connection_manager
+from db_handler import to_epoch_ms
+
+LATEST_COLUMNS = [
+    'id', 'timestamp', 'ts_ms',
+    'pool_temp_c', 'pool_temp_f',
+    'indoor_temp_f', 'indoor_humidity',
+    'outdoor_ch1_temp_f', 'outdoor_ch1_humidity',
+    'outdoor_ch2_temp_f', 'outdoor_ch2_humidity',
+    'outdoor_ch3_temp_f', 'outdoor_ch3_humidity',
+    'atmospheric_pressure', 'pressure_units',
+]
+
+class ReadingSnapshot:
+    """In-memory copy of the latest reading and the rolling 24h pool min/max.
+
+    The data only changes when the collector commits, so instead of querying
+    on every request we poll PRAGMA data_version on a dedicated connection.
+    That counter changes whenever another connection commits, which makes the
+    freshness check a single cheap call; the queries only run again after a
+    write, or once max_age has passed so the 24h window keeps rolling.
+
+    All of that is blocking SQLite work, so it never runs on the event loop:
+    a background task refreshes the snapshot every poll_interval on a worker
+    thread, and the accessors only read the cached values.
+    """
+
+    def __init__(self, device_id=None, max_age=None, manager=None, poll_interval=None):
+        self.device_id = device_id or Config.DEFAULT_DEVICE_ID
+        self.max_age = max_age if max_age is not None else Config.SNAPSHOT_MAX_AGE
+        self.poll_interval = poll_interval or Config.STREAM_POLL_INTERVAL
+        self.manager = manager or get_connection_manager()
+        self.logger = logging.getLogger('IoTsync.snapshot')
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        # Serializes refreshes on the dedicated connection; readers never take it
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._loaded_at = 0.0
+        # (latest, min_max, validator), replaced as a whole so readers see one refresh
+        self._state = None
+        self._refresher = None
+
+    def refresh(self):
+        """Reload from the database if it changed or max_age passed (blocking)."""
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        if self._conn is None:
+            self._conn = self.manager.open_dedicated_reader()
+
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if (data_version == self._data_version
+                and time.monotonic() - self._loaded_at < self.max_age):
+            self.hits += 1
+            return
+
+        self.misses += 1
+        columns = ', '.join(LATEST_COLUMNS)
+        row = self._conn.execute(f'''
+            SELECT {columns}
+            FROM sensor_readings
+            WHERE device_id = ?
+            ORDER BY ts_ms DESC
+            LIMIT 1
+        ''', (self.device_id,)).fetchone()
+
+        if row:
+            latest = dict(zip(LATEST_COLUMNS, row))
+            latest['timestamp'] = datetime.fromisoformat(latest['timestamp'])
+        else:
+            latest = None
+
+        min_c, max_c = self._conn.execute('''
+            SELECT MIN(value_min), MAX(value_max)
+            FROM rollup_minute
+            WHERE device_id = ? AND channel = 'pool_temp_c' AND bucket_ms > ?
+        ''', (self.device_id, to_epoch_ms(datetime.now() - timedelta(days=1)))).fetchone()
+
+        alert = self._conn.execute('''
+            SELECT id, timestamp FROM temperature_alerts ORDER BY id DESC LIMIT 1
+        ''').fetchone()
+
+        # Everything the read endpoints return changes only with these two rows
+        reading_id, reading_ms = (latest['id'], latest['ts_ms']) if latest else (0, 0)
+        alert_id, alert_ms = (alert[0], to_epoch_ms(datetime.fromisoformat(alert[1]))) if alert else (0, 0)
+        validator = (f"{reading_id}.{alert_id}", max(reading_ms or 0, alert_ms) // 1000)
+
+        min_max = (
+            min_c * 9 / 5 + 32 if min_c is not None else None,
+            max_c * 9 / 5 + 32 if max_c is not None else None,
+        )
+        self._state = (latest, min_max, validator)
+        self._data_version = data_version
+        self._loaded_at = time.monotonic()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                self.logger.error(f"Snapshot refresh failed: {e}", exc_info=True)
+
+    async def ensure_loaded(self):
+        """Start the background refresher and wait for the first load.
+
+        Only the very first call per process touches the database (on a
+        worker thread); after that this is a couple of attribute checks.
+        """
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+        if self._state is None:
+            await asyncio.to_thread(self.refresh)
+
+    def latest(self):
+        """Latest reading as a dict (timestamp as datetime), or None."""
+        return self._state[0] if self._state else None
+
+    def min_max_24h(self):
+        """(min, max) pool temperature in °F over the last 24 hours."""
+        return self._state[1] if self._state else (None, None)
+
+    def validator(self):
+        """(version tag, last-modified epoch seconds) for HTTP cache validation.
+
+        The tag combines the latest reading id and latest alert id, so it
+        changes whenever any read endpoint could return something new.
+        """
+        return self._state[2] if self._state else (None, None)
+
+    def invalidate(self):
+        """Force the next refresh to reload, e.g. after a write on our own connection."""
+        self._data_version = None
+
+    def counters(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else None,
+        }
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
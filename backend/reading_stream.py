@@ -0,0 +1,102 @@
+import json
+import asyncio
+import logging
+from config import Config
+
+class ReadingBroadcaster:
+    """Fan new readings out to every connected dashboard.
+
+    A single producer task watches the ReadingSnapshot (whose background
+    refresh notices collector writes through PRAGMA data_version) and
+    publishes each new reading once. Every subscriber gets a small bounded
+    queue; when a slow client's queue is full its oldest event is dropped,
+    since only the most recent reading matters to a dashboard and one
+    stalled client must never hold up the others.
+    """
+
+    def __init__(self, snapshot, poll_interval=None, queue_size=None):
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval or Config.STREAM_POLL_INTERVAL
+        self.queue_size = queue_size or Config.STREAM_QUEUE_SIZE
+        self.logger = logging.getLogger('IoTsync.stream')
+
+        self.dropped = 0
+        self._subscribers = set()
+        self._producer = None
+        self._last_event = None
+
+    def _build_event(self, latest, min_max):
+        return {
+            "id": latest['id'],
+            "temperature_c": latest['pool_temp_c'],
+            "temperature_f": latest['pool_temp_f'],
+            "timestamp": latest['timestamp'].isoformat(),
+            "min_temperature": min_max[0],
+            "max_temperature": min_max[1],
+            "alert_threshold": Config.ALERT_MIN_POOL_TEMP_F,
+        }
+
+    async def _produce(self):
+        last_id = None
+        while True:
+            try:
+                # Cached values only; the snapshot refreshes itself off the loop
+                await self.snapshot.ensure_loaded()
+                latest = self.snapshot.latest()
+                if latest and latest['id'] != last_id:
+                    last_id = latest['id']
+                    self.publish(self._build_event(latest, self.snapshot.min_max_24h()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Reading stream producer failed: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+
+    def publish(self, event):
+        self._last_event = event
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+
+    def subscribe(self):
+        if self._producer is None or self._producer.done():
+            self._producer = asyncio.get_running_loop().create_task(self._produce())
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._last_event is not None:
+            queue.put_nowait(self._last_event)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    async def sse_events(self, request):
+        """Yield Server-Sent Events for one client until it disconnects."""
+        queue = self.subscribe()
+        try:
+            yield f"retry: {int(Config.STREAM_RETRY_MS)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=Config.STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: reading\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    async def close(self):
+        if self._producer is not None:
+            self._producer.cancel()
+            try:
+                await self._producer
+            except asyncio.CancelledError:
+                pass
+            self._producer = None
@@ -0,0 +1,212 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from db_handler import DatabaseHandler, to_epoch_ms
+from archive import ArchiveExporter
+
+class RetentionJob:
+    """Prune old data in bounded batches and give the space back to the OS.
+
+    Raw sensor_readings are kept for RETENTION_RAW_DAYS; older history lives
+    on in rollup_hour (RETENTION_HOUR_DAYS) and rollup_day (kept forever),
+    which store_reading() has been maintaining all along, so pruning raw rows
+    never loses the long-range series. rollup_minute and delivered
+    notifications have their own windows. Every delete batch is a short
+    write transaction, and freed pages are returned with
+    PRAGMA incremental_vacuum, which needs auto_vacuum=INCREMENTAL.
+    """
+
+    def __init__(self, db_handler=None):
+        self.db_handler = db_handler or DatabaseHandler()
+        self.db = self.db_handler.db
+        self.batch_size = Config.RETENTION_BATCH_SIZE
+        self.interval = Config.RETENTION_INTERVAL
+        self.logger = logging.getLogger('IoTsync.retention')
+        self.last_report = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Retention run failed: {e}", exc_info=True)
+
+    def _cutoff_ms(self, days):
+        return to_epoch_ms(datetime.now() - timedelta(days=days)) if days > 0 else None
+
+    def _delete_in_batches(self, select_sql, delete_sql, params):
+        """Run delete_sql on batches of keys from select_sql until none are left."""
+        deleted = 0
+        while not self._stopping.is_set():
+            with self.db.reader() as conn:
+                keys = conn.execute(select_sql, params + (self.batch_size,)).fetchall()
+            if not keys:
+                break
+            with self.db.writer() as conn:
+                conn.executemany(delete_sql, keys)
+            deleted += len(keys)
+            time.sleep(Config.DB_MIGRATION_PAUSE)
+        return deleted
+
+    def prune_readings(self, cutoff_ms, max_id=None):
+        """Delete readings older than cutoff_ms, only up to max_id when given."""
+        with self.db.reader() as conn:
+            devices = [row[0] for row in conn.execute(
+                "SELECT DISTINCT device_id FROM sensor_readings WHERE device_id IS NOT NULL"
+            )]
+        # Record the horizon first so a rollup rebuild leaves older buckets alone
+        retained_from = self.db_handler.get_meta('raw_retained_from_ms')
+        if retained_from is None or cutoff_ms > int(retained_from):
+            self.db_handler.set_meta('raw_retained_from_ms', cutoff_ms)
+        select_sql = "SELECT id FROM sensor_readings WHERE device_id = ? AND ts_ms < ?"
+        params = (cutoff_ms,)
+        if max_id is not None:
+            select_sql += " AND id <= ?"
+            params += (max_id,)
+        deleted = 0
+        for device_id in devices:
+            deleted += self._delete_in_batches(
+                select_sql + " LIMIT ?",
+                "DELETE FROM sensor_readings WHERE id = ?",
+                (device_id,) + params
+            )
+        return deleted
+
+    def prune_rollup(self, table, cutoff_ms):
+        with self.db.reader() as conn:
+            series = conn.execute("SELECT DISTINCT device_id, channel FROM rollup_day").fetchall()
+        deleted = 0
+        for device_id, channel in series:
+            deleted += self._delete_in_batches(
+                f"SELECT device_id, channel, bucket_ms FROM {table} "
+                f"WHERE device_id = ? AND channel = ? AND bucket_ms < ? LIMIT ?",
+                f"DELETE FROM {table} WHERE device_id = ? AND channel = ? AND bucket_ms = ?",
+                (device_id, channel, cutoff_ms)
+            )
+        return deleted
+
+    def prune_outbox(self, days):
+        # created_ms is wall-clock epoch time, unlike the ts_ms/bucket_ms columns
+        cutoff_ms = int((time.time() - days * 86400) * 1000)
+        return self._delete_in_batches(
+            "SELECT id FROM notification_outbox WHERE status != 'pending' AND created_ms < ? LIMIT ?",
+            "DELETE FROM notification_outbox WHERE id = ?",
+            (cutoff_ms,)
+        )
+
+    def database_bytes(self):
+        return sum(
+            os.path.getsize(path) for path in (
+                self.db.db_path, f"{self.db.db_path}-wal"
+            ) if os.path.exists(path)
+        )
+
+    def incremental_vacuum(self):
+        """Release free pages in bounded steps; returns the number of pages freed."""
+        with self.db.reader() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                self.logger.warning(
+                    "auto_vacuum is not INCREMENTAL, freed pages stay in the file; "
+                    "run `python retention.py --enable-incremental-vacuum` once to convert"
+                )
+                return 0
+        freed = 0
+        while not self._stopping.is_set():
+            with self.db.writer() as conn:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if before == 0:
+                    break
+                conn.execute(f"PRAGMA incremental_vacuum({Config.RETENTION_VACUUM_PAGES})").fetchall()
+                after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            freed += before - after
+            if after == before:
+                break
+            time.sleep(Config.DB_MIGRATION_PAUSE)
+        # Shrink the WAL too, otherwise the freed space just moves there
+        with self.db.writer() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return freed
+
+    def run_once(self):
+        """Apply every retention window once; returns a report dict."""
+        started = time.monotonic()
+        size_before = self.database_bytes()
+        report = {
+            'readings_pruned': 0,
+            'rollup_minute_pruned': 0,
+            'rollup_hour_pruned': 0,
+            'outbox_pruned': 0,
+            'readings_archived': 0,
+        }
+
+        archived_id = None
+        if Config.ARCHIVE_ENABLED:
+            # Archive new readings first and prune no further than the archive
+            # reaches, so pruning never drops unexported rows
+            exporter = ArchiveExporter(manager=self.db)
+            report['readings_archived'] = exporter.export()
+            archived_id = exporter.last_id()
+
+        cutoff = self._cutoff_ms(Config.RETENTION_RAW_DAYS)
+        if cutoff is not None:
+            report['readings_pruned'] = self.prune_readings(cutoff, max_id=archived_id)
+        for table, days in (('rollup_minute', Config.RETENTION_MINUTE_DAYS),
+                            ('rollup_hour', Config.RETENTION_HOUR_DAYS)):
+            cutoff = self._cutoff_ms(days)
+            if cutoff is not None:
+                report[f'{table}_pruned'] = self.prune_rollup(table, cutoff)
+        if Config.RETENTION_OUTBOX_DAYS > 0:
+            report['outbox_pruned'] = self.prune_outbox(Config.RETENTION_OUTBOX_DAYS)
+
+        report['pages_freed'] = self.incremental_vacuum()
+        report['bytes_reclaimed'] = max(size_before - self.database_bytes(), 0)
+        report['duration_s'] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        self.logger.info(
+            f"Retention pruned {report['readings_pruned']} readings, "
+            f"{report['rollup_minute_pruned']} minute and {report['rollup_hour_pruned']} hour buckets, "
+            f"{report['outbox_pruned']} notifications; reclaimed {report['bytes_reclaimed']} bytes "
+            f"in {report['duration_s']}s"
+        )
+        return report
+
+def enable_incremental_vacuum(db_handler):
+    """Switch an existing database to auto_vacuum=INCREMENTAL (rewrites the file once)."""
+    with db_handler.db.writer() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.commit()
+        conn.execute("VACUUM")
+
+def main():
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(description="Apply the IoTsync retention policy once")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="convert the database to auto_vacuum=INCREMENTAL first (runs VACUUM)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    db_handler = DatabaseHandler()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(db_handler)
+    print(json.dumps(RetentionJob(db_handler).run_once(), indent=2))
+
+if __name__ == "__main__":
+    main()
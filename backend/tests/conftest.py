@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other as top-level modules (`from config import Config`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config  # noqa: E402
+
+@pytest.fixture
+def db_handler(tmp_path, monkeypatch):
+    """A DatabaseHandler on a fresh database in tmp_path."""
+    from db_handler import DatabaseHandler
+
+    monkeypatch.setattr(Config, 'DB_FILE', tmp_path / 'iotsync.db')
+    monkeypatch.setattr(Config, 'WRITE_SPOOL_FILE', tmp_path / 'write_spool.jsonl')
+    handler = DatabaseHandler()
+    yield handler
+    handler.close()
+    handler.db.close()
@@ -0,0 +1,85 @@
+import pytest
+
+from alert_rules import AlertRule, RuleEngine
+
+def rule(**overrides):
+    settings = dict(name='pool_cold', channel='pool_temp_c', op='<', threshold=20,
+                    hysteresis=0.0, for_seconds=0, min_interval=0)
+    settings.update(overrides)
+    return AlertRule(**settings)
+
+def kinds(events):
+    return [(event.rule.name, event.device_id, event.kind) for event in events]
+
+def test_triggers_once_and_resolves_past_hysteresis():
+    engine = RuleEngine([rule(hysteresis=1.0)])
+
+    assert kinds(engine.evaluate('dev1', 0, {'pool_temp_c': 19.5})) == [('pool_cold', 'dev1', 'triggered')]
+    # Still breaching: no repeat
+    assert engine.evaluate('dev1', 60, {'pool_temp_c': 19.0}) == []
+    # Back over the threshold but inside the hysteresis band
+    assert engine.evaluate('dev1', 120, {'pool_temp_c': 20.5}) == []
+    events = engine.evaluate('dev1', 180, {'pool_temp_c': 21.0})
+    assert kinds(events) == [('pool_cold', 'dev1', 'resolved')]
+    assert events[0].value == 21.0 and events[0].ts == 180
+
+def test_devices_are_tracked_independently():
+    engine = RuleEngine([rule()])
+    events = engine.evaluate_batch([
+        ('dev1', 0, {'pool_temp_c': 19.0}),
+        ('dev2', 0, {'pool_temp_c': 25.0}),
+        ('dev1', 60, {'pool_temp_c': 25.0}),
+    ])
+    assert kinds(events) == [('pool_cold', 'dev1', 'triggered'), ('pool_cold', 'dev1', 'resolved')]
+    assert kinds(engine.evaluate('dev2', 120, {'pool_temp_c': 19.0})) == [('pool_cold', 'dev2', 'triggered')]
+
+def test_rule_limited_to_devices_ignores_others():
+    engine = RuleEngine([rule(devices=['dev1'])])
+    assert engine.evaluate('dev2', 0, {'pool_temp_c': 10.0}) == []
+
+def test_for_seconds_suppresses_short_breaches():
+    engine = RuleEngine([rule(for_seconds=600)])
+
+    assert engine.evaluate('dev1', 0, {'pool_temp_c': 19.0}) == []
+    assert engine.evaluate('dev1', 300, {'pool_temp_c': 19.0}) == []
+    # A clear reading restarts the clock
+    assert engine.evaluate('dev1', 400, {'pool_temp_c': 20.0}) == []
+    assert engine.evaluate('dev1', 700, {'pool_temp_c': 19.0}) == []
+    assert engine.evaluate('dev1', 1200, {'pool_temp_c': 19.0}) == []
+    assert kinds(engine.evaluate('dev1', 1300, {'pool_temp_c': 19.0})) == [('pool_cold', 'dev1', 'triggered')]
+
+def test_missing_channel_neither_breaches_nor_clears():
+    engine = RuleEngine([rule(for_seconds=600)])
+    engine.evaluate('dev1', 0, {'pool_temp_c': 19.0})
+    assert engine.evaluate('dev1', 300, {'pool_temp_c': None}) == []
+    assert kinds(engine.evaluate('dev1', 600, {'pool_temp_c': 19.0})) == [('pool_cold', 'dev1', 'triggered')]
+
+def test_min_interval_rate_limits_retriggering():
+    engine = RuleEngine([rule(min_interval=3600)])
+
+    assert kinds(engine.evaluate('dev1', 0, {'pool_temp_c': 19.0})) == [('pool_cold', 'dev1', 'triggered')]
+    assert kinds(engine.evaluate('dev1', 60, {'pool_temp_c': 21.0})) == [('pool_cold', 'dev1', 'resolved')]
+    # Breaching again within the interval stays quiet...
+    assert engine.evaluate('dev1', 120, {'pool_temp_c': 19.0}) == []
+    assert engine.evaluate('dev1', 3000, {'pool_temp_c': 19.0}) == []
+    # ...until the interval since the last trigger has passed
+    assert kinds(engine.evaluate('dev1', 3600, {'pool_temp_c': 19.0})) == [('pool_cold', 'dev1', 'triggered')]
+
+def test_negative_rate_threshold_triggers_on_fast_drop():
+    engine = RuleEngine([rule(name='pool_falling', kind='rate', threshold=-0.5, hysteresis=0.1)])
+
+    # The first reading has nothing to compare against
+    assert engine.evaluate('dev1', 0, {'pool_temp_c': 25.0}) == []
+    # Rising or falling slowly does not breach
+    assert engine.evaluate('dev1', 60, {'pool_temp_c': 26.0}) == []
+    assert engine.evaluate('dev1', 120, {'pool_temp_c': 25.8}) == []
+    events = engine.evaluate('dev1', 240, {'pool_temp_c': 24.0})
+    assert kinds(events) == [('pool_falling', 'dev1', 'triggered')]
+    assert events[0].value == pytest.approx(-0.9)
+    # -0.45/min is above the threshold but still within the hysteresis band
+    assert engine.evaluate('dev1', 360, {'pool_temp_c': 23.1}) == []
+    assert kinds(engine.evaluate('dev1', 420, {'pool_temp_c': 23.1})) == [('pool_falling', 'dev1', 'resolved')]
+
+def test_unknown_channel_is_rejected():
+    with pytest.raises(ValueError):
+        rule(channel='no_such_channel')
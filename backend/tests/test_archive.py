@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from archive import ArchiveExporter, ArchiveReader
+from config import Config
+from db_handler import to_epoch_ms
+from retention import RetentionJob
+
+def readings(start, count, step=timedelta(hours=1), device_id='dev1', first_temp=20.0):
+    rows = []
+    for i in range(count):
+        ts = start + i * step
+        rows.append((ts.isoformat(), device_id, to_epoch_ms(ts), {'pool_temp_c': first_temp + i}))
+    return rows
+
+def execute(db_handler, sql, params=()):
+    with db_handler.db.writer() as conn:
+        conn.execute(sql, params)
+
+@pytest.fixture
+def archive_root(tmp_path):
+    return tmp_path / 'archive'
+
+@pytest.fixture
+def exporter(db_handler, archive_root):
+    return ArchiveExporter(root=archive_root, manager=db_handler.db)
+
+def test_round_trip_across_a_month_boundary(db_handler, exporter, archive_root):
+    # 31 Jan 20:00 to 1 Feb 03:00
+    start = datetime(2024, 1, 31, 20)
+    db_handler.store_rows(readings(start, 8))
+    assert exporter.export() == 8
+
+    # A second export adds chunks, including a late January reading
+    late = readings(datetime(2024, 1, 31, 20, 30), 1, first_temp=99.0)
+    db_handler.store_rows(readings(start + timedelta(hours=8), 2, first_temp=28.0) + late)
+    assert exporter.export() == 3
+    assert exporter.export() == 0
+
+    reader = ArchiveReader(root=archive_root)
+    assert reader.devices() == ['dev1']
+    assert reader.months('dev1') == ['2024-01', '2024-02']
+    for month in reader.months('dev1'):
+        exporter.compact(archive_root / 'dev1' / month)
+        assert not list((archive_root / 'dev1' / month / 'chunks').iterdir())
+
+    data = reader.load('dev1', columns=['pool_temp_c'])
+    expected = sorted(row[2] for row in readings(start, 10) + late)
+    assert data['ts_ms'].tolist() == expected
+    assert np.all(np.diff(data['ts_ms']) > 0)
+    # The late reading sits in time order between 20:00 and 21:00
+    assert data['pool_temp_c'][:3].tolist() == [20.0, 99.0, 21.0]
+
+    # A range over the boundary, end exclusive
+    lo, hi = to_epoch_ms(datetime(2024, 1, 31, 23)), to_epoch_ms(datetime(2024, 2, 1, 2))
+    window = reader.load('dev1', columns=['pool_temp_c'], start_ms=lo, end_ms=hi)
+    assert window['pool_temp_c'].tolist() == [23.0, 24.0, 25.0]
+
+def test_export_waits_for_ts_ms_backfill(db_handler, exporter, archive_root):
+    db_handler.store_rows(readings(datetime(2024, 3, 1), 5))
+    with db_handler.db.reader() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM sensor_readings ORDER BY id")]
+    execute(db_handler, "UPDATE sensor_readings SET ts_ms = NULL WHERE id = ?", (ids[2],))
+
+    # Only the rows before the one still waiting for its ts_ms
+    assert exporter.export() == 2
+    assert exporter.last_id() == ids[1]
+    assert exporter.export() == 0
+
+    db_handler.backfill_epoch_ms(ids[2], ids[2])
+    assert exporter.export() == 3
+    assert exporter.last_id() == ids[4]
+    assert len(ArchiveReader(root=archive_root).load('dev1')['ts_ms']) == 5
+
+def test_retention_keeps_readings_the_archive_has_not_reached(db_handler, archive_root, monkeypatch):
+    monkeypatch.setattr(Config, 'ARCHIVE_DIR', archive_root)
+    monkeypatch.setattr(Config, 'RETENTION_RAW_DAYS', 30)
+    monkeypatch.setattr(Config, 'DB_MIGRATION_PAUSE', 0)
+    db_handler.store_rows(readings(datetime.now() - timedelta(days=60), 5, step=timedelta(days=1)))
+    with db_handler.db.reader() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM sensor_readings ORDER BY id")]
+    execute(db_handler, "UPDATE sensor_readings SET ts_ms = NULL WHERE id = ?", (ids[2],))
+
+    report = RetentionJob(db_handler).run_once()
+    assert report['readings_archived'] == 2
+    assert report['readings_pruned'] == 2
+    with db_handler.db.reader() as conn:
+        remaining = [row[0] for row in conn.execute("SELECT id FROM sensor_readings ORDER BY id")]
+    assert remaining == ids[2:]
@@ -0,0 +1,108 @@
+from alert_rules import AlertRule
+from collection_scheduler import AdaptiveInterval, CollectionScheduler
+from device_registry import Device
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def scheduler(device_ids, collect_seconds, clock, base=600):
+    """A scheduler whose collect() takes collect_seconds on clock."""
+    cycles = []
+
+    def collect(devices):
+        cycles.append([device.device_id for device in devices])
+        clock.now += collect_seconds
+
+    policy = AdaptiveInterval(base=base, adaptive=False)
+    schedule = CollectionScheduler([Device(d) for d in device_ids], collect, policy=policy,
+                                   jitter=0, clock=clock)
+    return schedule, cycles
+
+def policy(*rules):
+    return AdaptiveInterval(rules, base=1800, minimum=300, maximum=3600, margin=2.0, adaptive=True)
+
+def pool_rule(**overrides):
+    settings = dict(name='pool_cold', channel='pool_temp_c', op='<', threshold=20)
+    settings.update(overrides)
+    return AlertRule(**settings)
+
+def test_deadlines_do_not_drift_after_slow_collections():
+    clock = FakeClock()
+    schedule, cycles = scheduler(['dev1'], collect_seconds=50, clock=clock)
+    schedule.start()
+    assert schedule.next_deadline() == 600
+
+    for slot in range(1, 5):
+        clock.now = schedule.next_deadline()
+        assert schedule.run_due() == ['dev1']
+        # The next slot is one interval after the previous deadline, not after the collection ended
+        assert schedule.next_deadline() == (slot + 1) * 600
+    assert len(cycles) == 4
+
+def test_overrun_skips_missed_slots():
+    clock = FakeClock()
+    schedule, cycles = scheduler(['dev1'], collect_seconds=1300, clock=clock)
+    schedule.start()
+
+    clock.now = 600
+    schedule.run_due()
+    # Finished at 1900: the 1200 and 1800 slots are skipped, not replayed
+    assert clock.now == 1900
+    assert schedule.next_deadline() == 2400
+    assert schedule.run_due(now=2000) == []
+    assert len(cycles) == 1
+
+def test_devices_due_together_share_a_cycle():
+    clock = FakeClock()
+    schedule, cycles = scheduler(['dev1', 'dev2'], collect_seconds=1, clock=clock)
+    schedule.start()
+    schedule.run_due(now=600)
+    assert cycles == [['dev1', 'dev2']]
+
+def test_nothing_runs_before_the_deadline():
+    clock = FakeClock()
+    schedule, cycles = scheduler(['dev1'], collect_seconds=1, clock=clock)
+    schedule.start()
+    assert schedule.run_due(now=598) == []
+    assert cycles == []
+
+def test_interval_grows_while_calm_and_drops_near_threshold():
+    adaptive = policy(pool_rule())
+
+    # Far from the threshold and steady: 1.5x per reading up to the maximum
+    assert adaptive.observe('dev1', 0, {'pool_temp_c': 30.0}) == 2700
+    assert adaptive.observe('dev1', 2700, {'pool_temp_c': 30.0}) == 3600
+    assert adaptive.observe('dev1', 6300, {'pool_temp_c': 30.0}) == 3600
+    # Within the margin: urgent
+    assert adaptive.observe('dev1', 9900, {'pool_temp_c': 21.5}) == 300
+    # Between one and two margins away and moving off: back to the base
+    assert adaptive.observe('dev1', 10200, {'pool_temp_c': 23.0}) == 1800
+
+def test_interval_drops_when_approaching_fast():
+    adaptive = policy(pool_rule())
+    adaptive.observe('dev1', 0, {'pool_temp_c': 30.0})
+    # Falling 3 degrees per 10 minutes crosses 20 within the base interval
+    assert adaptive.observe('dev1', 600, {'pool_temp_c': 27.0}) == 300
+
+def test_negative_rate_rule_compares_magnitudes():
+    adaptive = policy(pool_rule(name='pool_falling', kind='rate', threshold=-0.5))
+
+    # Stable readings are calm even though the threshold is negative
+    assert adaptive.observe('dev1', 0, {'pool_temp_c': 25.0}) == 2700
+    assert adaptive.observe('dev1', 2700, {'pool_temp_c': 25.0}) == 3600
+    # Changing at 0.3/min, more than half of the 0.5/min limit
+    assert adaptive.observe('dev1', 3300, {'pool_temp_c': 22.0}) == 300
+    # Slow again
+    assert adaptive.observe('dev1', 3600, {'pool_temp_c': 22.0}) == 1800
+
+def test_base_interval_without_rules_or_adaptation():
+    assert policy().observe('dev1', 0, {'pool_temp_c': 21.0}) == 1800
+    fixed = AdaptiveInterval([pool_rule()], base=1800, minimum=300, maximum=3600, adaptive=False)
+    assert fixed.observe('dev1', 0, {'pool_temp_c': 20.5}) == 1800
+    # Rules limited to other devices do not apply
+    other = policy(pool_rule(devices=['dev2']))
+    assert other.observe('dev1', 0, {'pool_temp_c': 20.5}) == 1800
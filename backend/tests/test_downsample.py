@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from db_handler import to_epoch_ms
+from downsample import downsample_buckets, min_max_extremes
+
+def test_min_max_extremes_keeps_each_bucket_low_and_high():
+    lows = [5, 1, 5, 5, 5, 5]
+    highs = [6, 7, 6, 6, 9, 6]
+    indices, values = min_max_extremes(lows, highs, 4)
+    # The first bucket's low and high are both on point 1
+    assert indices.tolist() == [1, 1, 3, 4]
+    assert values.tolist() == [1, 7, 5, 9]
+
+def test_min_max_extremes_keeps_a_flat_point_once():
+    # Single-point buckets hold both extremes of a point whose low is its high
+    indices, values = min_max_extremes([1, 2, 3, 4, 5], [1, 2, 3, 4, 5], 8)
+    assert indices.tolist() == [0, 1, 2, 3, 4]
+    assert values.tolist() == [1, 2, 3, 4, 5]
+
+def test_spike_inside_a_rollup_bucket_survives_minmax(db_handler):
+    # Three days of readings every 10 minutes with a single one-reading spike
+    start = datetime(2024, 3, 1)
+    rows = []
+    for i in range(3 * 24 * 6):
+        ts = start + timedelta(minutes=10 * i)
+        temp = 40.0 if i == 200 else 25.0 + (i % 6) * 0.1
+        rows.append((ts.isoformat(), 'dev1', to_epoch_ms(ts), {'pool_temp_c': temp}))
+    db_handler.store_rows(rows)
+
+    with db_handler.db.reader() as conn:
+        buckets = conn.execute("""
+            SELECT bucket_ms, value_sum / sample_count, value_min, value_max
+            FROM rollup_hour WHERE device_id = 'dev1' AND channel = 'pool_temp_c'
+            ORDER BY bucket_ms
+        """).fetchall()
+    x, averages, lows, highs = (np.array(column) for column in zip(*buckets))
+    # The hourly average alone has already lost the spike
+    assert averages.max() < 30
+
+    indices, values = downsample_buckets(x, averages, lows, highs, 12, 'minmax')
+    assert len(values) <= 12
+    assert values.max() == 40.0
+    assert values.min() == 25.0
+    assert (np.diff(indices) >= 0).all()
+
+def test_lttb_picks_from_bucket_averages():
+    x = np.arange(10) * 60000
+    averages = np.linspace(20, 21, 10)
+    indices, values = downsample_buckets(x, averages, averages - 1, averages + 1, 5, 'lttb')
+    assert len(indices) == 5
+    assert values.tolist() == averages[indices].tolist()
+
+def test_no_downsampling_when_points_cover_the_series():
+    averages = [20.0, 21.0, 22.0]
+    indices, values = downsample_buckets([0, 1, 2], averages, averages, averages, 5, 'minmax')
+    assert indices.tolist() == [0, 1, 2]
+    assert values.tolist() == averages
@@ -0,0 +1,36 @@
+import io
+import queue
+import logging
+import logging.handlers
+
+from logging_setup import DroppingQueueHandler, Formatter
+
+def test_records_are_formatted_by_the_listener_not_the_caller():
+    handler = DroppingQueueHandler(queue.Queue(10))
+    logger = logging.getLogger('IoTsync.test_logging_setup')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        logger.warning("Flushed %d readings in %.1fms", 3, 1.25)
+        record = handler.queue.get_nowait()
+        # Still the format string and its arguments when it reaches the queue
+        assert record.msg == "Flushed %d readings in %.1fms"
+        assert record.args == (3, 1.25)
+
+        output = io.StringIO()
+        stream_handler = logging.StreamHandler(output)
+        stream_handler.setFormatter(Formatter('%(levelname)s %(message)s'))
+        handler.queue.put_nowait(record)
+        listener = logging.handlers.QueueListener(handler.queue, stream_handler)
+        listener.start()
+        listener.stop()
+        assert output.getvalue() == "WARNING Flushed 3 readings in 1.2ms\n"
+    finally:
+        logger.removeHandler(handler)
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    record = logging.makeLogRecord({'msg': 'reading stored'})
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
@@ -0,0 +1,135 @@
+import json
+import base64
+
+import pytest
+
+from device_registry import Device
+from message_ingest import (
+    LocalBrokerTransport, MessageIngestor, TransportMessage, decode_message, decrypt_payload,
+)
+from write_buffer import WriteBuffer
+
+ACCESS_KEY = '0123456789abcdefFEDCBA9876543210'
+
+def encrypt(text, access_key=ACCESS_KEY):
+    """What the Tuya message service does: AES-ECB, PKCS#7 padding, base64."""
+    from Crypto.Cipher import AES
+
+    data = text.encode('utf-8')
+    pad = 16 - len(data) % 16
+    cipher = AES.new(access_key[8:24].encode('utf-8'), AES.MODE_ECB)
+    return base64.b64encode(cipher.encrypt(data + bytes([pad]) * pad)).decode()
+
+def envelope(data):
+    return json.dumps({'protocol': 4, 't': 1700000000000, 'data': data})
+
+def reading_count(db_handler):
+    with db_handler.db.reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM sensor_readings").fetchone()[0]
+
+def test_decode_plain_status_message():
+    payload = envelope({'devId': 'dev1', 'status': [
+        {'code': 'ToutCh3', 'value': 281, 't': 1},
+        {'value': 'no code'},
+    ]})
+    assert decode_message(payload) == ('dev1', [{'code': 'ToutCh3', 'value': 281}])
+
+def test_decode_ignores_non_status_messages():
+    assert decode_message(envelope({'devId': 'dev1', 'bizCode': 'online'})) is None
+    assert decode_message(envelope(None)) is None
+
+def test_decrypt_round_trip():
+    text = json.dumps({'devId': 'dev1', 'status': [{'code': 'Tin', 'value': 215}]})
+    assert decrypt_payload(encrypt(text), ACCESS_KEY) == text
+
+def test_decode_encrypted_message():
+    data = encrypt(json.dumps({'devId': 'dev1', 'status': [{'code': 'Tin', 'value': 215}]}))
+    assert decode_message(envelope(data), ACCESS_KEY) == ('dev1', [{'code': 'Tin', 'value': 215}])
+
+def test_acknowledges_only_after_buffered_readings_are_committed(db_handler, tmp_path):
+    # A flush window long enough that only an explicit flush can commit the row
+    db_handler.write_buffer = WriteBuffer(db_handler, max_delay=3600,
+                                          spool_path=tmp_path / 'spool.jsonl')
+    transport = LocalBrokerTransport()
+    rows_at_ack = []
+    acknowledge = transport.acknowledge
+
+    def checking_acknowledge(message):
+        rows_at_ack.append(reading_count(db_handler))
+        acknowledge(message)
+
+    transport.acknowledge = checking_acknowledge
+    ingestor = MessageIngestor(transport, db_handler, [Device('dev1')])
+    transport.publish('dev1', [{'code': 'ToutCh3', 'value': 281}])
+    transport.publish('dev1', [{'code': 'Tin', 'value': 215}])
+
+    changed = ingestor.process_batch(ingestor._collect_batch())
+
+    assert changed == ['dev1']
+    assert transport.acknowledged == ['1', '2']
+    assert rows_at_ack == [1, 1]
+
+def test_nothing_acknowledged_when_store_fails(db_handler):
+    transport = LocalBrokerTransport()
+    ingestor = MessageIngestor(transport, db_handler, [Device('dev1')])
+
+    def failing_store(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    db_handler.store_reading = failing_store
+    transport.publish('dev1', [{'code': 'ToutCh3', 'value': 281}])
+    with pytest.raises(RuntimeError):
+        ingestor.process_batch(ingestor._collect_batch())
+    assert transport.acknowledged == []
+
+def test_partial_failure_acknowledges_stored_devices_only(db_handler):
+    transport = LocalBrokerTransport()
+    ingestor = MessageIngestor(transport, db_handler, [Device('dev1'), Device('dev2')])
+    store_reading = db_handler.store_reading
+
+    def failing_for_dev2(device_status, device_id, channels):
+        if device_id == 'dev2':
+            raise RuntimeError("disk full")
+        return store_reading(device_status, device_id, channels)
+
+    db_handler.store_reading = failing_for_dev2
+    transport.publish('dev1', [{'code': 'ToutCh3', 'value': 281}])
+    transport.publish('dev2', [{'code': 'ToutCh3', 'value': 290}])
+    with pytest.raises(RuntimeError):
+        ingestor.process_batch(ingestor._collect_batch())
+    assert transport.acknowledged == ['1']
+    assert reading_count(db_handler) == 1
+
+    # Only dev2's message comes back, dev1 is not stored a second time
+    db_handler.store_reading = store_reading
+    redelivered = TransportMessage('2', envelope({'devId': 'dev2', 'status': [{'code': 'ToutCh3', 'value': 290}]}))
+    assert ingestor.process_batch([redelivered]) == ['dev2']
+    assert transport.acknowledged == ['1', '2']
+    with db_handler.db.reader() as conn:
+        assert conn.execute(
+            "SELECT device_id, COUNT(*) FROM sensor_readings GROUP BY device_id ORDER BY device_id"
+        ).fetchall() == [('dev1', 1), ('dev2', 1)]
+
+def test_undecodable_and_unregistered_messages_are_acknowledged(db_handler):
+    transport = LocalBrokerTransport()
+    ingestor = MessageIngestor(transport, db_handler, [Device('dev1')])
+    batch = [
+        TransportMessage('bad', 'not json'),
+        TransportMessage('other', envelope({'devId': 'dev2', 'status': [{'code': 'Tin', 'value': 1}]})),
+    ]
+
+    assert ingestor.process_batch(batch) == []
+    assert transport.acknowledged == ['bad', 'other']
+    assert reading_count(db_handler) == 0
+
+def test_partial_messages_build_on_seeded_state(db_handler):
+    transport = LocalBrokerTransport()
+    ingestor = MessageIngestor(transport, db_handler, [Device('dev1')])
+    ingestor.seed('dev1', {'properties': [{'code': 'Tin', 'value': 215}]})
+    transport.publish('dev1', [{'code': 'ToutCh3', 'value': 281}])
+
+    ingestor.process_batch(ingestor._collect_batch())
+
+    latest = db_handler.get_latest_reading('dev1')
+    assert latest['indoor_temp_f'] == pytest.approx(70.7, abs=0.01)
+    assert latest['pool_temp_f'] == pytest.approx(82.58, abs=0.01)
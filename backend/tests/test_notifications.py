@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from config import Config
+from notifications import NotificationDispatcher, NotificationOutbox, StubProvider
+
+@pytest.fixture
+def outbox(db_handler):
+    return NotificationOutbox(manager=db_handler.db)
+
+def rows(outbox):
+    with outbox.db.reader() as conn:
+        return conn.execute('''
+            SELECT id, status, body, alert_id, coalesced, attempts, next_attempt_ms
+            FROM notification_outbox ORDER BY id
+        ''').fetchall()
+
+def make_due(outbox):
+    with outbox.db.writer() as conn:
+        conn.execute("UPDATE notification_outbox SET next_attempt_ms = 0")
+
+def test_pending_notification_is_coalesced(outbox):
+    first = outbox.enqueue('email', 'a@example.com', 'Alert', 'first', 'rule:dev:triggered', alert_id=1)
+    second = outbox.enqueue('email', 'a@example.com', 'Alert', 'second', 'rule:dev:triggered', alert_id=2)
+
+    assert first == second
+    (_, status, body, alert_id, coalesced, _, _), = rows(outbox)
+    assert (status, body, alert_id, coalesced) == ('pending', 'second', 1, 1)
+
+def test_different_keys_channels_and_recipients_are_not_coalesced(outbox):
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'triggered', 'rule:dev:triggered')
+    outbox.enqueue('email', 'a@example.com', 'Restored', 'resolved', 'rule:dev:resolved')
+    outbox.enqueue('sms', '+15550100', None, 'triggered', 'rule:dev:triggered')
+    outbox.enqueue('email', 'b@example.com', 'Alert', 'triggered', 'rule:dev:triggered')
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'no key')
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'no key')
+
+    assert len(rows(outbox)) == 6
+
+def test_claimed_notification_is_not_rewritten(outbox):
+    first = outbox.enqueue('email', 'a@example.com', 'Alert', 'first', 'rule:dev:triggered')
+    claimed = outbox.due(10)
+    second = outbox.enqueue('email', 'a@example.com', 'Alert', 'second', 'rule:dev:triggered')
+
+    assert [row[0] for row in claimed] == [first]
+    assert second != first
+    assert [(row[1], row[2]) for row in rows(outbox)] == [('sending', 'first'), ('pending', 'second')]
+    # A claimed row is not handed out twice
+    assert [row[0] for row in outbox.due(10)] == [second]
+
+def test_release_claims_requeues_interrupted_sends(outbox):
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'body')
+    outbox.due(10)
+
+    assert outbox.release_claims() == 1
+    assert rows(outbox)[0][1] == 'pending'
+    assert outbox.pending_count() == 1
+
+def test_failed_delivery_is_retried_with_backoff(outbox, db_handler):
+    alert_id = db_handler.log_alert('low_temperature', 99.0, 101.0, False, False, None, None, 'cold')
+    provider = StubProvider('email', fail_times=1)
+    dispatcher = NotificationDispatcher(outbox, {'email': provider})
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'body', alert_id=alert_id)
+
+    before_ms = int(time.time() * 1000)
+    assert dispatcher.dispatch_pending() == 0
+    (_, status, _, _, _, attempts, next_attempt_ms), = rows(outbox)
+    assert (status, attempts) == ('pending', 1)
+    delay_ms = next_attempt_ms - before_ms
+    assert Config.NOTIFY_RETRY_BASE * 800 - 1000 <= delay_ms <= Config.NOTIFY_RETRY_BASE * 1200 + 1000
+    # Not due yet
+    assert dispatcher.dispatch_pending() == 0
+    assert provider.sent == []
+
+    make_due(outbox)
+    assert dispatcher.dispatch_pending() == 1
+    assert provider.sent == [('a@example.com', 'Alert', 'body')]
+    assert rows(outbox)[0][1] == 'sent'
+    with db_handler.db.reader() as conn:
+        assert conn.execute(
+            "SELECT email_sent FROM temperature_alerts WHERE id = ?", (alert_id,)
+        ).fetchone()[0] == 1
+
+def test_gives_up_after_max_attempts(outbox):
+    dispatcher = NotificationDispatcher(outbox, {'email': StubProvider('email', fail_times=10)})
+    dispatcher.max_attempts = 3
+    outbox.enqueue('email', 'a@example.com', 'Alert', 'body')
+
+    for _ in range(3):
+        make_due(outbox)
+        dispatcher.dispatch_pending()
+
+    (_, status, _, _, _, attempts, _), = rows(outbox)
+    assert (status, attempts) == ('failed', 3)
+    assert outbox.pending_count() == 0
+
+def test_retry_delay_doubles_up_to_the_cap(outbox, monkeypatch):
+    monkeypatch.setattr(Config, 'NOTIFY_RETRY_BASE', 10)
+    monkeypatch.setattr(Config, 'NOTIFY_RETRY_MAX', 60)
+    dispatcher = NotificationDispatcher(outbox, {})
+
+    for attempts, expected in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+        assert expected * 0.8 <= dispatcher.retry_delay(attempts) <= expected * 1.2
+
+def test_missing_provider_fails_notification(outbox):
+    dispatcher = NotificationDispatcher(outbox, {})
+    outbox.enqueue('pager', None, None, 'body')
+
+    assert dispatcher.dispatch_pending() == 0
+    assert rows(outbox)[0][1] == 'failed'
@@ -0,0 +1,57 @@
+import time
+
+from tuya_device_data import TuyaClient
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'success': True, 'result': {'ok': True}}
+
+def client():
+    tuya = TuyaClient()
+    tuya.access_key = 'access-key'
+    tuya.secret_key = 'secret-key'
+    # Skip the /v1.0/time round trip
+    tuya.clock_offset_ms = 0
+    tuya.clock_synced_at = time.monotonic()
+    return tuya
+
+def test_signature_and_header_use_the_same_token(monkeypatch):
+    tuya = client()
+    tuya.token_info = {'access_token': 'old-token'}
+    sent = []
+
+    calculate_sign = tuya.calculate_sign
+
+    def sign_then_refresh(*args, **kwargs):
+        signature = calculate_sign(*args, **kwargs)
+        # Another collection thread refreshes the shared token mid-request
+        tuya.token_info = {'access_token': 'new-token'}
+        return signature
+
+    monkeypatch.setattr(tuya, 'calculate_sign', sign_then_refresh)
+    monkeypatch.setattr(tuya.session, 'request', lambda **kwargs: sent.append(kwargs) or FakeResponse())
+
+    assert tuya.request_signed('GET', '/v1.0/devices/dev1') == {'ok': True}
+    headers = sent[0]['headers']
+    assert headers['access_token'] == 'old-token'
+    assert headers['sign'] == calculate_sign(
+        'GET', '/v1.0/devices/dev1', int(headers['t']), token_info={'access_token': 'old-token'}
+    )
+
+def test_token_request_is_signed_without_a_token(monkeypatch):
+    tuya = client()
+    sent = []
+    monkeypatch.setattr(tuya.session, 'request', lambda **kwargs: sent.append(kwargs) or FakeResponse())
+
+    tuya.request_signed('GET', '/v1.0/token', params={'grant_type': '1'})
+    headers = sent[0]['headers']
+    assert 'access_token' not in headers
+    assert headers['sign'] == tuya.calculate_sign(
+        'GET', '/v1.0/token', int(headers['t']), params={'grant_type': '1'}
+    )
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from db_handler import epoch_seconds, to_epoch_ms
+from watermark import IngestionWatermark, StalenessWatchdog
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """Run the test five and a half hours ahead of UTC."""
+    monkeypatch.setenv('TZ', 'IST-05:30')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_epoch_seconds_undoes_the_local_wall_time_encoding(local_timezone):
+    now = datetime.now()
+    assert epoch_seconds(to_epoch_ms(now)) == pytest.approx(now.timestamp(), abs=0.001)
+
+def test_last_seen_from_database_is_real_epoch_time(local_timezone, db_handler):
+    stored_at = datetime.now() - timedelta(minutes=5)
+    db_handler.store_rows([(stored_at.isoformat(), 'dev1', to_epoch_ms(stored_at), {'pool_temp_c': 25.0})])
+
+    last_seen = db_handler.get_last_seen()['dev1']
+    assert last_seen == pytest.approx(time.time() - 300, abs=5)
+    assert datetime.fromtimestamp(last_seen).strftime('%H:%M') == stored_at.strftime('%H:%M')
+
+def test_watchdog_seeded_from_database_judges_age_correctly(local_timezone, db_handler, tmp_path):
+    stored_at = datetime.now() - timedelta(minutes=5)
+    db_handler.store_rows([(stored_at.isoformat(), 'dev1', to_epoch_ms(stored_at), {'pool_temp_c': 25.0})])
+    watermark = IngestionWatermark(path=tmp_path / 'watermark.json', db_handler=db_handler)
+
+    stale = []
+    watchdog = StalenessWatchdog(watermark, ['dev1'], on_stale=lambda *args: stale.append(args) or True,
+                                 on_restored=lambda *args: True, max_age=3600)
+    watchdog.check()
+    assert stale == []
+
+    watchdog.check(now=time.time() + 3600)
+    assert [device_id for device_id, _ in stale] == ['dev1']
@@ -0,0 +1,108 @@
+import time
+import sqlite3
+
+import pytest
+
+from write_buffer import WriteBuffer
+
+def row(i, device_id='dev1'):
+    return (f'2024-03-01T00:{i:02d}:00', device_id, 1709251200000 + i * 60000, {'pool_temp_c': 25.0 + i})
+
+def stored_keys(db_handler):
+    with db_handler.db.reader() as conn:
+        return conn.execute("SELECT device_id, ts_ms FROM sensor_readings ORDER BY ts_ms").fetchall()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return tmp_path / 'spool.jsonl'
+
+@pytest.fixture
+def unavailable(db_handler, monkeypatch):
+    """Make every store_rows call fail as if the database were locked."""
+    def locked(rows):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(db_handler, 'store_rows', locked)
+    return monkeypatch
+
+def test_flushes_once_max_rows_are_queued(db_handler, spool_path):
+    buffer = WriteBuffer(db_handler, max_rows=5, max_delay=3600, spool_path=spool_path)
+    try:
+        for i in range(4):
+            buffer.add(row(i))
+        time.sleep(0.2)
+        assert stored_keys(db_handler) == []
+
+        buffer.add(row(4))
+        assert wait_for(lambda: len(stored_keys(db_handler)) == 5)
+        # All five rows went out in a single commit
+        assert buffer.stats()['flushes'] == 1
+        assert buffer.queue_depth() == 0
+    finally:
+        buffer.close()
+
+def test_flushes_after_max_delay(db_handler, spool_path):
+    buffer = WriteBuffer(db_handler, max_rows=100, max_delay=0.2, spool_path=spool_path)
+    try:
+        buffer.add(row(0))
+        assert wait_for(lambda: len(stored_keys(db_handler)) == 1)
+        assert buffer.stats()['rows_written'] == 1
+    finally:
+        buffer.close()
+
+def test_spooled_rows_are_replayed_exactly_once(db_handler, spool_path, unavailable):
+    buffer = WriteBuffer(db_handler, max_delay=3600, spool_path=spool_path)
+    for i in range(3):
+        buffer.add(row(i))
+    assert buffer.flush() == 0
+    assert spool_path.exists()
+    assert buffer.stats()['rows_spooled'] == 3
+
+    # Database back: the spool is replayed ahead of the new batch
+    unavailable.undo()
+    buffer.add(row(3))
+    assert buffer.flush() == 4
+    assert not spool_path.exists()
+    buffer.close()
+    assert stored_keys(db_handler) == [('dev1', row(i)[2]) for i in range(4)]
+
+def test_replay_after_crash_skips_rows_already_committed(db_handler, spool_path, unavailable):
+    # Crash after the spool append: the rows are spooled and the process dies
+    crashed = WriteBuffer(db_handler, max_delay=3600, spool_path=spool_path)
+    for i in range(3):
+        crashed.add(row(i))
+    crashed.close()
+    unavailable.undo()
+
+    # Two of them were committed after all, the third was spooled twice and
+    # the spool ends in a torn line
+    db_handler.store_rows([row(0), row(1)])
+    with open(spool_path, 'a') as f:
+        f.write(spool_path.read_text().splitlines()[2] + '\n')
+        f.write('["2024-03-01T00:09:00", "dev1", 17')
+
+    restarted = WriteBuffer(db_handler, max_delay=3600, spool_path=spool_path)
+    assert restarted.flush() == 1
+    assert not spool_path.exists()
+    assert restarted.flush() == 0
+    restarted.close()
+    assert stored_keys(db_handler) == [('dev1', row(i)[2]) for i in range(3)]
+
+def test_replay_keeps_spool_while_database_is_unavailable(db_handler, spool_path, unavailable):
+    buffer = WriteBuffer(db_handler, max_delay=3600, spool_path=spool_path)
+    buffer.add(row(0))
+    buffer.flush()
+    assert buffer.flush() == 0
+    assert spool_path.exists()
+
+    unavailable.undo()
+    assert buffer.flush() == 1
+    buffer.close()
+    assert stored_keys(db_handler) == [('dev1', row(0)[2])]
@@ -4,15 +4,29 @@ import hmac
 import json
 import hashlib
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin
 from datetime import datetime
 from dotenv import load_dotenv
 from config import Config
+from metrics import REGISTRY
 
 # Load environment variables
 load_dotenv()
 
+# Tuya error codes for an invalid signature or a request timestamp out of range
+CLOCK_ERROR_CODES = {'1004', '1013'}
+
+TUYA_REQUEST_SECONDS = REGISTRY.histogram(
+    'iotsync_tuya_request_seconds', 'Tuya API round trip time', ['call'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+TUYA_RETRIES = REGISTRY.counter(
+    'iotsync_tuya_retries_total', 'Tuya requests repeated after a failure', ['call']
+)
+
 class TuyaClient:
     def __init__(self):
         self.base_url = Config.TUYA_BASE_URL
@@ -21,8 +35,22 @@ class TuyaClient:
         self.device_id = Config.DEVICE_ID
         self.token_info = None
         self.logger = logging.getLogger('IoTsync.tuya')
+        # One token is shared by every device; only one thread refreshes it
+        self._token_lock = threading.Lock()
+        
+        # Keep-alive connections, enough for every concurrent device request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(Config.COLLECTION_CONCURRENCY, 10))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Server clock minus local clock, refreshed periodically or on rejection
+        self.clock_offset_ms = None
+        self.clock_synced_at = None
+        self._clock_lock = threading.Lock()
 
-    def calculate_sign(self, method, path, timestamp, params=None, body=None):
+    def calculate_sign(self, method, path, timestamp, params=None, body=None, token_info=None):
+        """HMAC-SHA256 request signature, over token_info's access token if given."""
         # Create the string to sign
         str_to_sign = [method]
         
@@ -42,26 +70,13 @@ class TuyaClient:
         
         # Prepare the message to sign
         message = self.access_key
-        if self.token_info:
-            message += self.token_info.get('access_token', '')
+        if token_info:
+            message += token_info.get('access_token', '')
         message += str(timestamp) + str_to_hash
         
         # Log signature components in detail
-        self.logger.debug("=== Signature Generation Details ===")
-        self.logger.debug(f"Timestamp (raw): {timestamp}")
-        self.logger.debug(f"Timestamp (human): {datetime.fromtimestamp(timestamp/1000).strftime('%Y-%m-%d %H:%M:%S.%f')}")
-        self.logger.debug(f"Access Key Length: {len(self.access_key)}")
-        if self.token_info:
-            self.logger.debug(f"Access Token Length: {len(self.token_info.get('access_token', ''))}")
-            self.logger.debug(f"Token obtained at: {datetime.fromtimestamp(self.token_info.get('obtained_at', 0)).strftime('%Y-%m-%d %H:%M:%S.%f')}")
-            self.logger.debug(f"Token expire time: {self.token_info.get('expire_time')} seconds")
-        
-        self.logger.debug("\nString to sign components:")
-        for i, component in enumerate(str_to_sign):
-            self.logger.debug(f"{i+1}. {repr(component)}")
-        
-        self.logger.debug("\nFinal message to sign:")
-        self.logger.debug(repr(message))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._log_signature_details(timestamp, str_to_sign, message, token_info)
         
         # Calculate signature
         try:
@@ -71,22 +86,44 @@ class TuyaClient:
                 hashlib.sha256
             ).hexdigest().upper()
             
-            self.logger.debug(f"\nFinal signature: {signature}")
-            self.logger.debug("=== End Signature Generation ===\n")
+            self.logger.debug("Final signature: %s", signature)
             return signature
         except Exception as e:
             self.logger.error("Error during signature generation:", exc_info=True)
             raise
 
-    def request_signed(self, method, path, params=None, body=None):
+    def _log_signature_details(self, timestamp, str_to_sign, message, token_info):
+        self.logger.debug("=== Signature Generation Details ===")
+        self.logger.debug("Timestamp (raw): %s", timestamp)
+        self.logger.debug("Timestamp (human): %s", datetime.fromtimestamp(timestamp/1000).strftime('%Y-%m-%d %H:%M:%S.%f'))
+        self.logger.debug("Access Key Length: %d", len(self.access_key))
+        if token_info:
+            self.logger.debug("Access Token Length: %d", len(token_info.get('access_token', '')))
+            self.logger.debug("Token obtained at: %s", datetime.fromtimestamp(token_info.get('obtained_at', 0)).strftime('%Y-%m-%d %H:%M:%S.%f'))
+            self.logger.debug("Token expire time: %s seconds", token_info.get('expire_time'))
+        
+        self.logger.debug("String to sign components:")
+        for i, component in enumerate(str_to_sign):
+            self.logger.debug("%d. %r", i + 1, component)
+        
+        self.logger.debug("Final message to sign: %r", message)
+
+    def sync_clock(self):
+        """Estimate the offset between the Tuya server clock and ours.
+
+        The server time is taken to correspond to the midpoint of the round
+        trip, which cancels out most of the network latency.
+        """
         # Get server time with retries
         MAX_RETRIES = 3
         RETRY_DELAY = 1  # seconds
-        timestamp = None
         
         for attempt in range(MAX_RETRIES):
             try:
-                time_response = requests.get(f"{self.base_url}/v1.0/time")
+                sent = time.time() * 1000
+                with TUYA_REQUEST_SECONDS.time(call='time_sync'):
+                    time_response = self.session.get(f"{self.base_url}/v1.0/time", timeout=Config.TUYA_REQUEST_TIMEOUT)
+                received = time.time() * 1000
                 time_response.raise_for_status()
                 server_time = time_response.json().get('t')
                 
@@ -99,43 +136,53 @@ class TuyaClient:
                 else:
                     server_time = int(server_time)
                 
-                timestamp = server_time
-                local_time = int(time.time() * 1000)
-                time_diff = abs(local_time - server_time)
+                local_time = (sent + received) / 2
+                self.clock_offset_ms = int(server_time - local_time)
+                self.clock_synced_at = time.monotonic()
                 
-                self.logger.debug(f"\n=== Time Synchronization ===")
-                self.logger.debug(f"Local Time: {local_time}")
-                self.logger.debug(f"Server Time: {server_time}")
-                self.logger.debug(f"Difference: {time_diff}ms")
+                self.logger.debug(
+                    "Time sync: local %d, server %d, offset %dms (round trip %dms)",
+                    local_time, server_time, self.clock_offset_ms, received - sent
+                )
                 
                 # Warn if time difference is significant
-                if time_diff > 5000:  # 5 seconds
-                    self.logger.warning(f"Large time difference detected: {time_diff}ms")
-                
-                break  # Success, exit retry loop
+                if abs(self.clock_offset_ms) > 5000:  # 5 seconds
+                    self.logger.warning(f"Large time difference detected: {self.clock_offset_ms}ms")
+                return self.clock_offset_ms
                 
             except Exception as e:
                 self.logger.warning(f"Server time sync attempt {attempt + 1} failed: {e}")
                 if attempt < MAX_RETRIES - 1:
+                    TUYA_RETRIES.inc(call='time_sync')
                     time.sleep(RETRY_DELAY)
-                else:
-                    self.logger.error("All server time sync attempts failed, using local time")
-                    timestamp = int(time.time() * 1000)
         
-        if timestamp is None:
-            timestamp = int(time.time() * 1000)
+        self.logger.error("All server time sync attempts failed, using local time")
+        if self.clock_offset_ms is None:
+            self.clock_offset_ms = 0
+        # Try again on the next request rather than waiting a full interval
+        self.clock_synced_at = None
+        return self.clock_offset_ms
+
+    def current_timestamp(self, resync=False):
+        """Server time in milliseconds: local time plus the cached offset."""
+        with self._clock_lock:
+            if (resync or self.clock_synced_at is None
+                    or time.monotonic() - self.clock_synced_at > Config.TUYA_CLOCK_SYNC_INTERVAL):
+                self.sync_clock()
+            return int(time.time() * 1000) + self.clock_offset_ms
+
+    def request_signed(self, method, path, params=None, body=None, _resynced=False, call='other'):
+        timestamp = self.current_timestamp()
+        # The token is shared with other collection threads: read it once so a
+        # refresh in between cannot sign with one token and send another
+        token_info = self.token_info
         
         # Log request attempt
-        self.logger.debug(f"\n=== New Request ===")
-        self.logger.debug(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')}")
-        self.logger.debug(f"Method: {method}")
-        self.logger.debug(f"Path: {path}")
-        self.logger.debug(f"Params: {params}")
-        self.logger.debug(f"Body: {body}")
+        self.logger.debug("=== New Request === %s %s params=%s body=%s", method, path, params, body)
         
         # Calculate signature
         try:
-            signature = self.calculate_sign(method, path, timestamp, params, body)
+            signature = self.calculate_sign(method, path, timestamp, params, body, token_info)
         except Exception as e:
             self.logger.error("Failed to calculate signature:", exc_info=True)
             raise
@@ -149,44 +196,50 @@ class TuyaClient:
             'lang': 'en'
         }
         
-        if self.token_info:
-            headers['access_token'] = self.token_info.get('access_token')
-
-        # Log complete request details
-        self.logger.debug("\nRequest Details:")
-        self.logger.debug(f"URL: {urljoin(self.base_url, path.lstrip('/'))}")
-        self.logger.debug("Headers:")
-        for key, value in headers.items():
-            if key in ['client_id', 'access_token']:
-                self.logger.debug(f"{key}: {value[:4]}...{value[-4:]} (length: {len(value)})")
-            else:
-                self.logger.debug(f"{key}: {value}")
+        if token_info:
+            headers['access_token'] = token_info.get('access_token')
 
         # Make request
         url = urljoin(self.base_url, path.lstrip('/'))
+
+        # Log complete request details
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Request URL: %s", url)
+            for key, value in headers.items():
+                if key in ['client_id', 'access_token']:
+                    self.logger.debug("%s: %s...%s (length: %d)", key, value[:4], value[-4:], len(value))
+                else:
+                    self.logger.debug("%s: %s", key, value)
         
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                params=params,
-                json=body,
-                headers=headers
-            )
+            with TUYA_REQUEST_SECONDS.time(call=call):
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    json=body,
+                    headers=headers,
+                    timeout=Config.TUYA_REQUEST_TIMEOUT
+                )
             
             # Log response details
-            self.logger.debug("\nResponse Details:")
-            self.logger.debug(f"Status Code: {response.status_code}")
-            self.logger.debug(f"Response Headers: {dict(response.headers)}")
+            self.logger.debug("Response status: %s", response.status_code)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Response Headers: %s", dict(response.headers))
             
             response.raise_for_status()
             data = response.json()
             
-            self.logger.debug(f"Response Body: {data}")
-            self.logger.debug("=== End Request ===\n")
+            self.logger.debug("Response Body: %s", data)
             
             if data.get('success', False):
                 return data.get('result')
+            elif str(data.get('code')) in CLOCK_ERROR_CODES and not _resynced:
+                # Our cached offset has drifted, resync and sign again once
+                self.logger.warning(f"Request rejected with code {data.get('code')}, resyncing server time")
+                TUYA_RETRIES.inc(call=call)
+                self.current_timestamp(resync=True)
+                return self.request_signed(method, path, params, body, _resynced=True, call=call)
             else:
                 error_msg = f"API Error - Code: {data.get('code')}, Message: {data.get('msg')}"
                 self.logger.error(error_msg)
@@ -201,7 +254,8 @@ class TuyaClient:
         response = self.request_signed(
             'GET',
             '/v1.0/token',
-            params={'grant_type': '1'}
+            params={'grant_type': '1'},
+            call='token'
         )
         # Store when we got the token
         response['obtained_at'] = time.time()
@@ -213,18 +267,36 @@ class TuyaClient:
         
         self.token_info = response
         self.logger.info(f"Token obtained successfully. Expires in {response['expire_time']} seconds")
-        self.logger.debug(f"Token expires at: {datetime.fromtimestamp(response['expires_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Token expires at: %s", datetime.fromtimestamp(response['expires_at']).strftime('%Y-%m-%d %H:%M:%S'))
         return response
 
-    def get_device_info(self):
-        if not self.token_info or self.is_token_expired():
-            self.connect()
-        return self.request_signed('GET', f'/v1.0/devices/{self.device_id}')
+    def ensure_token(self, rejected_token=None):
+        """Make sure a valid token is available, connecting at most once.
 
-    def get_device_status(self):
-        if not self.token_info or self.is_token_expired():
-            self.connect()
-        return self.request_signed('GET', f'/v2.0/cloud/thing/{self.device_id}/shadow/properties')
+        Pass the token a failed request used as rejected_token to force a
+        refresh; if another thread has already replaced it, it is reused
+        instead of being refreshed again.
+        """
+        with self._token_lock:
+            if rejected_token is not None and self.token_info is rejected_token:
+                self.token_info = None
+            if not self.token_info or self.is_token_expired():
+                # The token request must not be signed with the stale token
+                self.token_info = None
+                self.connect()
+            return self.token_info
+
+    def get_device_info(self, device_id=None):
+        self.ensure_token()
+        return self.request_signed('GET', f'/v1.0/devices/{device_id or self.device_id}', call='device_info')
+
+    def get_device_status(self, device_id=None):
+        self.ensure_token()
+        return self.request_signed(
+            'GET', f'/v2.0/cloud/thing/{device_id or self.device_id}/shadow/properties',
+            call='shadow_properties'
+        )
 
     def is_token_expired(self):
         """Check if the current token is expired or about to expire within 30 seconds."""
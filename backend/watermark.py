@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import logging
+import threading
+from config import Config
+
+class IngestionWatermark:
+    """Last time a reading was stored, per device.
+
+    Marking a device is a dict assignment. The map is written to a small
+    JSON file (atomically, and only when it changed) by the watchdog, so
+    after a restart staleness is judged from where we left off without
+    scanning sensor_readings.
+    """
+
+    def __init__(self, path=None, db_handler=None):
+        self.path = path or Config.WATERMARK_FILE
+        self.logger = logging.getLogger('IoTsync.watermark')
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._seen = self._load(db_handler)
+
+    def _load(self, db_handler):
+        try:
+            with open(self.path) as f:
+                return {device_id: float(ts) for device_id, ts in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            self.logger.warning(f"Ignoring unreadable watermark file {self.path}: {e}")
+        # First start: seed once from the database
+        return db_handler.get_last_seen() if db_handler else {}
+
+    def mark(self, device_id, ts=None):
+        with self._lock:
+            self._seen[device_id] = time.time() if ts is None else ts
+            self._dirty = True
+
+    def last_seen(self, device_id):
+        return self._seen.get(device_id)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._seen)
+
+    def persist(self):
+        """Write the watermarks if they changed since the last write."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = dict(self._seen)
+            self._dirty = False
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            self.logger.error(f"Failed to persist watermark: {e}")
+            return False
+        return True
+
+class StalenessWatchdog:
+    """Timer thread that flags devices whose watermark is too old.
+
+    Runs independently of collection, so a device going quiet is noticed
+    even while every Tuya request is failing. Each tick is O(devices)
+    dictionary lookups. on_stale(device_id, last_seen) and
+    on_restored(device_id, last_seen) return True once the alert has been
+    raised; otherwise the watchdog tries again on the next tick.
+    """
+
+    def __init__(self, watermark, device_ids, on_stale, on_restored, max_age=None, interval=None):
+        self.watermark = watermark
+        self.device_ids = list(device_ids)
+        self.on_stale = on_stale
+        self.on_restored = on_restored
+        self.max_age = max_age if max_age is not None else Config.STALE_DATA_MAX_AGE
+        self.interval = interval if interval is not None else Config.WATCHDOG_INTERVAL
+        self.stale = set()
+        self.logger = logging.getLogger('IoTsync.watchdog')
+        self._started_at = time.time()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._started_at = time.time()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='staleness-watchdog', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.watermark.persist()
+
+    def check(self, now=None):
+        """Evaluate every device once."""
+        now = time.time() if now is None else now
+        for device_id in self.device_ids:
+            last_seen = self.watermark.last_seen(device_id)
+            # A device never seen is measured from when we started watching
+            age = now - (last_seen if last_seen is not None else self._started_at)
+            if age >= self.max_age:
+                if device_id not in self.stale and self.on_stale(device_id, last_seen):
+                    self.stale.add(device_id)
+            elif device_id in self.stale:
+                if self.on_restored(device_id, last_seen):
+                    self.stale.discard(device_id)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.check()
+                self.watermark.persist()
+            except Exception as e:
+                self.logger.error(f"Staleness check failed: {e}", exc_info=True)
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from config import Config
+
+class WriteBuffer:
+    """Group commit for sensor readings.
+
+    Rows queued with add() are written by a flusher thread with one
+    executemany in a single transaction, once WRITE_BUFFER_MAX_ROWS are
+    pending or WRITE_BUFFER_MAX_DELAY seconds have passed, so many readings
+    share one commit (and one fsync). If the database is locked or
+    unavailable the batch is appended to an fsync'd JSON-lines spool file
+    and replayed before the next successful flush; replay skips rows that
+    are already stored or spooled twice, so a crash mid-replay does not
+    duplicate readings.
+    """
+
+    def __init__(self, db_handler, max_rows=None, max_delay=None, spool_path=None):
+        self.db_handler = db_handler
+        self.max_rows = max_rows or Config.WRITE_BUFFER_MAX_ROWS
+        self.max_delay = max_delay if max_delay is not None else Config.WRITE_BUFFER_MAX_DELAY
+        self.spool_path = spool_path or Config.WRITE_SPOOL_FILE
+        self.logger = logging.getLogger('IoTsync.db')
+
+        # Metrics
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+        self._thread.start()
+
+    def add(self, row):
+        """Queue a (timestamp_iso, device_id, ts_ms, values) row."""
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) >= self.max_rows:
+                self._cond.notify()
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth(),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'rows_spooled': self.rows_spooled,
+            'spool_pending': self.spool_path.exists(),
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    def flush(self):
+        """Write everything pending now; returns the number of rows committed.
+
+        On return every row added before the call is committed or spooled:
+        the batch is taken under the flush lock, so a flush already in
+        progress on the flusher thread has finished first.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            written = self._replay_spool()
+            if batch:
+                written += self._write(batch)
+            return written
+
+    def _write(self, batch):
+        try:
+            self._commit(batch)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Database unavailable ({e}), spooling {len(batch)} readings")
+            self._spool(batch)
+            return 0
+        return len(batch)
+
+    def _commit(self, rows):
+        started = time.perf_counter()
+        self.db_handler.store_rows(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        self.logger.debug("Flushed %d readings in %.1fms", len(rows), elapsed_ms)
+
+    def _spool(self, batch):
+        with open(self.spool_path, 'a') as f:
+            for row in batch:
+                f.write(json.dumps(row) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows_spooled += len(batch)
+
+    def _replay_spool(self):
+        if not self.spool_path.exists():
+            return 0
+        spooled = {}
+        with open(self.spool_path) as f:
+            for line in f:
+                try:
+                    row = tuple(json.loads(line))
+                except ValueError:
+                    # Torn last line from a crash while spooling
+                    self.logger.warning("Skipping corrupt line in write spool")
+                    continue
+                # A reading is (device_id, ts_ms); keep the first copy of each
+                spooled.setdefault((row[1], row[2]), row)
+        try:
+            stored = self.db_handler.existing_reading_keys(spooled.keys())
+            rows = [row for key, row in spooled.items() if key not in stored]
+            if rows:
+                self._commit(rows)
+        except sqlite3.Error:
+            # Still unavailable, keep the spool for the next flush
+            return 0
+        os.remove(self.spool_path)
+        self.logger.info(f"Replayed {len(rows)} spooled readings")
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.max_rows,
+                    timeout=self.max_delay
+                )
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Write buffer flush failed: {e}", exc_info=True)
+            if stopping:
+                return
+
+    def close(self):
+        """Flush what is pending and stop the flusher thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(10)
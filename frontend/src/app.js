@@ -39,6 +39,35 @@ async function fetchWithDebug(url, options) {
     }
 }
 
+function appendChartPoint(current) {
+    // Add new data point to chart if it exists
+    if (chart && current) {
+        const time = new Date(current.timestamp + 'Z').toLocaleString('en-US', {
+            timeZone: 'America/New_York',
+            month: 'numeric',
+            day: 'numeric',
+            hour: 'numeric',
+            minute: '2-digit',
+            hour12: true
+        });
+        
+        // Only add if it's a new timestamp
+        const lastTimestamp = chart.data.labels[chart.data.labels.length - 1];
+        if (lastTimestamp !== time) {
+            chart.data.labels.push(time);
+            chart.data.datasets[0].data.push(current.temperature_f);
+            
+            // Remove oldest point if we have more than 24 hours of data (assuming 1-minute intervals)
+            if (chart.data.labels.length > 1440) {
+                chart.data.labels.shift();
+                chart.data.datasets[0].data.shift();
+            }
+            
+            chart.update('none'); // Update with minimal animation
+        }
+    }
+}
+
 async function fetchData() {
     console.log('Starting data fetch...');
     try {
@@ -50,33 +79,7 @@ async function fetchData() {
         console.log('Current data fetched successfully');
         updateCurrentTemperature(current);
         updateStats(stats);
-        
-        // Add new data point to chart if it exists
-        if (chart && current) {
-            const time = new Date(current.timestamp + 'Z').toLocaleString('en-US', {
-                timeZone: 'America/New_York',
-                month: 'numeric',
-                day: 'numeric',
-                hour: 'numeric',
-                minute: '2-digit',
-                hour12: true
-            });
-            
-            // Only add if it's a new timestamp
-            const lastTimestamp = chart.data.labels[chart.data.labels.length - 1];
-            if (lastTimestamp !== time) {
-                chart.data.labels.push(time);
-                chart.data.datasets[0].data.push(current.temperature_f);
-                
-                // Remove oldest point if we have more than 24 hours of data (assuming 1-minute intervals)
-                if (chart.data.labels.length > 1440) {
-                    chart.data.labels.shift();
-                    chart.data.datasets[0].data.shift();
-                }
-                
-                chart.update('none'); // Update with minimal animation
-            }
-        }
+        appendChartPoint(current);
     } catch (error) {
         console.error('Error in fetchData:', error);
         document.getElementById('currentTempC').textContent = 'Error';
@@ -85,16 +88,65 @@ async function fetchData() {
     }
 }
 
+// Polling is only the fallback for when the live stream is unavailable
+let pollTimer = null;
+
+function startPolling() {
+    if (pollTimer) return;
+    console.log('Live stream unavailable, polling every minute');
+    fetchData();
+    pollTimer = setInterval(fetchData, 60000);
+}
+
+function stopPolling() {
+    if (!pollTimer) return;
+    clearInterval(pollTimer);
+    pollTimer = null;
+}
+
+function connectStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource(`${API_BASE_URL}/temperature/stream`);
+
+    source.addEventListener('open', () => {
+        console.log('Live reading stream connected');
+        stopPolling();
+    });
+
+    // Each event carries both the current reading and the 24h stats
+    source.addEventListener('reading', (event) => {
+        const reading = JSON.parse(event.data);
+        updateCurrentTemperature(reading);
+        updateStats(reading);
+        appendChartPoint(reading);
+    });
+
+    source.addEventListener('error', () => {
+        console.warn('Live reading stream error');
+        startPolling();
+        // EventSource reconnects by itself unless the server refused the stream
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(connectStream, 60000);
+        }
+    });
+}
+
 async function fetchChartData(range = 'day') {
     try {
+        // No point drawing more samples than the chart has pixels
+        const points = Math.max(100, Math.round(document.getElementById('tempChart').clientWidth));
         const [history, alerts, stats] = await Promise.all([
-            fetchWithDebug(`${API_BASE_URL}/temperature/history?timerange=${range}`, fetchOptions),
+            fetchWithDebug(`${API_BASE_URL}/temperature/history?timerange=${range}&points=${points}&format=columnar`, fetchOptions),
             fetchWithDebug(`${API_BASE_URL}/alerts/recent`, fetchOptions),
             fetchWithDebug(`${API_BASE_URL}/temperature/stats`, fetchOptions)
         ]);
         
         console.log('Chart data fetched successfully');
-        initializeChart(history, stats.alert_threshold);
+        initializeChart(decodeColumnarHistory(history), stats.alert_threshold);
         updateAlerts(alerts);
         updateStats(stats);
     } catch (error) {
@@ -102,6 +154,21 @@ async function fetchChartData(range = 'day') {
     }
 }
 
+// Expand a format=columnar history response into epoch-ms times and °F values
+function decodeColumnarHistory(history) {
+    const times = new Array(history.n);
+    const temperaturesF = new Array(history.n);
+    let t = history.t0;
+    for (let i = 0; i < history.n; i++) {
+        if (i > 0) {
+            t += (history.step !== undefined ? history.step : history.dt[i - 1]) * history.unit;
+        }
+        times[i] = t;
+        temperaturesF[i] = Math.round((history.temperature[i] / history.scale * 9 / 5 + 32) * 100) / 100;
+    }
+    return { times, temperaturesF };
+}
+
 function initializeChart(data, alertThreshold) {
     const ctx = document.getElementById('tempChart').getContext('2d');
     
@@ -112,8 +179,8 @@ function initializeChart(data, alertThreshold) {
     const chartConfig = {
         type: 'line',
         data: {
-            labels: data.map(d => {
-                const utcDate = new Date(d.time + 'Z'); // Ensure UTC parsing
+            labels: data.times.map(t => {
+                const utcDate = new Date(t);
                 return utcDate.toLocaleString('en-US', {
                     timeZone: 'America/New_York',
                     month: 'numeric',
@@ -125,7 +192,7 @@ function initializeChart(data, alertThreshold) {
             }),
             datasets: [{
                 label: 'Temperature (°F)',
-                data: data.map(d => d.temperature_f),
+                data: data.temperaturesF,
                 borderColor: '#2563eb',
                 tension: 0.4,
                 pointRadius: 0,
@@ -247,8 +314,8 @@ document.querySelectorAll('.chart-controls button').forEach(button => {
 fetchData();
 fetchChartData();
 
-// Update current temperature and stats every minute
-setInterval(fetchData, 60000);
+// Receive new readings as they are stored, falling back to polling
+connectStream();
 
 // Only fetch full chart data when changing time ranges
 // Remove the 5-minute interval for chart updates since we're updating incrementally 
\ No newline at end of file
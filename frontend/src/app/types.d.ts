@@ -10,12 +10,25 @@ interface TemperatureData {
   temperature_f: number;
 }
 
+// /api/temperature/history?format=columnar
+interface ColumnarHistory {
+  format: 'columnar';
+  n: number;
+  t0: number | null;
+  unit: number;
+  step?: number;
+  dt?: number[];
+  scale: number;
+  temperature: number[];
+}
+
 interface Alert {
   id: number;
   timestamp: string;
   type: string;
-  temperature: number;
-  threshold: number;
+  /** null for alerts not about a reading, e.g. stale data */
+  temperature: number | null;
+  threshold: number | null;
   message: string;
 }
 
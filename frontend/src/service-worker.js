@@ -1,4 +1,12 @@
 const CACHE_NAME = 'iotsync-v1';
+const API_CACHE_NAME = 'iotsync-api-v2';
+// Small dashboard reads worth keeping for offline use; anything else under
+// /api/ (the live stream, multi-megabyte exports) goes straight to the network
+const API_CACHED_PATHS = [
+  '/api/temperature/current',
+  '/api/temperature/stats',
+  '/api/temperature/history'
+];
 const ASSETS_TO_CACHE = [
   '/',
   '/index.html',
@@ -22,7 +30,41 @@ self.addEventListener('install', (event) => {
   );
 });
 
+// Drop API caches from earlier versions, which could hold export downloads
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys().then((names) => Promise.all(
+      names
+        .filter((name) => name.startsWith('iotsync-api-') && name !== API_CACHE_NAME)
+        .map((name) => caches.delete(name))
+    ))
+  );
+});
+
 self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+
+  if (url.pathname.startsWith('/api/') && !API_CACHED_PATHS.includes(url.pathname)) {
+    return;
+  }
+
+  // Dashboard reads: always revalidate with the server (ETag / 304 via the
+  // HTTP cache) and keep the last good response for when the network is down.
+  if (event.request.method === 'GET' && url.pathname.startsWith('/api/')) {
+    event.respondWith(
+      fetch(event.request)
+        .then((response) => {
+          if (response.ok) {
+            const copy = response.clone();
+            caches.open(API_CACHE_NAME).then((cache) => cache.put(event.request, copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match(event.request))
+    );
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then((response) => response || fetch(event.request))